@@ -0,0 +1,535 @@
+import io
+import os
+import json
+import math
+import base64
+import asyncio
+import logging
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from events import EventType, ProgressEvent
+from progress_store import LRUCache
+
+try:
+    from matplotlib.figure import Figure
+except ImportError:  # matplotlib - необязательная зависимость, без нее статистика только текстом
+    Figure = None
+
+logger = logging.getLogger(__name__)
+
+# События, которые считаются по интервалам; все они же отмечают пользователя активным
+TRACKED_EVENTS = (
+    EventType.USER_REGISTERED,
+    EventType.LESSON_VIEWED,
+    EventType.LESSON_COMPLETED,
+    EventType.ASSIGNMENT_SUBMITTED,
+    EventType.ASSIGNMENT_CHECKED,
+)
+_SERIES = {event_type: index for index, event_type in enumerate(TRACKED_EVENTS)}
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+# ========== КОЛЬЦЕВЫЕ БУФЕРЫ ==========
+
+class RingCounter:
+    """Счетчики событий по интервалам фиксированной ширины в кольцевом буфере
+
+    Ячейка хранит номер своего интервала: устаревшая ячейка обнуляется при
+    первой записи в новый интервал, поэтому память - slots x series
+    счетчиков при любом потоке событий, а запись стоит O(1).
+    """
+
+    def __init__(self, width: int, slots: int, series: int):
+        self.width = width
+        self.slots = slots
+        self.series = series
+        self._epochs = array("q", [-1]) * slots
+        self._counts = array("q", [0]) * (slots * series)
+
+    def add(self, timestamp: float, series: int, count: int = 1):
+        epoch = int(timestamp // self.width)
+        slot = epoch % self.slots
+        if self._epochs[slot] != epoch:
+            if self._epochs[slot] > epoch:
+                # Событие старше горизонта буфера
+                return
+            self._epochs[slot] = epoch
+            start = slot * self.series
+            self._counts[start:start + self.series] = array("q", [0]) * self.series
+        self._counts[slot * self.series + series] += count
+
+    def points(self, series: int, now: float, count: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(начало интервала, число событий) за последние count интервалов, от старых к новым"""
+        last = int(now // self.width)
+        count = min(count or self.slots, self.slots)
+        result = []
+        for epoch in range(last - count + 1, last + 1):
+            slot = epoch % self.slots
+            value = self._counts[slot * self.series + series] if self._epochs[slot] == epoch else 0
+            result.append((epoch * self.width, value))
+        return result
+
+    def merge(self, other: "RingCounter"):
+        """Добавить счетчики другого буфера той же формы (другого воркера)"""
+        for slot in range(self.slots):
+            epoch = other._epochs[slot]
+            if epoch < 0 or epoch < self._epochs[slot]:
+                continue
+            start = slot * self.series
+            if epoch > self._epochs[slot]:
+                self._epochs[slot] = epoch
+                self._counts[start:start + self.series] = other._counts[start:start + self.series]
+            else:
+                for index in range(start, start + self.series):
+                    self._counts[index] += other._counts[index]
+
+    def nbytes(self) -> int:
+        return (len(self._epochs) + len(self._counts)) * self._counts.itemsize
+
+    def dump(self) -> dict:
+        return {"epochs": list(self._epochs), "counts": list(self._counts)}
+
+    def restore(self, state: dict):
+        if len(state["epochs"]) == self.slots and len(state["counts"]) == self.slots * self.series:
+            self._epochs = array("q", state["epochs"])
+            self._counts = array("q", state["counts"])
+
+def _mix64(value: int) -> int:
+    """Перемешивание splitmix64: близкие user_id дают независимые хеши"""
+    value = (value + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return value ^ (value >> 31)
+
+class HyperLogLog:
+    """Оценка числа уникальных пользователей в 2^precision байт (ошибка ~1.04/sqrt(2^precision))"""
+
+    def __init__(self, precision: int = 11):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: int):
+        hashed = _mix64(value)
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Малые значения: линейный подсчет по пустым регистрам точнее
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+class DailyUniques:
+    """Уникальные активные пользователи по дням: кольцо из days HyperLogLog"""
+
+    def __init__(self, days: int, precision: int = 11):
+        self.days = days
+        self.precision = precision
+        self._epochs = array("q", [-1]) * days
+        self._sketches = [HyperLogLog(precision) for _ in range(days)]
+
+    def add(self, timestamp: float, user_id: int):
+        epoch = int(timestamp // DAY)
+        slot = epoch % self.days
+        if self._epochs[slot] != epoch:
+            if self._epochs[slot] > epoch:
+                return
+            self._epochs[slot] = epoch
+            self._sketches[slot] = HyperLogLog(self.precision)
+        self._sketches[slot].add(user_id)
+
+    def _sketch(self, epoch: int) -> Optional[HyperLogLog]:
+        slot = epoch % self.days
+        return self._sketches[slot] if self._epochs[slot] == epoch else None
+
+    def daily(self, now: float, count: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(начало дня, DAU) за последние count дней"""
+        last = int(now // DAY)
+        count = min(count or self.days, self.days)
+        result = []
+        for epoch in range(last - count + 1, last + 1):
+            sketch = self._sketch(epoch)
+            result.append((epoch * DAY, sketch.count() if sketch else 0))
+        return result
+
+    def window(self, now: float, days: int) -> int:
+        """Уникальные пользователи за последние days дней (объединение скетчей)"""
+        last = int(now // DAY)
+        union = HyperLogLog(self.precision)
+        for epoch in range(last - min(days, self.days) + 1, last + 1):
+            sketch = self._sketch(epoch)
+            if sketch is not None:
+                union.merge(sketch)
+        return union.count()
+
+    def merge(self, other: "DailyUniques"):
+        """Объединить с кольцом другого воркера: один пользователь учитывается один раз"""
+        for slot in range(self.days):
+            epoch = other._epochs[slot]
+            if epoch < 0 or epoch < self._epochs[slot]:
+                continue
+            if epoch > self._epochs[slot]:
+                self._epochs[slot] = epoch
+                self._sketches[slot] = HyperLogLog(self.precision)
+            self._sketches[slot].merge(other._sketches[slot])
+
+    def nbytes(self) -> int:
+        return len(self._epochs) * self._epochs.itemsize + self.days * (1 << self.precision)
+
+    def dump(self) -> dict:
+        return {
+            "epochs": list(self._epochs),
+            "registers": [base64.b64encode(bytes(sketch.registers)).decode("ascii") for sketch in self._sketches],
+        }
+
+    def restore(self, state: dict):
+        if len(state["epochs"]) != self.days:
+            return
+        self._epochs = array("q", state["epochs"])
+        for sketch, registers in zip(self._sketches, state["registers"]):
+            registers = base64.b64decode(registers)
+            if len(registers) == len(sketch.registers):
+                sketch.registers = bytearray(registers)
+
+class DurationHistogram:
+    """Гистограмма длительностей с логарифмическими корзинами: медиана и процентили без хранения значений"""
+
+    # Границы корзин: 10 с, 20 с, 40 с, ... ~30 дней; последняя корзина - все, что дольше
+    FIRST_EDGE = 10.0
+    BUCKETS = 20
+
+    def __init__(self):
+        self.counts = array("q", [0]) * self.BUCKETS
+        self.total = 0
+
+    def merge(self, other: "DurationHistogram"):
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+        self.total += other.total
+
+    def add(self, seconds: float):
+        bucket = 0
+        edge = self.FIRST_EDGE
+        while seconds >= edge and bucket < self.BUCKETS - 1:
+            bucket += 1
+            edge *= 2
+        self.counts[bucket] += 1
+        self.total += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля: геометрическая интерполяция внутри корзины"""
+        if not self.total:
+            return None
+        target = q * self.total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            if count and seen + count >= target:
+                low = self.FIRST_EDGE * 2 ** (bucket - 1) if bucket else self.FIRST_EDGE / 2
+                return low * 2 ** ((target - seen) / count)
+            seen += count
+        return self.FIRST_EDGE * 2 ** (self.BUCKETS - 1)
+
+# ========== АКТИВНОСТЬ КУРСА ==========
+
+class ActivityTracker:
+    """Активность курса по событиям прогресса в памяти фиксированного размера
+
+    Подписчик шины событий: считает события по минутам (последние сутки),
+    часам (две недели) и дням (days дней), уникальных активных
+    пользователей по дням (HyperLogLog) и время от первого просмотра урока
+    до его прохождения (гистограмма на урок). Первые просмотры, ждущие
+    прохождения, хранятся в LRU на pending_views записей: у вытесненных
+    длительность просто не учитывается. Состояние можно сохранить в файл
+    и восстановить после перезапуска.
+    """
+
+    def __init__(self, days: int = 90, pending_views: int = 50000, max_lessons: int = 64):
+        self.minutes = RingCounter(MINUTE, 24 * 60, len(TRACKED_EVENTS))
+        self.hours = RingCounter(HOUR, 14 * 24, len(TRACKED_EVENTS))
+        self.days = RingCounter(DAY, days, len(TRACKED_EVENTS))
+        self.active = DailyUniques(days)
+        self.max_lessons = max_lessons
+        self.durations: Dict[int, DurationHistogram] = {}
+        self._views = LRUCache(pending_views)
+        self._path: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.recorded = 0
+
+    def record(self, event: ProgressEvent):
+        """Учесть событие прогресса"""
+        series = _SERIES.get(event.type)
+        if series is None:
+            return
+        for counter in (self.minutes, self.hours, self.days):
+            counter.add(event.timestamp, series)
+        self.active.add(event.timestamp, event.user_id)
+        self.recorded += 1
+
+        if event.type == EventType.LESSON_VIEWED:
+            key = (event.user_id, event.lesson_id)
+            # Важен первый просмотр: повторные только освежают запись в LRU
+            if self._views.get(key) is None:
+                self._views.put(key, event.timestamp)
+        elif event.type == EventType.LESSON_COMPLETED and 0 < event.lesson_id <= self.max_lessons:
+            viewed_at = self._views.pop((event.user_id, event.lesson_id))
+            if viewed_at is not None:
+                histogram = self.durations.setdefault(event.lesson_id, DurationHistogram())
+                histogram.add(max(0.0, event.timestamp - viewed_at))
+
+    def snapshot(self, now: float, hours: int = 48, days: int = 30) -> dict:
+        """Данные для отчета и графиков: копия, которую можно отдать в другой поток"""
+        series = {
+            event_type.value: {
+                "minutes": self.minutes.points(index, now, 60),
+                "hours": self.hours.points(index, now, hours),
+                "days": self.days.points(index, now, days),
+            }
+            for event_type, index in _SERIES.items()
+        }
+        return {
+            "now": now,
+            "series": series,
+            "dau": self.active.daily(now, days),
+            "wau": self.active.window(now, 7),
+            "mau": self.active.window(now, 30),
+            "time_to_complete": {
+                lesson_id: {
+                    "median": histogram.quantile(0.5),
+                    "p90": histogram.quantile(0.9),
+                    "count": histogram.total,
+                }
+                for lesson_id, histogram in sorted(self.durations.items())
+            },
+        }
+
+    def dump(self) -> dict:
+        return {
+            "minutes": self.minutes.dump(),
+            "hours": self.hours.dump(),
+            "days": self.days.dump(),
+            "active": self.active.dump(),
+            "durations": {str(lesson_id): list(histogram.counts) for lesson_id, histogram in self.durations.items()},
+        }
+
+    def restore(self, state: dict):
+        self.minutes.restore(state["minutes"])
+        self.hours.restore(state["hours"])
+        self.days.restore(state["days"])
+        self.active.restore(state["active"])
+        for lesson_id, counts in state["durations"].items():
+            if len(counts) == DurationHistogram.BUCKETS:
+                histogram = self.durations.setdefault(int(lesson_id), DurationHistogram())
+                histogram.counts = array("q", counts)
+                histogram.total = sum(counts)
+
+    def save(self, path: str, state: Optional[dict] = None):
+        """Сохранить состояние; state - снятый заранее dump(), если запись идет в другом потоке"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл и атомарно подменяем
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state if state is not None else self.dump(), f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.restore(json.load(f))
+            return True
+        except FileNotFoundError:
+            return False
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Не удалось восстановить статистику активности из {path}: {e}")
+            return False
+
+    async def _save(self):
+        # Снимок - в event loop, где меняются счетчики; запись файла - в потоке
+        await asyncio.to_thread(self.save, self._path, self.dump())
+
+    async def _loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._save()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить статистику активности: {e}")
+
+    async def start(self, path: str, interval: float):
+        """Восстановить состояние из path и сохранять его раз в interval секунд"""
+        self._path = path
+        if await asyncio.to_thread(self.load, path):
+            logger.info(f"Статистика активности восстановлена из {path}")
+        if interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(interval))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._path is not None:
+            await self._save()
+
+    def merge(self, other: "ActivityTracker"):
+        """Добавить статистику другого воркера"""
+        self.minutes.merge(other.minutes)
+        self.hours.merge(other.hours)
+        self.days.merge(other.days)
+        self.active.merge(other.active)
+        for lesson_id, histogram in other.durations.items():
+            self.durations.setdefault(lesson_id, DurationHistogram()).merge(histogram)
+
+    @classmethod
+    def from_directory(cls, directory: str, days: int = 90) -> "ActivityTracker":
+        """Статистика всех воркеров из сохраненных ими файлов (для процесса админки)"""
+        merged = cls(days=days)
+        try:
+            names = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+        except FileNotFoundError:
+            return merged
+        for name in names:
+            tracker = cls(days=days)
+            if tracker.load(os.path.join(directory, name)):
+                merged.merge(tracker)
+        return merged
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "recorded": self.recorded,
+            "pending_views": len(self._views),
+            "memory_bytes": self.minutes.nbytes() + self.hours.nbytes() + self.days.nbytes() + self.active.nbytes(),
+        }
+
+# ========== ОТЧЕТ ==========
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    if seconds < HOUR:
+        return f"{seconds / MINUTE:.0f} мин"
+    if seconds < DAY:
+        return f"{seconds / HOUR:.1f} ч"
+    return f"{seconds / DAY:.1f} дн"
+
+_SPARK = "▁▂▃▄▅▆▇█"
+
+def sparkline(values: List[int]) -> str:
+    top = max(values, default=0)
+    if not top:
+        return _SPARK[0] * len(values)
+    return "".join(_SPARK[min(len(_SPARK) - 1, value * len(_SPARK) // (top + 1))] for value in values)
+
+def funnel_dropoff(funnel: List[dict]) -> List[dict]:
+    """Отток по урокам: доля дошедших до урока N, но не дошедших до N+1"""
+    result = []
+    for index, row in enumerate(funnel):
+        following = funnel[index + 1]["reached"] if index + 1 < len(funnel) else row["completed"]
+        dropped = max(0, row["reached"] - following)
+        result.append({
+            "lesson_id": row["lesson_id"],
+            "reached": row["reached"],
+            "dropped": dropped,
+            "dropoff_percent": dropped * 100 / row["reached"] if row["reached"] else 0.0,
+        })
+    return result
+
+def format_report(snapshot: dict, funnel: List[dict]) -> str:
+    """Текст детальной статистики (без разметки)"""
+    series = snapshot["series"]
+    lines = ["📊 Детальная статистика", ""]
+    dau = [value for _, value in snapshot["dau"]]
+    lines.append(f"👥 Активные: сегодня {dau[-1] if dau else 0}, за 7 дней {snapshot['wau']}, за 30 дней {snapshot['mau']}")
+    lines.append(f"DAU за {len(dau)} дн: {sparkline(dau)}")
+    lines.append("")
+    titles = {
+        EventType.LESSON_VIEWED.value: "Просмотры уроков",
+        EventType.LESSON_COMPLETED.value: "Пройдено уроков",
+        EventType.ASSIGNMENT_SUBMITTED.value: "Сдано заданий",
+        EventType.USER_REGISTERED.value: "Новые пользователи",
+    }
+    lines.append("За последний час / сутки / 30 дней:")
+    for event_type, title in titles.items():
+        points = series[event_type]
+        hour = sum(value for _, value in points["minutes"])
+        day = sum(value for _, value in points["hours"][-24:])
+        month = sum(value for _, value in points["days"])
+        lines.append(f"• {title}: {hour} / {day} / {month}  {sparkline([value for _, value in points['hours']])}")
+    if funnel:
+        lines.append("")
+        lines.append("📉 Отток по урокам (дошли → ушли):")
+        for row in funnel_dropoff(funnel):
+            lines.append(f"Урок {row['lesson_id']}: {row['reached']} → {row['dropped']} ({row['dropoff_percent']:.1f}%)")
+    if snapshot["time_to_complete"]:
+        lines.append("")
+        lines.append("⏱ От первого просмотра до прохождения (медиана / 90%):")
+        for lesson_id, stats in snapshot["time_to_complete"].items():
+            lines.append(
+                f"Урок {lesson_id}: {format_duration(stats['median'])} / {format_duration(stats['p90'])} "
+                f"({stats['count']})"
+            )
+    return "\n".join(lines)
+
+def render_charts(snapshot: dict, funnel: List[dict]) -> Optional[bytes]:
+    """PNG с графиками активности; None без matplotlib
+
+    Синхронная и занимает до секунды: вызывать в отдельном потоке. Figure
+    создается напрямую, без pyplot и его глобального состояния.
+    """
+    if Figure is None:
+        return None
+    from datetime import datetime, timezone
+
+    figure = Figure(figsize=(10, 8), dpi=100)
+    axes = figure.subplots(2, 2)
+
+    dau = snapshot["dau"]
+    axes[0][0].bar([datetime.fromtimestamp(ts, timezone.utc) for ts, _ in dau], [value for _, value in dau], width=0.8)
+    axes[0][0].set_title("Активные пользователи по дням (DAU)")
+    axes[0][0].tick_params(axis="x", labelrotation=45)
+
+    hours = snapshot["series"]
+    for event_type, title in (
+        (EventType.LESSON_VIEWED.value, "просмотры"),
+        (EventType.LESSON_COMPLETED.value, "прохождения"),
+        (EventType.ASSIGNMENT_SUBMITTED.value, "задания"),
+    ):
+        points = hours[event_type]["hours"]
+        axes[0][1].plot([datetime.fromtimestamp(ts, timezone.utc) for ts, _ in points],
+                        [value for _, value in points], label=title)
+    axes[0][1].set_title("События по часам")
+    axes[0][1].legend()
+    axes[0][1].tick_params(axis="x", labelrotation=45)
+
+    dropoff = funnel_dropoff(funnel)
+    axes[1][0].bar([str(row["lesson_id"]) for row in dropoff], [row["dropoff_percent"] for row in dropoff])
+    axes[1][0].set_title("Отток после урока, %")
+
+    durations = snapshot["time_to_complete"]
+    axes[1][1].bar([str(lesson_id) for lesson_id in durations],
+                   [(stats["median"] or 0) / HOUR for stats in durations.values()])
+    axes[1][1].set_title("Медиана времени до прохождения, ч")
+
+    figure.tight_layout()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
@@ -1,6 +1,15 @@
 import os
 import json
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+import time
+import shutil
+import asyncio
+import logging
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+from telegram import Bot, Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import BadRequest, Forbidden
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -9,14 +18,144 @@ from telegram.ext import (
     filters,
     ContextTypes
 )
-from course_bot import user_progress_db, LESSONS, UserProgress
+from broadcast import DEFAULT_GLOBAL_RATE, PAID_GLOBAL_RATE, BroadcastCheckpoint, BroadcastEngine
+from export import export_course, export_formats
+from activity import ActivityTracker, format_report, render_charts
+from answer_store import AnswerStore
+from content import CourseCatalog, Course
+from progress_reader import open_progress_reader
+from review_queue import ReviewQueue
+from tenants import load_tenants_file
+from models import USER_ID_MASK, UserProgress, UserStatus, split_user_key
+
+logger = logging.getLogger(__name__)
+
+# Общие файлы бота (пути - те же переменные окружения, что у bot.py). Админка
+# работает отдельным процессом: прогресс, ответы и статистику только читает,
+# в общую очередь проверки пишет, а отметки о проверке применяет бот
+DATA_DIR = os.getenv("DATA_DIR", "data")
+PROGRESS_DB_PATH = os.getenv("PROGRESS_DB_PATH", os.path.join(DATA_DIR, "progress.sqlite3"))
+# Бэкенд прогресса бота: sqlite и sqlite-cached читаются из базы, eventlog -
+# из журналов воркеров (подкаталоги worker-N в EVENT_LOG_ROOT), которые
+# админка перечитывает раз в EVENT_LOG_REFRESH_INTERVAL секунд
+PROGRESS_BACKEND = os.getenv("PROGRESS_BACKEND", "sqlite")
+EVENT_LOG_ROOT = os.getenv("EVENT_LOG_ROOT", os.path.join(DATA_DIR, "eventlog"))
+EVENT_LOG_REFRESH_INTERVAL = float(os.getenv("EVENT_LOG_REFRESH_INTERVAL", "1"))
+REVIEW_DB_PATH = os.getenv("REVIEW_DB_PATH", os.path.join(DATA_DIR, "review_queue.sqlite3"))
+ANSWER_STORE_DIR = os.getenv("ANSWER_STORE_DIR", os.path.join(DATA_DIR, "answers"))
+ACTIVITY_DIR = os.path.dirname(os.getenv("ACTIVITY_PATH", os.path.join(DATA_DIR, "activity", "worker-0.json")))
+ACTIVITY_DAYS = int(os.getenv("ACTIVITY_DAYS", "90"))
+CONTENT_DIR = os.getenv("CONTENT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "content"))
+COURSE_ID = os.getenv("COURSE_ID") or None
+# Боты-арендаторы (тот же файл, что у bot.py): их задания тоже приходят в
+# очередь проверки, и уведомление о проверке отправляет бот арендатора
+TENANTS_FILE = os.getenv("TENANTS_FILE")
+
+BROADCAST_CHECKPOINT_PATH = os.getenv(
+    "BROADCAST_CHECKPOINT_PATH", os.path.join(DATA_DIR, "broadcast.json")
+)
+# Скорость рассылки, сообщений в секунду. В бесплатном лимите Telegram
+# (около 30 в секунду) при 25 рассылка на 100 тыс. пользователей идет
+# около 67 минут. BROADCAST_PAID=1 включает платные рассылки: по умолчанию
+# 1000 в секунду, те же 100 тыс. - около 2 минут, сообщения сверх 30 в
+# секунду оплачиваются звездами бота
+BROADCAST_PAID = os.getenv("BROADCAST_PAID", "0") == "1"
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE") or (PAID_GLOBAL_RATE if BROADCAST_PAID else DEFAULT_GLOBAL_RATE))
+# Одновременных отправок: при 1000 в секунду и ответе API за ~0.1 с нужно больше сотни
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "128" if BROADCAST_PAID else "16"))
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "50"))
+REVIEW_LEASE_SECONDS = float(os.getenv("REVIEW_LEASE_SECONDS", "600"))
+REVIEW_PREVIEW_SIZE = int(os.getenv("REVIEW_PREVIEW_SIZE", "5"))
+
+# Выгрузка: строк в пачке записи и предельный размер части файла (лимит Telegram - 50 МБ)
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+EXPORT_MAX_PART_MB = float(os.getenv("EXPORT_MAX_PART_MB", "45"))
+EXPORT_DIR = os.getenv("EXPORT_DIR") or None
+
+user_progress_db = open_progress_reader(
+    PROGRESS_BACKEND, PROGRESS_DB_PATH, EVENT_LOG_ROOT, EVENT_LOG_REFRESH_INTERVAL
+)
+review_queue = ReviewQueue(REVIEW_DB_PATH)
+answer_store = AnswerStore(ANSWER_STORE_DIR)
+course_catalog = CourseCatalog(CONTENT_DIR, default_course=COURSE_ID)
+course_catalog.load()
+
+def current_course() -> Course:
+    """Курс основного бота"""
+    return course_catalog.course(None)
+
+@dataclass
+class ReviewTenant:
+    """Бот, чьи задания проверяет админка: его курс и бот для уведомлений"""
+    id: str
+    course_id: Optional[str] = None
+    # None - основной бот, от имени которого работает админка
+    bot: Optional[Bot] = None
+
+    def course(self) -> Optional[Course]:
+        return course_catalog.courses().get(self.course_id or course_catalog.default_course)
+
+def load_review_tenants() -> Dict[int, ReviewTenant]:
+    """Арендаторы по номеру пространства ключей; 0 - основной бот"""
+    result = {0: ReviewTenant("default", COURSE_ID)}
+    if TENANTS_FILE:
+        for entry in load_tenants_file(TENANTS_FILE):
+            course_catalog.require(entry.get("course"))
+            result[entry["namespace"]] = ReviewTenant(entry["id"], entry.get("course"), Bot(entry["token"]))
+    return result
+
+review_tenants = load_review_tenants()
+
+async def load_answer(progress: UserProgress, lesson_id: int) -> str:
+    """Полный текст ответа: из хранилища ответов или из самой записи"""
+    ref = progress.answer_ref(lesson_id)
+    if ref is None:
+        return progress.submitted_assignments.get(lesson_id, "")
+    return await answer_store.get(ref)
+
+def read_answer(progress: UserProgress, lesson_id: int) -> str:
+    """То же, что load_answer, но синхронно - для выгрузок в отдельном потоке"""
+    ref = progress.answer_ref(lesson_id)
+    if ref is None:
+        return progress.submitted_assignments.get(lesson_id, "")
+    return answer_store.read(ref.handle)
+
+# Короткие коды фильтра статуса для callback_data (не длиннее 64 байт)
+STATUS_FILTERS = {
+    "n": (UserStatus.NOT_STARTED, "Не начали"),
+    "i": (UserStatus.IN_PROGRESS, "В процессе"),
+    "c": (UserStatus.COMPLETED, "Завершили"),
+}
 
 class AdminBot:
     def __init__(self, token: str, admin_ids: list):
-        self.application = Application.builder().token(token).build()
+        self.application = (
+            Application.builder().token(token)
+            .post_init(self.on_startup)
+            .post_shutdown(self.on_shutdown)
+            .build()
+        )
         self.admin_ids = admin_ids
+        self.broadcast_task = None
+        self.export_task = None
         self.setup_handlers()
     
+    async def on_startup(self, application: Application):
+        """Открыть общие файлы бота"""
+        await user_progress_db.start()
+        await review_queue.start()
+        for tenant in review_tenants.values():
+            if tenant.bot is not None:
+                await tenant.bot.initialize()
+    
+    async def on_shutdown(self, application: Application):
+        for tenant in review_tenants.values():
+            if tenant.bot is not None:
+                await tenant.bot.shutdown()
+        await review_queue.close()
+        await user_progress_db.close()
+        await answer_store.close()
+    
     async def check_admin(self, update: Update) -> bool:
         """Проверка прав администратора"""
         return update.effective_user.id in self.admin_ids
@@ -33,7 +172,7 @@ class AdminBot:
             await update.message.reply_text("⛔ Доступ запрещен")
             return
         
-        stats = self.get_stats()
+        stats = await self.get_stats()
         
         message = f"""
 👑 *Панель администратора*
@@ -44,7 +183,7 @@ class AdminBot:
 • Завершивших: {stats['completed_users']}
 
 📚 **Прогресс по урокам:**
-{self.format_lesson_stats(stats['lesson_stats'])}
+{self.format_lesson_stats(stats['lesson_stats'], stats['total_users'])}
 
 📝 **Задания:**
 • Сдано: {stats['submitted_assignments']}
@@ -55,7 +194,8 @@ class AdminBot:
             [InlineKeyboardButton("👥 Список пользователей", callback_data="admin_users")],
             [InlineKeyboardButton("📊 Детальная статистика", callback_data="admin_stats")],
             [InlineKeyboardButton("📝 Проверить задания", callback_data="admin_check")],
-            [InlineKeyboardButton("📢 Рассылка", callback_data="admin_broadcast")]
+            [InlineKeyboardButton("📢 Рассылка", callback_data="admin_broadcast")],
+            [InlineKeyboardButton("📤 Выгрузка", callback_data="admin_export")]
         ]
         
         await update.message.reply_text(
@@ -64,40 +204,44 @@ class AdminBot:
             parse_mode='Markdown'
         )
     
-    def get_stats(self) -> dict:
+    async def get_stats(self) -> dict:
         """Получить статистику"""
-        stats = {
-            'total_users': len(user_progress_db),
-            'active_users': 0,
-            'completed_users': 0,
-            'lesson_stats': {},
-            'submitted_assignments': 0,
-            'checked_assignments': 0
-        }
-        
-        for progress in user_progress_db.values():
-            if progress.status.value == 'in_progress':
-                stats['active_users'] += 1
-            elif progress.status.value == 'completed':
-                stats['completed_users'] += 1
-            
-            stats['submitted_assignments'] += len(progress.submitted_assignments)
-            stats['checked_assignments'] += sum(1 for checked in progress.checked_assignments.values() if checked)
-            
-            for lesson_id in progress.completed_lessons:
-                stats['lesson_stats'][lesson_id] = stats['lesson_stats'].get(lesson_id, 0) + 1
-        
-        return stats
+        # Агрегаты считает SQLite над срезом базы, в потоке админки
+        return await user_progress_db.query(lambda view: view.stats(namespace=0))
     
-    def format_lesson_stats(self, lesson_stats: dict) -> str:
+    def format_lesson_stats(self, lesson_stats: dict, total_users: int) -> str:
         """Форматировать статистику по урокам"""
         result = []
-        for i in range(1, len(LESSONS) + 1):
+        for i in range(1, current_course().total + 1):
             count = lesson_stats.get(i, 0)
-            percentage = (count / len(user_progress_db) * 100) if user_progress_db else 0
+            percentage = (count / total_users * 100) if total_users else 0
             result.append(f"Урок {i}: {count} ({percentage:.1f}%)")
         return "\n".join(result)
     
+    async def get_funnel(self) -> list:
+        """Воронка по урокам основного бота"""
+        total_lessons = current_course().total
+        return await user_progress_db.query(lambda view: view.funnel(total_lessons, namespace=0))
+    
+    async def show_detailed_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Детальная статистика: активность по времени, отток по урокам, время прохождения"""
+        # Статистику активности ведут воркеры бота и сохраняют в файлы; здесь она собирается из них
+        activity = await asyncio.to_thread(ActivityTracker.from_directory, ACTIVITY_DIR, ACTIVITY_DAYS)
+        snapshot = activity.snapshot(time.time())
+        funnel = await self.get_funnel()
+        keyboard = [[InlineKeyboardButton("⬅️ Назад", callback_data="admin_back")]]
+        
+        # Отчет без разметки: в нем символы графиков и подписи уроков
+        await update.callback_query.edit_message_text(
+            format_report(snapshot, funnel),
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        
+        # Графики рисуются в потоке: matplotlib занимает CPU на доли секунды
+        chart = await asyncio.to_thread(render_charts, snapshot, funnel)
+        if chart is not None:
+            await context.bot.send_photo(chat_id=update.effective_chat.id, photo=chart)
+    
     async def admin_button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик кнопок админки"""
         query = update.callback_query
@@ -110,21 +254,106 @@ class AdminBot:
         
         if data == "admin_users":
             await self.show_users_list(update, context)
+        elif data.startswith("admin_users:"):
+            # admin_users:<статус>:<урок>:<направление>:<курсор>
+            _, status, lesson, direction, cursor = data.split(":")
+            await self.show_users_list(
+                update, context,
+                status=status or None,
+                lesson=int(lesson) if lesson else None,
+                after=int(cursor) if direction == "n" and cursor else None,
+                before=int(cursor) if direction == "p" and cursor else None,
+            )
+        elif data == "admin_check":
+            await self.show_next_review(update, context)
+        elif data.startswith("admin_review_"):
+            # admin_review_<ok|skip>:<user_id>:<lesson_id>
+            action, user_id, lesson_id = data[len("admin_review_"):].split(":")
+            await self.handle_review(update, context, action, int(user_id), int(lesson_id))
         elif data == "admin_stats":
             await self.show_detailed_stats(update, context)
+        elif data == "admin_broadcast":
+            await self.show_broadcast_menu(update, context)
+        elif data == "admin_broadcast_new":
+            context.user_data['awaiting_broadcast'] = True
+            await query.edit_message_text("📢 Отправьте текст рассылки одним сообщением")
+        elif data == "admin_broadcast_resume":
+            checkpoint = BroadcastCheckpoint.load(BROADCAST_CHECKPOINT_PATH)
+            if checkpoint and not checkpoint.finished:
+                await self.start_broadcast(update, context, checkpoint)
+        elif data == "admin_export":
+            await self.show_export_menu(update, context)
+        elif data.startswith("admin_export:"):
+            await self.start_export(update, context, data.split(":")[1])
         elif data.startswith("admin_user_"):
             user_id = int(data.split("_")[2])
             await self.show_user_details(update, context, user_id)
     
-    async def show_users_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Показать список пользователей"""
+    def users_list_callback(self, status: Optional[str], lesson: Optional[int],
+                            direction: str = "", cursor: Optional[int] = None) -> str:
+        """callback_data страницы списка с фильтром и курсором"""
+        return f"admin_users:{status or ''}:{lesson or ''}:{direction}:{cursor if cursor is not None else ''}"
+    
+    async def show_users_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                              status: Optional[str] = None, lesson: Optional[int] = None,
+                              after: Optional[int] = None, before: Optional[int] = None):
+        """Показать страницу списка пользователей"""
+        user_status = STATUS_FILTERS[status][0] if status else None
+        
+        def read_page(view):
+            # Админка ведет основной бот: страница только из его ключей (namespace 0)
+            user_ids, has_prev, has_next = view.page(
+                status=user_status, lesson=lesson, after=after, before=before, limit=USERS_PAGE_SIZE
+            )
+            return [view.get(user_id) for user_id in user_ids], user_ids, has_prev, has_next
+        
+        progresses, user_ids, has_prev, has_next = await user_progress_db.query(read_page)
+        
         users_list = []
-        for user_id, progress in list(user_progress_db.items())[:50]:  # Первые 50 пользователей
-            users_list.append(f"👤 ID: {user_id} | Прогресс: {len(progress.completed_lessons)}/{len(LESSONS)}")
+        for user_id, progress in zip(user_ids, progresses):
+            if progress:
+                users_list.append(f"👤 ID: {user_id} | Прогресс: {len(progress.completed_lessons)}/{current_course().total}")
         
-        message = "👥 *Список пользователей:*\n\n" + "\n".join(users_list)
+        filters_text = []
+        if status:
+            filters_text.append(STATUS_FILTERS[status][1])
+        if lesson:
+            filters_text.append(f"урок {lesson}")
+        message = "👥 *Список пользователей*"
+        if filters_text:
+            message += f" ({', '.join(filters_text)})"
+        message += ":\n\n" + ("\n".join(users_list) if users_list else "Никого не найдено")
         
-        keyboard = [[InlineKeyboardButton("⬅️ Назад", callback_data="admin_back")]]
+        keyboard = []
+        
+        navigation = []
+        if has_prev:
+            navigation.append(InlineKeyboardButton(
+                "◀️", callback_data=self.users_list_callback(status, lesson, "p", user_ids[0])
+            ))
+        if has_next:
+            navigation.append(InlineKeyboardButton(
+                "▶️", callback_data=self.users_list_callback(status, lesson, "n", user_ids[-1])
+            ))
+        if navigation:
+            keyboard.append(navigation)
+        
+        # Смена фильтра начинает список с первой страницы
+        keyboard.append([
+            InlineKeyboardButton(
+                ("✅ " if code == status else "") + title,
+                callback_data=self.users_list_callback(None if code == status else code, lesson)
+            )
+            for code, (_, title) in STATUS_FILTERS.items()
+        ])
+        keyboard.append([
+            InlineKeyboardButton(
+                ("✅ " if lesson_id == lesson else "") + str(lesson_id),
+                callback_data=self.users_list_callback(status, None if lesson_id == lesson else lesson_id)
+            )
+            for lesson_id in range(1, current_course().total + 1)
+        ])
+        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="admin_back")])
         
         await update.callback_query.edit_message_text(
             message,
@@ -132,13 +361,238 @@ class AdminBot:
             parse_mode='Markdown'
         )
     
+    async def show_next_review(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                               notice: str = "", skipped: Optional[tuple] = None):
+        """Выдать куратору следующее задание из очереди проверки"""
+        reviewer_id = update.effective_user.id
+        item = await review_queue.claim(reviewer_id, lease_seconds=REVIEW_LEASE_SECONDS)
+        if skipped:
+            # Пропущенное возвращаем в очередь только после выдачи следующего
+            await review_queue.release(*skipped, reviewer_id)
+        
+        keyboard = []
+        if item is None:
+            text = notice + "✅ Все сданные задания проверены"
+        else:
+            # В очереди ключ хранилища: номер арендатора и id пользователя в Telegram
+            namespace, user_id = split_user_key(item.user_id)
+            tenant = review_tenants.get(namespace)
+            course = tenant.course() if tenant else None
+            progress = await user_progress_db.get(item.user_id)
+            answer = await load_answer(progress, item.lesson_id) if progress else ""
+            lesson = course.lesson(item.lesson_id) if course else None
+            submitted = (
+                datetime.fromtimestamp(item.submitted_at).strftime("%d.%m.%Y %H:%M")
+                if item.submitted_at else "до запуска очереди"
+            )
+            upcoming = await review_queue.peek(REVIEW_PREVIEW_SIZE)
+            
+            # Ответ ученика выводим без разметки, чтобы его символы не ломали сообщение
+            text = (
+                f"{notice}📝 Задание на проверку\n\n"
+                f"👤 ID: {user_id}\n"
+                f"{self.tenant_line(namespace, tenant)}"
+                f"📚 Урок {item.lesson_id}: {lesson.title if lesson else ''}\n"
+                f"🕒 Сдано: {submitted}\n\n"
+                f"{answer or '(ответ не найден)'}\n\n"
+                f"В очереди еще свободных: {len(upcoming)}"
+                f"{'+' if len(upcoming) == REVIEW_PREVIEW_SIZE else ''}"
+            )
+            callback_suffix = f"{item.user_id}:{item.lesson_id}"
+            keyboard.append([
+                InlineKeyboardButton("✅ Принять", callback_data=f"admin_review_ok:{callback_suffix}"),
+                InlineKeyboardButton("⏭ Пропустить", callback_data=f"admin_review_skip:{callback_suffix}"),
+            ])
+        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="admin_back")])
+        
+        await update.callback_query.edit_message_text(
+            text,
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    
+    async def handle_review(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                            action: str, user_id: int, lesson_id: int):
+        """Принять или пропустить задание, выданное куратору"""
+        reviewer_id = update.effective_user.id
+        if action == "skip":
+            await self.show_next_review(update, context, skipped=(user_id, lesson_id))
+            return
+        
+        notice = ""
+        if not await review_queue.complete(user_id, lesson_id, reviewer_id):
+            notice = "⚠️ Аренда истекла, задание передано другому куратору\n\n"
+        else:
+            # Отметку в прогрессе по результату из очереди ставит бот
+            await self.notify_checked(context, user_id, lesson_id)
+        await self.show_next_review(update, context, notice=notice)
+    
+    @staticmethod
+    def tenant_line(namespace: int, tenant: Optional[ReviewTenant]) -> str:
+        """Строка о боте-арендаторе в карточке задания (для основного бота - пустая)"""
+        if namespace == 0:
+            return ""
+        if tenant is None:
+            return f"🤖 Бот: №{namespace} (нет в TENANTS_FILE)\n"
+        return f"🤖 Бот: {tenant.id}\n"
+    
+    async def notify_checked(self, context: ContextTypes.DEFAULT_TYPE, key: int, lesson_id: int):
+        """Сообщить ученику о проверке от имени бота, в котором он сдал задание"""
+        namespace, user_id = split_user_key(key)
+        tenant = review_tenants.get(namespace)
+        if tenant is None:
+            logger.warning(f"Арендатор {namespace} не найден, пользователь {user_id} не уведомлен о проверке")
+            return
+        try:
+            await (tenant.bot if tenant.bot is not None else context.bot).send_message(
+                chat_id=user_id,
+                text=f"✅ Ваше задание к уроку {lesson_id} проверено!"
+            )
+        except (Forbidden, BadRequest) as e:
+            logger.warning(f"Не удалось уведомить пользователя {user_id}: {e}")
+    
+    async def show_broadcast_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Меню рассылки"""
+        if self.broadcast_task and not self.broadcast_task.done():
+            await update.callback_query.edit_message_text("📢 Рассылка уже выполняется")
+            return
+        
+        keyboard = [[InlineKeyboardButton("🆕 Новая рассылка", callback_data="admin_broadcast_new")]]
+        
+        checkpoint = BroadcastCheckpoint.load(BROADCAST_CHECKPOINT_PATH)
+        if checkpoint and not checkpoint.finished:
+            keyboard.insert(0, [InlineKeyboardButton(
+                f"▶️ Продолжить прерванную ({checkpoint.sent} отправлено)",
+                callback_data="admin_broadcast_resume"
+            )])
+        
+        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="admin_back")])
+        
+        await update.callback_query.edit_message_text(
+            "📢 *Рассылка*",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    
+    async def start_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE, checkpoint: BroadcastCheckpoint):
+        """Запустить рассылку в фоне"""
+        if self.broadcast_task and not self.broadcast_task.done():
+            await update.effective_message.reply_text("📢 Рассылка уже выполняется")
+            return
+        
+        # Параметр платной рассылки передаем как есть: его знают не все версии библиотеки
+        api_kwargs = {"allow_paid_broadcast": True} if BROADCAST_PAID else None
+        
+        async def send(chat_id: int):
+            await context.bot.send_message(chat_id=chat_id, text=checkpoint.text, api_kwargs=api_kwargs)
+        
+        def recipients(after: int):
+            # Только пользователи основного бота: ключи арендаторов идут после них
+            for batch in user_progress_db.iter_user_ids(after):
+                own = [user_id for user_id in batch if user_id <= USER_ID_MASK]
+                if own:
+                    yield own
+                if len(own) < len(batch):
+                    return
+        
+        engine = BroadcastEngine(
+            send=send,
+            recipients=recipients,
+            checkpoint_path=BROADCAST_CHECKPOINT_PATH,
+            rate=BROADCAST_RATE,
+            workers=BROADCAST_WORKERS,
+            is_permanent_error=lambda e: isinstance(e, (Forbidden, BadRequest)),
+        )
+        
+        admin_chat_id = update.effective_chat.id
+        self.broadcast_task = context.application.create_task(
+            self.run_broadcast(engine, checkpoint, context, admin_chat_id)
+        )
+        await update.effective_message.reply_text("📢 Рассылка запущена")
+    
+    async def run_broadcast(self, engine: BroadcastEngine, checkpoint: BroadcastCheckpoint,
+                            context: ContextTypes.DEFAULT_TYPE, admin_chat_id: int):
+        """Выполнить рассылку и сообщить результат администратору"""
+        try:
+            result = await engine.run(checkpoint)
+            text = f"✅ Рассылка завершена\nОтправлено: {result.sent}\nОшибок: {result.failed}"
+        except Exception as e:
+            logger.error(f"Рассылка прервана: {e}")
+            text = f"⚠️ Рассылка прервана: {e}\nЕе можно продолжить из меню рассылки"
+        await context.bot.send_message(chat_id=admin_chat_id, text=text)
+    
+    async def show_export_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Меню выгрузки: выбор формата"""
+        if self.export_task and not self.export_task.done():
+            await update.callback_query.edit_message_text("📤 Выгрузка уже выполняется")
+            return
+        
+        keyboard = [[
+            InlineKeyboardButton(fmt.upper(), callback_data=f"admin_export:{fmt}")
+            for fmt in export_formats()
+        ]]
+        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="admin_back")])
+        
+        await update.callback_query.edit_message_text(
+            "📤 *Выгрузка*\n\nПрогресс, ответы на задания и воронка по урокам. Формат:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    
+    async def start_export(self, update: Update, context: ContextTypes.DEFAULT_TYPE, fmt: str):
+        """Запустить выгрузку в фоне"""
+        if self.export_task and not self.export_task.done():
+            await update.effective_message.reply_text("📤 Выгрузка уже выполняется")
+            return
+        if fmt not in export_formats():
+            await update.effective_message.reply_text(f"⚠️ Формат {fmt} недоступен")
+            return
+        
+        admin_chat_id = update.effective_chat.id
+        self.export_task = context.application.create_task(self.run_export(fmt, context, admin_chat_id))
+        await update.callback_query.edit_message_text(f"📤 Выгрузка {fmt.upper()} запущена, файлы придут сюда")
+    
+    async def run_export(self, fmt: str, context: ContextTypes.DEFAULT_TYPE, admin_chat_id: int):
+        """Выгрузить данные курса в файлы и отправить их администратору"""
+        def batches():
+            # Только пользователи основного бота: ключи арендаторов идут после них
+            for batch in user_progress_db.iter_progress():
+                own = [progress for progress in batch if progress.user_id <= USER_ID_MASK]
+                if own:
+                    yield own
+                if len(own) < len(batch):
+                    return
+        
+        directory = tempfile.mkdtemp(prefix="export-", dir=EXPORT_DIR)
+        try:
+            # Обход и запись файлов - в потоке, event loop продолжает обслуживать админку
+            result = await asyncio.to_thread(
+                export_course, batches(), directory, fmt, current_course().total, read_answer,
+                chunk_size=EXPORT_CHUNK_ROWS, max_part_bytes=int(EXPORT_MAX_PART_MB * 2 ** 20),
+            )
+            for path in result.paths:
+                with open(path, "rb") as document:
+                    await context.bot.send_document(
+                        chat_id=admin_chat_id, document=document, filename=os.path.basename(path)
+                    )
+            text = (
+                f"✅ Выгрузка завершена за {result.seconds:.1f} с\n"
+                f"Пользователей: {result.users}\nОтветов: {result.submissions}\nФайлов: {len(result.paths)}"
+            )
+        except Exception as e:
+            logger.error(f"Выгрузка прервана: {e}")
+            text = f"⚠️ Выгрузка прервана: {e}"
+        finally:
+            await asyncio.to_thread(shutil.rmtree, directory, True)
+        await context.bot.send_message(chat_id=admin_chat_id, text=text)
+    
     async def handle_admin_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка сообщений администратора"""
         if not await self.check_admin(update):
             return
         
-        # Здесь можно добавить логику для обработки команд администратора
-        pass
+        if context.user_data.pop('awaiting_broadcast', False):
+            checkpoint = BroadcastCheckpoint(text=update.message.text)
+            await self.start_broadcast(update, context, checkpoint)
 
 def main():
     """Запуск админ-бота"""
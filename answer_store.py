@@ -0,0 +1,177 @@
+import os
+import re
+import zlib
+import struct
+import asyncio
+import logging
+import threading
+from typing import Iterator, Optional, Tuple
+
+from models import AnswerRef
+
+try:
+    import zstandard
+except ImportError:  # zstandard - необязательная зависимость, иначе zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+# Заголовок записи: user_id, lesson_id, кодек, длина сжатых данных
+_HEADER = struct.Struct("<qHBI")
+
+# handle = номер сегмента << 40 | смещение записи в сегменте
+_OFFSET_BITS = 40
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+_SEGMENT_NAME = re.compile(r"^answers-(\d{6})\.seg$")
+
+# Короткие ответы сжатие не уменьшает
+_MIN_COMPRESS_SIZE = 128
+
+def make_preview(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + "…"
+
+class AnswerStore:
+    """Хранилище текстов ответов в сжатых сегментах только для дописывания
+
+    Каждый ответ дописывается в конец текущего сегмента отдельной записью
+    (заголовок с user_id и lesson_id, затем данные в zstd, zlib или как
+    есть). В прогрессе пользователя остается только AnswerRef: handle -
+    номер сегмента и смещение записи, то есть готовый индекс для чтения
+    одним pread - и короткое превью. Поэтому загрузка и навигация по
+    урокам не трогают тексты ответов. Сегменты сами описывают свои
+    записи, индекс при необходимости восстанавливается обходом (scan).
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 64 * 2 ** 20,
+                 preview_chars: int = 100, codec: Optional[int] = None):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.preview_chars = preview_chars
+        if codec is None:
+            codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+        if codec == CODEC_ZSTD and zstandard is None:
+            raise RuntimeError("Для сжатия zstd нужен пакет zstandard")
+        self.codec = codec
+        self._lock = threading.Lock()
+        self._segment_id = 0
+        self._writer: Optional[int] = None
+        self._readers = {}
+
+    def _path(self, segment_id: int) -> str:
+        return os.path.join(self.directory, f"answers-{segment_id:06d}.seg")
+
+    def _segment_ids(self):
+        return sorted(
+            int(match.group(1))
+            for match in map(_SEGMENT_NAME.match, os.listdir(self.directory))
+            if match
+        )
+
+    def _open_segment(self, segment_id: int):
+        # O_APPEND: каждая запись атомарно ложится в конец файла, даже если
+        # в сегмент пишут несколько процессов бота
+        self._segment_id = segment_id
+        self._writer = os.open(self._path(segment_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segment_ids()
+        self._open_segment(segments[-1] if segments else 1)
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+        logger.info(f"Хранилище ответов: {self.directory}, сегмент {self._segment_id}")
+
+    def _rotate(self):
+        os.close(self._writer)
+        self._open_segment(max(self._segment_ids()[-1], self._segment_id) + 1)
+
+    def _compress(self, data: bytes) -> Tuple[int, bytes]:
+        if len(data) < _MIN_COMPRESS_SIZE:
+            return CODEC_RAW, data
+        if self.codec == CODEC_ZSTD:
+            packed = zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            packed = zlib.compress(data, 6)
+        if len(packed) >= len(data):
+            return CODEC_RAW, data
+        return self.codec, packed
+
+    @staticmethod
+    def _decompress(codec: int, data: bytes) -> bytes:
+        if codec == CODEC_RAW:
+            return data
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(data)
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Ответ сжат zstd, но пакет zstandard не установлен")
+            return zstandard.ZstdDecompressor().decompress(data)
+        raise ValueError(f"Неизвестный кодек ответа: {codec}")
+
+    def append(self, user_id: int, lesson_id: int, text: str) -> AnswerRef:
+        """Дописать ответ и вернуть ссылку на него (синхронно)"""
+        codec, payload = self._compress(text.encode("utf-8"))
+        record = _HEADER.pack(user_id, lesson_id, codec, len(payload)) + payload
+        with self._lock:
+            size = os.fstat(self._writer).st_size
+            if size and size + len(record) > self.segment_max_bytes:
+                self._rotate()
+            os.write(self._writer, record)
+            # Позиция дескриптора - конец именно нашей записи
+            offset = os.lseek(self._writer, 0, os.SEEK_CUR) - len(record)
+            handle = self._segment_id << _OFFSET_BITS | offset
+        return AnswerRef(handle, make_preview(text, self.preview_chars))
+
+    def _reader(self, segment_id: int) -> int:
+        fd = self._readers.get(segment_id)
+        if fd is None:
+            with self._lock:
+                fd = self._readers.get(segment_id)
+                if fd is None:
+                    fd = self._readers[segment_id] = os.open(self._path(segment_id), os.O_RDONLY)
+        return fd
+
+    def read(self, handle: int) -> str:
+        """Прочитать полный текст ответа по handle (синхронно)"""
+        fd = self._reader(handle >> _OFFSET_BITS)
+        offset = handle & _OFFSET_MASK
+        header = os.pread(fd, _HEADER.size, offset)
+        _, _, codec, length = _HEADER.unpack(header)
+        payload = os.pread(fd, length, offset + _HEADER.size)
+        return self._decompress(codec, payload).decode("utf-8")
+
+    async def put(self, user_id: int, lesson_id: int, text: str) -> AnswerRef:
+        return await asyncio.to_thread(self.append, user_id, lesson_id, text)
+
+    async def get(self, ref: AnswerRef) -> str:
+        return await asyncio.to_thread(self.read, ref.handle)
+
+    def scan(self) -> Iterator[Tuple[int, int, int]]:
+        """Обойти все записи: (user_id, lesson_id, handle)"""
+        for segment_id in self._segment_ids():
+            with open(self._path(segment_id), "rb") as f:
+                offset = 0
+                while True:
+                    header = f.read(_HEADER.size)
+                    if len(header) < _HEADER.size:
+                        break
+                    user_id, lesson_id, _, length = _HEADER.unpack(header)
+                    f.seek(length, os.SEEK_CUR)
+                    yield user_id, lesson_id, segment_id << _OFFSET_BITS | offset
+                    offset += _HEADER.size + length
+
+    async def close(self):
+        with self._lock:
+            if self._writer is not None:
+                os.fsync(self._writer)
+                os.close(self._writer)
+                self._writer = None
+            for fd in self._readers.values():
+                os.close(fd)
+            self._readers.clear()
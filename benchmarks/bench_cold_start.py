@@ -0,0 +1,107 @@
+"""Холодный старт webhook-режима: bot.py против faststart.py
+
+Для каждой точки входа запускает процесс бота с заглушкой Bot API и сразу
+шлет /start на /webhook (повторяя, пока порт закрыт), как Telegram после
+пробуждения сервиса. Меряется время от запуска процесса до ответа /health,
+до HTTP-ответа на webhook и до первого сообщения бота в заглушке.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_cold_start.py --runs 3
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, List, Optional
+
+from aiohttp import web, ClientSession, ClientTimeout
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadtest import ROOT, TOKEN, FakeBotAPI, _free_port
+
+ENTRYPOINTS = ("bot.py", "faststart.py")
+CHAT_ID = 424242
+
+def _start_update() -> dict:
+    user = {"id": CHAT_ID, "is_bot": False, "first_name": "Cold"}
+    return {
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": int(time.time()), "text": "/start",
+            "chat": {"id": CHAT_ID, "type": "private"}, "from": user,
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+async def _first_ok(session: ClientSession, method: str, url: str, started: float,
+                    json: Optional[dict] = None, timeout: float = 60) -> float:
+    """Время до первого ответа 200, повторяя запрос, пока порт закрыт"""
+    while time.perf_counter() - started < timeout:
+        try:
+            async with session.request(method, url, json=json, timeout=ClientTimeout(total=timeout)) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except Exception:
+            pass
+        await asyncio.sleep(0.02)
+    raise TimeoutError(f"{url} не ответил за {timeout} с")
+
+async def measure(entrypoint: str, api: FakeBotAPI, api_port: int) -> Dict[str, float]:
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "TELEGRAM_API_BASE": f"http://127.0.0.1:{api_port}",
+        "RENDER_EXTERNAL_URL": f"http://127.0.0.1:{port}",
+        "PORT": str(port),
+        "DATA_DIR": tempfile.mkdtemp(prefix="coldstart-"),
+        "PROGRESS_BACKEND": "sqlite",
+    })
+    reply = api.expect(f"chat:{CHAT_ID}")
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, entrypoint), cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        async with ClientSession() as session:
+            health, webhook = await asyncio.gather(
+                _first_ok(session, "GET", f"http://127.0.0.1:{port}/health", started),
+                _first_ok(session, "POST", f"http://127.0.0.1:{port}/webhook", started, json=_start_update()),
+            )
+        first_reply = await asyncio.wait_for(reply, 30) - started
+    finally:
+        process.terminate()
+        await process.wait()
+    return {"health": health, "webhook": webhook, "first_reply": first_reply}
+
+async def run(args):
+    api = FakeBotAPI()
+    api_port = _free_port()
+    runner = web.AppRunner(api.build_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+    try:
+        results: Dict[str, List[Dict[str, float]]] = {entrypoint: [] for entrypoint in ENTRYPOINTS}
+        for _ in range(args.runs):
+            for entrypoint in ENTRYPOINTS:
+                results[entrypoint].append(await measure(entrypoint, api, api_port))
+    finally:
+        await runner.cleanup()
+
+    print(f"{'точка входа':<14} {'/health':>9} {'webhook':>9} {'ответ':>9}   (медиана из {args.runs}, секунды)")
+    for entrypoint, runs in results.items():
+        median = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in runs[0]}
+        print(f"{entrypoint:<14} {median['health']:9.2f} {median['webhook']:9.2f} {median['first_reply']:9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
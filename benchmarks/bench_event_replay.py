@@ -0,0 +1,93 @@
+"""Скорость запуска хранилища на журнале событий: воспроизведение и снимок
+
+Запуск из корня репозитория:
+    python benchmarks/bench_event_replay.py --events 1000000 --users 100000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from models import AnswerRef, AssignmentStatus, UserStatus
+from events import EventType, ProgressEvent
+from event_log import EventLog, encode_event, encode_snapshot_users
+
+LESSONS = 5
+
+def _synthetic_events(count: int, users: int, seed: int):
+    """Поток событий, похожий на реальный: в основном просмотры уроков"""
+    rng = random.Random(seed)
+    preview = "ответ " * 10
+    for _ in range(count):
+        user_id = rng.randint(1, users)
+        lesson_id = rng.randint(1, LESSONS)
+        roll = rng.random()
+        if roll < 0.5:
+            yield ProgressEvent(EventType.LESSON_VIEWED, user_id, lesson_id)
+        elif roll < 0.7:
+            yield ProgressEvent(EventType.LESSON_COMPLETED, user_id, lesson_id)
+        elif roll < 0.8:
+            yield ProgressEvent(
+                EventType.STATUS_CHANGED, user_id,
+                previous=UserStatus.NOT_STARTED, current=UserStatus.IN_PROGRESS,
+            )
+        elif roll < 0.95:
+            yield ProgressEvent(
+                EventType.ASSIGNMENT_SUBMITTED, user_id, lesson_id,
+                previous=AssignmentStatus.NOT_SUBMITTED, current=AssignmentStatus.SUBMITTED,
+                answer=AnswerRef(1 << 40 | rng.randrange(1 << 30), preview),
+            )
+        else:
+            yield ProgressEvent(
+                EventType.ASSIGNMENT_CHECKED, user_id, lesson_id,
+                previous=AssignmentStatus.SUBMITTED, current=AssignmentStatus.CHECKED,
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = EventLog(directory)
+        log.load()
+        started = time.perf_counter()
+        batch = bytearray()
+        for event in _synthetic_events(args.events, args.users, args.seed):
+            batch += encode_event(event)
+            if len(batch) > 1 << 20:
+                log.write(bytes(batch))
+                batch.clear()
+        log.write(bytes(batch))
+        log.next_seq = args.events
+        log.close()
+        elapsed = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"Запись журнала:  {args.events / elapsed:12,.0f} событий/с, {size / 2 ** 20:.1f} MiB")
+
+        started = time.perf_counter()
+        log = EventLog(directory)
+        data = log.load()
+        elapsed = time.perf_counter() - started
+        print(f"Воспроизведение: {args.events / elapsed:12,.0f} событий/с, {elapsed:.2f} с, {len(data)} записей")
+
+        started = time.perf_counter()
+        users, count = encode_snapshot_users(data.values())
+        log.write_snapshot(log.next_seq, users, count)
+        log.close()
+        elapsed = time.perf_counter() - started
+        print(f"Запись снимка:   {count / elapsed:12,.0f} записей/с, {len(users) / 2 ** 20:.1f} MiB")
+
+        started = time.perf_counter()
+        data = EventLog(directory).load()
+        elapsed = time.perf_counter() - started
+        print(f"Запуск со снимка: {elapsed:.2f} с, {len(data)} записей")
+
+if __name__ == "__main__":
+    main()
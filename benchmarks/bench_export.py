@@ -0,0 +1,112 @@
+"""Выгрузка курса: скорость и пиковая память при обходе базы пачками
+
+Заполняет базу прогресса users записями (у части пользователей есть
+ответы на задания в хранилище ответов) и выгружает ее в каждом доступном
+формате тем же кодом, что и админка. Печатает время, скорость, пиковую
+память выгрузки (tracemalloc, отдельным прогоном) и размер файлов.
+Память выгрузки не должна расти вместе с users - она определяется
+размером пачки.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_export.py --users 200000 --chunk-rows 10000
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from answer_store import AnswerStore
+from export import export_course, export_formats
+from models import UserProgress, UserStatus
+from progress_reader import ProgressReader
+from progress_store import SQLiteProgressStore, progress_to_record
+
+LESSONS = 5
+
+def _fill(path: str, answers: AnswerStore, users: int, seed: int):
+    rng = random.Random(seed)
+    store = SQLiteProgressStore(path)
+    store._conn = store._connect()
+    rows = []
+    for user_id in range(1, users + 1):
+        progress = UserProgress(user_id, current_lesson=rng.randint(1, LESSONS), status=UserStatus.IN_PROGRESS)
+        progress.completed_lessons = range(1, progress.current_lesson)
+        for lesson_id in progress.completed_lessons:
+            if rng.random() < 0.3:
+                text = f"Ответ пользователя {user_id} на урок {lesson_id}. " * rng.randint(1, 20)
+                progress.submitted_assignments[lesson_id] = answers.append(user_id, lesson_id, text)
+                progress.checked_assignments[lesson_id] = rng.random() < 0.5
+        rows.append((user_id, progress_to_record(progress), 0.0))
+        if len(rows) == 50000:
+            store._write_batch(rows)
+            rows = []
+    store._write_batch(rows)
+    store._conn.close()
+
+def _read_answer(answers: AnswerStore):
+    def read(progress: UserProgress, lesson_id: int) -> str:
+        ref = progress.answer_ref(lesson_id)
+        if ref is None:
+            return progress.submitted_assignments.get(lesson_id, "")
+        return answers.read(ref.handle)
+    return read
+
+async def _run(path: str, answers: AnswerStore, fmt: str, directory: str, args, trace: bool) -> dict:
+    reader = ProgressReader(path)
+    await reader.start()
+    if trace:
+        tracemalloc.start()
+    try:
+        result = await asyncio.to_thread(
+            export_course, reader.iter_progress(batch_size=args.batch_size), directory, fmt, LESSONS,
+            _read_answer(answers), chunk_size=args.chunk_rows,
+        )
+        peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    finally:
+        if trace:
+            tracemalloc.stop()
+        await reader.close()
+    return {
+        "seconds": result.seconds,
+        "rows_per_second": result.users / result.seconds if result.seconds else 0.0,
+        "peak_mib": peak / 2 ** 20,
+        "size_mib": sum(os.path.getsize(path) for path in result.paths) / 2 ** 20,
+        "submissions": result.submissions,
+    }
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "progress.sqlite3")
+        answers = AnswerStore(os.path.join(directory, "answers"))
+        await answers.start()
+        started = time.perf_counter()
+        _fill(path, answers, args.users, args.seed)
+        print(f"Пользователей: {args.users}, база заполнена за {time.perf_counter() - started:.1f} с")
+        print(f"{'формат':>8} {'секунды':>8} {'строк/с':>9} {'пик памяти':>11} {'файлы':>10} {'ответов':>8}")
+        for fmt in export_formats():
+            # tracemalloc замедляет выгрузку в разы: время и память меряем разными прогонами
+            result = await _run(path, answers, fmt, os.path.join(directory, fmt), args, trace=False)
+            shutil.rmtree(os.path.join(directory, fmt))
+            result["peak_mib"] = (await _run(path, answers, fmt, os.path.join(directory, fmt), args, trace=True))["peak_mib"]
+            print(f"{fmt:>8} {result['seconds']:>8.1f} {result['rows_per_second']:>9.0f} "
+                  f"{result['peak_mib']:>7.1f} MiB {result['size_mib']:>6.1f} MiB {result['submissions']:>8}")
+        await answers.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=1000, help="записей прогресса в пачке чтения")
+    parser.add_argument("--chunk-rows", type=int, default=10000, help="строк в пачке записи")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
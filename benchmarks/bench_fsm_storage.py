@@ -0,0 +1,74 @@
+"""Сравнение задержек set_state/get_data: MemoryStorage и SQLiteStorage
+
+Запуск из корня репозитория:
+    python benchmarks/bench_fsm_storage.py --users 2000 --rounds 5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteStorage
+
+STATE = "CourseStates:awaiting_assignment_submission"
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+async def _measure(storage, users: int, rounds: int):
+    set_state_samples = []
+    get_data_samples = []
+    keys = [StorageKey(bot_id=1, chat_id=user_id, user_id=user_id) for user_id in range(1, users + 1)]
+
+    for _ in range(rounds):
+        for key in keys:
+            start = time.perf_counter()
+            await storage.set_state(key, STATE)
+            set_state_samples.append(time.perf_counter() - start)
+
+            await storage.update_data(key, {"lesson_id": key.user_id % 5 + 1})
+
+            start = time.perf_counter()
+            await storage.get_data(key)
+            get_data_samples.append(time.perf_counter() - start)
+
+    return set_state_samples, get_data_samples
+
+def _report(name, set_state_samples, get_data_samples):
+    for op, samples in (("set_state", set_state_samples), ("get_data", get_data_samples)):
+        print(
+            f"{name:<24} {op:<10} "
+            f"mean={statistics.mean(samples) * 1e6:8.1f}us "
+            f"p50={_percentile(samples, 0.50) * 1e6:8.1f}us "
+            f"p99={_percentile(samples, 0.99) * 1e6:8.1f}us"
+        )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--shards", type=int, default=8)
+    args = parser.parse_args()
+
+    storage = MemoryStorage()
+    _report("MemoryStorage", *await _measure(storage, args.users, args.rounds))
+    await storage.close()
+
+    for cache_ttl in (60.0, 0.0):
+        with tempfile.TemporaryDirectory() as directory:
+            storage = SQLiteStorage(directory, shards=args.shards, cache_ttl=cache_ttl)
+            name = f"SQLiteStorage(ttl={cache_ttl:g})"
+            _report(name, *await _measure(storage, args.users, args.rounds))
+            await storage.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
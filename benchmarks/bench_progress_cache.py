@@ -0,0 +1,97 @@
+"""Кэш записей прогресса над SQLite: доля попаданий, цена чтения и память
+
+Заполняет базу users записями и читает их так, как читают обработчики:
+долю reads-share чтений дает активная когорта active-share пользователей,
+остальное - случайные пользователи всей базы, плюс немного новых
+(отсутствующих) пользователей. Для каждого размера кэша печатает долю
+попаданий, среднее время get и память, занятую кэшем.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_progress_cache.py --users 500000 --cache-sizes 1000,10000,50000
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from models import UserProgress, UserStatus
+from progress_store import CachedSQLiteProgressStore, SQLiteProgressStore, progress_to_record
+
+LESSONS = 5
+
+def _fill(path: str, users: int, seed: int):
+    rng = random.Random(seed)
+    store = SQLiteProgressStore(path)
+    store._conn = store._connect()
+    rows = []
+    for user_id in range(1, users + 1):
+        progress = UserProgress(user_id, current_lesson=rng.randint(1, LESSONS), status=UserStatus.IN_PROGRESS)
+        progress.completed_lessons = range(1, progress.current_lesson)
+        rows.append((user_id, progress_to_record(progress), 0.0))
+        if len(rows) == 50000:
+            store._write_batch(rows)
+            rows = []
+    store._write_batch(rows)
+    store._conn.close()
+
+def _reads(users: int, count: int, active_share: float, reads_share: float, seed: int):
+    rng = random.Random(seed)
+    active = max(1, int(users * active_share))
+    for _ in range(count):
+        roll = rng.random()
+        if roll < reads_share:
+            yield rng.randint(1, active)
+        elif roll < 0.99:
+            yield rng.randint(1, users)
+        else:
+            # Новый пользователь: записи еще нет
+            yield users + rng.randint(1, users)
+
+async def _run(path: str, cache_size: int, args) -> dict:
+    keys = list(_reads(args.users, args.reads, args.active_share, args.reads_share, args.seed))
+    tracemalloc.start()
+    store = CachedSQLiteProgressStore(path, cache_size=cache_size)
+    await store.start()
+    started = time.perf_counter()
+    for key in keys:
+        store.get(key)
+    elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    metrics = store.metrics()
+    await store.close()
+    return {
+        "hit_ratio": metrics["hit_ratio"],
+        "us_per_get": elapsed / len(keys) * 1e6,
+        "memory_mib": memory / 2 ** 20,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500_000)
+    parser.add_argument("--reads", type=int, default=500_000)
+    parser.add_argument("--active-share", type=float, default=0.02, help="доля активных пользователей")
+    parser.add_argument("--reads-share", type=float, default=0.9, help="доля чтений активной когорты")
+    parser.add_argument("--cache-sizes", default="1000,10000,20000,50000")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "progress.sqlite3")
+        _fill(path, args.users, args.seed)
+        print(f"Пользователей: {args.users}, активных: {int(args.users * args.active_share)}, "
+              f"их доля чтений: {args.reads_share:.0%}")
+        print(f"{'кэш':>8} {'попадания':>10} {'мкс/get':>9} {'память':>10}")
+        for cache_size in (int(size) for size in args.cache_sizes.split(",")):
+            result = asyncio.run(_run(path, cache_size, args))
+            print(f"{cache_size:>8} {result['hit_ratio']:>10.1%} {result['us_per_get']:>9.2f} "
+                  f"{result['memory_mib']:>7.1f} MiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Память на прогресс пользователей: прежний dataclass и компактный UserProgress
+
+Запуск из корня репозитория:
+    python benchmarks/bench_progress_memory.py --users 1000000
+"""
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from models import UserProgress, UserStatus
+
+LESSONS = 5
+
+@dataclass
+class LegacyUserProgress:
+    """UserProgress в том виде, в каком он был до перехода на битовые маски"""
+    user_id: int
+    current_lesson: int = 1
+    completed_lessons: List[int] = None
+    submitted_assignments: Dict[int, str] = None
+    checked_assignments: Dict[int, bool] = None
+    status: UserStatus = UserStatus.NOT_STARTED
+
+    def __post_init__(self):
+        if self.completed_lessons is None:
+            self.completed_lessons = []
+        if self.submitted_assignments is None:
+            self.submitted_assignments = {}
+        if self.checked_assignments is None:
+            self.checked_assignments = {}
+
+def _synthetic_users(count: int, seed: int):
+    """Одинаковая для обоих вариантов выборка: большинство застряло в начале курса"""
+    rng = random.Random(seed)
+    answer = "ответ"  # один объект строки, чтобы мерить только накладные расходы записи
+    for user_id in range(1, count + 1):
+        completed = rng.choice((0, 0, 0, 1, 1, 2, 3, 5))
+        submitted = min(completed, rng.choice((0, 0, 1, 2)))
+        status = UserStatus.NOT_STARTED if completed == 0 else (
+            UserStatus.COMPLETED if completed == LESSONS else UserStatus.IN_PROGRESS
+        )
+        yield user_id, completed, submitted, status, answer
+
+def _fill(progress, completed: int, submitted: int, status: UserStatus, answer: str):
+    progress.current_lesson = min(completed + 1, LESSONS)
+    progress.status = status
+    for lesson_id in range(1, completed + 1):
+        progress.completed_lessons.append(lesson_id)
+    for lesson_id in range(1, submitted + 1):
+        progress.submitted_assignments[lesson_id] = answer
+        progress.checked_assignments[lesson_id] = lesson_id == 1
+
+def _measure(factory, count: int, seed: int) -> int:
+    tracemalloc.start()
+    db = {}
+    for user_id, completed, submitted, status, answer in _synthetic_users(count, seed):
+        progress = factory(user_id)
+        _fill(progress, completed, submitted, status, answer)
+        db[user_id] = progress
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del db
+    return current
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    results = {}
+    for name, factory in (("dataclass", LegacyUserProgress), ("compact", UserProgress)):
+        results[name] = _measure(factory, args.users, args.seed)
+        print(
+            f"{name:<10} {results[name] / 2 ** 20:9.1f} MiB "
+            f"{results[name] / args.users:7.1f} байт/пользователь"
+        )
+
+    print(f"Экономия: {results['dataclass'] / results['compact']:.1f}x")
+
+if __name__ == "__main__":
+    main()
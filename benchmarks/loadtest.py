@@ -0,0 +1,365 @@
+"""Нагрузочный тест бота в режиме webhook с локальной заглушкой Telegram Bot API
+
+Запускает заглушку Bot API, поднимает bot.py отдельным процессом (webhook
+на локальном порту, Bot API - на заглушке) и воспроизводит сценарии
+пользователей: /start, начало курса, уроки, отметка прохождения и сдача
+заданий. Задержка апдейта - время от POST на /webhook до первого ответа
+бота этому пользователю в заглушке (answerCallbackQuery для кнопок,
+sendMessage для сообщений).
+
+Запуск из корня репозитория:
+    python benchmarks/loadtest.py --users 500 --rate 1000 --duration 30
+    python benchmarks/loadtest.py --workers 4 --max-p99 0.5 --min-throughput 800
+
+С --max-p99/--min-throughput/--max-rss-growth скрипт завершается с кодом 1,
+если порог нарушен, поэтому его можно ставить перед деплоем.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, List, Optional
+
+from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+TOKEN = "123456:loadtest"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "LoadTestBot", "username": "loadtest_bot"}
+LESSONS = 5
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _rss_bytes(pid: int) -> int:
+    """Резидентная память процесса и его потомков (Linux)"""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    for current in pids:
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# ========== ЗАГЛУШКА BOT API ==========
+
+class FakeBotAPI:
+    """Локальный Bot API: отвечает на методы бота и сообщает о первом ответе пользователю"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self._message_id = 0
+        self._waiters: Dict[str, asyncio.Future] = {}
+
+    def expect(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[key] = future
+        return future
+
+    def _resolve(self, key: str):
+        future = self._waiters.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            self._resolve(f"chat:{chat_id}")
+            result = self._message(chat_id, params.get("text", ""))
+        elif method == "editMessageText":
+            result = self._message(int(params.get("chat_id", 0)), params.get("text", ""))
+        elif method == "answerCallbackQuery":
+            self._resolve(f"callback:{params['callback_query_id']}")
+            result = True
+        elif method == "getMe":
+            result = BOT_USER
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        else:
+            # setWebhook, deleteWebhook и прочие служебные методы
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+# ========== ГЕНЕРАТОР АПДЕЙТОВ ==========
+
+class LoadGenerator:
+    """Виртуальные пользователи, проходящие курс, с общим ограничением скорости"""
+
+    def __init__(self, api: FakeBotAPI, webhook_url: str, rate: float, timeout: float):
+        self.api = api
+        self.webhook_url = webhook_url
+        self.rate = rate
+        self.timeout = timeout
+        self.latencies: List[float] = []
+        self.timeouts = 0
+        self.rejected = 0
+        self._update_id = 0
+        self._next_slot = 0.0
+        self._session: Optional[ClientSession] = None
+
+    async def _throttle(self):
+        # Равномерные интервалы 1/rate между отправками всех пользователей
+        now = time.perf_counter()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _new_update_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "ru"}
+
+    def _message_update(self, user_id: int, text: str) -> dict:
+        update_id = self._new_update_id()
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }
+
+    def _callback_update(self, user_id: int, data: str) -> dict:
+        update_id = self._new_update_id()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": 1,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "...",
+                },
+            },
+        }
+
+    async def _send(self, update: dict, key: str):
+        await self._throttle()
+        waiter = self.api.expect(key)
+        started = time.perf_counter()
+        async with self._session.post(self.webhook_url, json=update) as response:
+            await response.read()
+            if response.status != 200:
+                self.rejected += 1
+                return
+        try:
+            answered = await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return
+        self.latencies.append(answered - started)
+
+    async def _message(self, user_id: int, text: str):
+        await self._send(self._message_update(user_id, text), f"chat:{user_id}")
+
+    async def _callback(self, user_id: int, data: str):
+        update = self._callback_update(user_id, data)
+        await self._send(update, f"callback:{update['callback_query']['id']}")
+
+    async def _user_session(self, user_id: int, rng: random.Random, deadline: float):
+        """Один пользователь: регистрация, затем уроки до конца курса по кругу"""
+        await self._message(user_id, "/start")
+        await self._callback(user_id, "start_course")
+        while time.perf_counter() < deadline:
+            for lesson_id in range(1, LESSONS + 1):
+                if time.perf_counter() >= deadline:
+                    return
+                await self._callback(user_id, f"lesson_{lesson_id}")
+                if rng.random() < 0.3:
+                    await self._callback(user_id, f"submit_{lesson_id}")
+                    await self._message(user_id, "Мой ответ на задание. " * rng.randint(1, 40))
+                await self._callback(user_id, f"complete_lesson_{lesson_id}")
+            await self._callback(user_id, "profile")
+
+    async def run(self, users: int, duration: float, seed: int):
+        self._session = ClientSession(connector=TCPConnector(limit=0), timeout=ClientTimeout(total=30))
+        try:
+            deadline = time.perf_counter() + duration
+            rng = random.Random(seed)
+            await asyncio.gather(*(
+                self._user_session(10_000_000 + i, random.Random(rng.random()), deadline)
+                for i in range(users)
+            ))
+        finally:
+            await self._session.close()
+
+# ========== ЗАПУСК ==========
+
+async def _wait_healthy(url: str, process: asyncio.subprocess.Process, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.returncode is not None:
+                raise RuntimeError(f"bot.py завершился с кодом {process.returncode}")
+            try:
+                async with session.get(url, timeout=ClientTimeout(total=1)) as response:
+                    if response.status == 200:
+                        return
+            except Exception:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("bot.py не ответил на /health")
+
+async def run(args) -> int:
+    api = FakeBotAPI(latency=args.api_latency)
+    api_port = _free_port()
+    api_runner = web.AppRunner(api.build_app())
+    await api_runner.setup()
+    await web.TCPSite(api_runner, "127.0.0.1", api_port).start()
+
+    bot_port = _free_port()
+    data_dir = tempfile.mkdtemp(prefix="loadtest-")
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "TELEGRAM_API_BASE": f"http://127.0.0.1:{api_port}",
+        "RENDER_EXTERNAL_URL": f"http://127.0.0.1:{bot_port}",
+        "PORT": str(bot_port),
+        "WEB_WORKERS": str(args.workers),
+        "DATA_DIR": data_dir,
+        "PROGRESS_BACKEND": args.progress_backend,
+    })
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "bot.py"),
+        cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=None if args.verbose else asyncio.subprocess.DEVNULL,
+    )
+    try:
+        await _wait_healthy(f"http://127.0.0.1:{bot_port}/health", process)
+        rss_before = _rss_bytes(process.pid)
+
+        generator = LoadGenerator(
+            api, f"http://127.0.0.1:{bot_port}/webhook", rate=args.rate, timeout=args.timeout
+        )
+        started = time.perf_counter()
+        await generator.run(args.users, args.duration, args.seed)
+        elapsed = time.perf_counter() - started
+        rss_after = _rss_bytes(process.pid)
+    finally:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), 30)
+        except asyncio.TimeoutError:
+            process.kill()
+        await api_runner.cleanup()
+
+    completed = len(generator.latencies)
+    throughput = completed / elapsed
+    p50 = _percentile(generator.latencies, 0.50)
+    p99 = _percentile(generator.latencies, 0.99)
+    growth = rss_after - rss_before
+    report = {
+        "updates": completed,
+        "throughput": round(throughput, 1),
+        "p50_ms": round(p50 * 1000, 2),
+        "p99_ms": round(p99 * 1000, 2),
+        "timeouts": generator.timeouts,
+        "rejected": generator.rejected,
+        "rss_before_mib": round(rss_before / 2 ** 20, 1),
+        "rss_after_mib": round(rss_after / 2 ** 20, 1),
+        "rss_growth_mib": round(growth / 2 ** 20, 1),
+        "api_calls": api.calls,
+    }
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print(f"Апдейтов обработано: {completed} за {elapsed:.1f} с ({throughput:.0f}/с)")
+        print(f"Задержка: p50 {p50 * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс")
+        print(f"Таймаутов: {generator.timeouts}, отклонено webhook: {generator.rejected}")
+        print(f"Память: {rss_before / 2 ** 20:.1f} -> {rss_after / 2 ** 20:.1f} MiB (+{growth / 2 ** 20:.1f})")
+        print(f"Вызовы Bot API: {api.calls}")
+
+    failures = []
+    if args.max_p99 is not None and p99 > args.max_p99:
+        failures.append(f"p99 {p99:.3f} с > {args.max_p99} с")
+    if args.min_throughput is not None and throughput < args.min_throughput:
+        failures.append(f"пропускная способность {throughput:.0f}/с < {args.min_throughput}/с")
+    if args.max_rss_growth is not None and growth / 2 ** 20 > args.max_rss_growth:
+        failures.append(f"рост памяти {growth / 2 ** 20:.1f} MiB > {args.max_rss_growth} MiB")
+    if generator.timeouts:
+        failures.append(f"апдейтов без ответа: {generator.timeouts}")
+    for failure in failures:
+        print(f"ПОРОГ НАРУШЕН: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200, help="виртуальных пользователей")
+    parser.add_argument("--rate", type=float, default=500, help="апдейтов в секунду на все пользователей")
+    parser.add_argument("--duration", type=float, default=20, help="длительность, секунды")
+    parser.add_argument("--workers", type=int, default=1, help="WEB_WORKERS для bot.py")
+    parser.add_argument("--progress-backend", default="sqlite", choices=("memory", "sqlite", "sqlite-cached", "eventlog"))
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа заглушки, секунды")
+    parser.add_argument("--timeout", type=float, default=10.0, help="ожидание ответа на апдейт, секунды")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-p99", type=float, help="порог p99, секунды")
+    parser.add_argument("--min-throughput", type=float, help="порог апдейтов в секунду")
+    parser.add_argument("--max-rss-growth", type=float, help="порог роста памяти, MiB")
+    parser.add_argument("--json", action="store_true", help="отчет одной строкой JSON")
+    parser.add_argument("--verbose", action="store_true", help="показывать лог bot.py")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
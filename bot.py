@@ -1,10 +1,10 @@
 import os
 import json
+import time
+import signal
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional
-from enum import Enum
-from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
 from dotenv import load_dotenv
 
 # Импорты aiogram
@@ -14,10 +14,28 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQu
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 import asyncio
 
+# Модели данных и хранилище прогресса
+from models import UserStatus, AssignmentStatus, UserProgress, AnswerRef, USER_ID_MASK, split_user_key
+from progress_store import CachedSQLiteProgressStore, create_progress_store
+from fsm_storage import SQLiteStorage
+from content import CourseCatalog, Course
+from events import EventBus, EventType, ProgressEvent
+from activity import ActivityTracker
+from review_queue import ReviewQueue
+from scheduler import Scheduler, Timer
+from answer_store import AnswerStore
+from outbox import OutboundQueue, PRIORITY_CALLBACK
+from ordering import UserOrderingMiddleware, backpressure_middleware
+from ingest import WebhookIngest
+from tenants import Tenant, TenantRegistry, TenantMiddleware, TenantUsage, TenantRequestHandler, current_tenant, load_tenants_file
+from metrics import MetricsRegistry, UpdateMetricsMiddleware, HandlerMetricsMiddleware, TelegramAPIMetrics
+
 # Загрузка переменных окружения
 load_dotenv()
 
@@ -34,6 +52,98 @@ else:
     # Fallback для локальной разработки
     WEBHOOK_URL = None
 
+# Количество процессов-воркеров в режиме webhook
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+# Регистрировать webhook при запуске (в многопроцессном режиме - только один воркер)
+WEBHOOK_REGISTER = os.getenv("WEBHOOK_REGISTER", "1") == "1"
+
+# Номер воркера и число воркеров в многопроцессном режиме (задает multiworker)
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
+
+# Настройки хранилища прогресса: memory, sqlite, sqlite-cached или eventlog
+# (при WEB_WORKERS > 1 sqlite работает как sqlite-cached, memory не поддерживается)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+PROGRESS_BACKEND = os.getenv("PROGRESS_BACKEND", "sqlite")
+PROGRESS_DB_PATH = os.getenv("PROGRESS_DB_PATH", os.path.join(DATA_DIR, "progress.sqlite3"))
+PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "1.0"))
+# sqlite-cached: записи не загружаются целиком, в памяти - LRU на PROGRESS_CACHE_SIZE
+# записей (порядка 300 байт каждая) и отрицательный кэш неизвестных пользователей;
+# PROGRESS_CACHE_MODE - write-back (пакетом раз в интервал) или write-through
+PROGRESS_CACHE_SIZE = int(os.getenv("PROGRESS_CACHE_SIZE", "20000"))
+PROGRESS_NEGATIVE_CACHE_SIZE = int(os.getenv("PROGRESS_NEGATIVE_CACHE_SIZE", "10000"))
+PROGRESS_CACHE_MODE = os.getenv("PROGRESS_CACHE_MODE", "write-back")
+# Журнал событий у каждого воркера свой: пользователи закреплены за воркерами
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", os.path.join(DATA_DIR, "eventlog", f"worker-{WORKER_INDEX}"))
+SNAPSHOT_EVERY_EVENTS = int(os.getenv("SNAPSHOT_EVERY_EVENTS", "100000"))
+
+# Очередь заданий на проверку (общая для процессов бота и админки); результаты
+# проверки из админки бот забирает раз в REVIEW_RESULTS_INTERVAL секунд
+REVIEW_DB_PATH = os.getenv("REVIEW_DB_PATH", os.path.join(DATA_DIR, "review_queue.sqlite3"))
+REVIEW_RESULTS_INTERVAL = float(os.getenv("REVIEW_RESULTS_INTERVAL", "2"))
+
+# Хранилище текстов ответов (в прогрессе остаются только ссылка и превью)
+ANSWER_STORE_DIR = os.getenv("ANSWER_STORE_DIR", os.path.join(DATA_DIR, "answers"))
+# Отметка о том, что ответы из старых записей прогресса уже перенесены
+INLINE_ANSWERS_MOVED = os.path.join(ANSWER_STORE_DIR, "inline-answers-moved")
+ANSWER_PREVIEW_CHARS = int(os.getenv("ANSWER_PREVIEW_CHARS", "100"))
+
+# Настройки FSM-хранилища (состояния диалогов)
+FSM_BACKEND = os.getenv("FSM_BACKEND", "sqlite")
+FSM_STORAGE_DIR = os.getenv("FSM_STORAGE_DIR", os.path.join(DATA_DIR, "fsm"))
+FSM_SHARDS = int(os.getenv("FSM_SHARDS", "8"))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "60"))
+
+# Адрес Bot API (для нагрузочных тестов - локальная заглушка, см. benchmarks/loadtest.py)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE")
+
+# Контент курсов: файлы <course_id>.json или .yaml в CONTENT_DIR,
+# изменения подхватываются раз в CONTENT_WATCH_INTERVAL секунд (0 - выключено)
+CONTENT_DIR = os.getenv("CONTENT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "content"))
+COURSE_ID = os.getenv("COURSE_ID") or None
+CONTENT_WATCH_INTERVAL = float(os.getenv("CONTENT_WATCH_INTERVAL", "5"))
+
+# Несколько ботов-курсов в одном процессе: JSON-файл со списком арендаторов
+# [{"id", "namespace", "token" или "token_env", "course"}]. Основной бот
+# (TELEGRAM_BOT_TOKEN) - арендатор "default" с номером 0 на /webhook,
+# остальные принимают апдейты на /webhook/<id>
+TENANTS_FILE = os.getenv("TENANTS_FILE")
+DEFAULT_TENANT = "default"
+# Как часто пересчитывать память арендаторов для /metrics, секунды
+TENANT_MEASURE_INTERVAL = float(os.getenv("TENANT_MEASURE_INTERVAL", "60"))
+
+# Размер пула соединений к Telegram API (общий для всех исходящих запросов)
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "100"))
+
+# Ограничения обработки апдейтов: одновременно выполняемые и ожидающие
+MAX_IN_FLIGHT_UPDATES = int(os.getenv("MAX_IN_FLIGHT_UPDATES", "256"))
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "5000"))
+
+# Прием webhook: inline - обработка внутри HTTP-запроса, queued - ответ 200
+# сразу и обработка из внутренней очереди с отсевом повторов по update_id
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "inline")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(MAX_IN_FLIGHT_UPDATES)))
+INGEST_DEDUPE_WINDOW = int(os.getenv("INGEST_DEDUPE_WINDOW", "100000"))
+
+# Напоминания и рассылка уроков по расписанию. Таймеры у каждого воркера
+# свои: пользователи закреплены за воркерами
+SCHEDULER_DB_PATH = os.getenv("SCHEDULER_DB_PATH", os.path.join(DATA_DIR, "scheduler", f"worker-{WORKER_INDEX}.sqlite3"))
+# Напомнить о курсе после стольких часов без активности (0 - без напоминаний);
+# каждое следующее напоминание - через вдвое больший срок, всего не больше REMINDER_MAX
+REMINDER_AFTER_HOURS = float(os.getenv("REMINDER_AFTER_HOURS", "48"))
+REMINDER_MAX = int(os.getenv("REMINDER_MAX", "3"))
+# Присылать следующий урок раз в столько часов после начала курса (0 - не присылать)
+DRIP_INTERVAL_HOURS = float(os.getenv("DRIP_INTERVAL_HOURS", "72"))
+# Сколько таймеров в секунду может сработать (общий лимит Telegram - около 30 сообщений)
+SCHEDULER_RATE = float(os.getenv("SCHEDULER_RATE", "10"))
+
+# Активность по времени для детальной статистики: сколько дней истории
+# хранить и куда раз в ACTIVITY_SAVE_INTERVAL секунд сохранять ее (файлы
+# воркеров читает процесс админки, они же восстанавливают ее после перезапуска)
+ACTIVITY_DAYS = int(os.getenv("ACTIVITY_DAYS", "90"))
+ACTIVITY_PATH = os.getenv("ACTIVITY_PATH", os.path.join(DATA_DIR, "activity", f"worker-{WORKER_INDEX}.json"))
+ACTIVITY_SAVE_INTERVAL = float(os.getenv("ACTIVITY_SAVE_INTERVAL", "60"))
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -41,198 +151,140 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Структуры данных
-class UserStatus(Enum):
-    NOT_STARTED = "not_started"
-    IN_PROGRESS = "in_progress"
-    COMPLETED = "completed"
-
-class AssignmentStatus(Enum):
-    NOT_SUBMITTED = "not_submitted"
-    SUBMITTED = "submitted"
-    CHECKED = "checked"
-
-@dataclass
-class UserProgress:
-    user_id: int
-    current_lesson: int = 1
-    completed_lessons: List[int] = None
-    submitted_assignments: Dict[int, str] = None  # lesson_id: answer
-    checked_assignments: Dict[int, bool] = None  # lesson_id: is_checked
-    status: UserStatus = UserStatus.NOT_STARTED
-    
-    def __post_init__(self):
-        if self.completed_lessons is None:
-            self.completed_lessons = []
-        if self.submitted_assignments is None:
-            self.submitted_assignments = {}
-        if self.checked_assignments is None:
-            self.checked_assignments = {}
-
-@dataclass
-class Lesson:
-    id: int
-    title: str
-    description: str
-    video_url: Optional[str] = None
-    text_content: Optional[str] = None
-    assignment_question: Optional[str] = None
-    assignment_hint: Optional[str] = None
-
-# Данные курса про Александра Чижова
-COURSE_TITLE = "Курс 'Методы анализа от Александра Чижова'"
-COURSE_DESCRIPTION = """
-🎓 Этот курс основан на методиках Александра Чижова - эксперта в области аналитики и принятия решений.
-
-📚 Что вы узнаете:
-• Методы системного анализа
-• Принятие решений в условиях неопределенности
-• Аналитические инструменты для бизнеса
-• Практические кейсы от Александра
-
-⏰ Длительность: 14 дней
-📊 Уровень: от начинающего до продвинутого
-"""
-
-LESSONS = [
-    Lesson(
-        id=1,
-        title="Введение в аналитическое мышление",
-        description="Основные принципы аналитического подхода по методу Александра Чижова",
-        text_content="""
-📖 **Урок 1: Введение в аналитическое мышление**
-
-Александр Чижов подчеркивает, что аналитическое мышление - это не просто набор инструментов, а система восприятия реальности.
-
-**Ключевые принципы:**
-1. **Системность** - любой объект рассматривается как часть системы
-2. **Многофакторность** - учет всех возможных влияющих факторов
-3. **Динамичность** - анализ изменений во времени
-4. **Практичность** - каждый анализ должен приводить к конкретным действиям
-
-**Мысли Александра:**
-> "Анализ без действия - это просто философия. Действие без анализа - это авантюра."
-
-**Пример из практики:**
-Как Александр помог компании увеличить прибыль на 30% через анализ клиентских путей.
-        """,
-        video_url="https://example.com/video1.mp4",
-        assignment_question="Опишите проблему в вашей работе/бизнесе, которую можно решить аналитическим подходом. Какие факторы нужно учесть?",
-        assignment_hint="Попробуйте разбить проблему на составляющие части"
-    ),
-    Lesson(
-        id=2,
-        title="Системный анализ",
-        description="Как видеть целое через части и связи между ними",
-        text_content="""
-📖 **Урок 2: Системный анализ по методу Чижова**
-
-Александр учит, что мир состоит не из объектов, а из связей между ними.
-
-**Методология:**
-1. **Выделение элементов системы**
-2. **Определение связей и взаимовлияний**
-3. **Анализ входов и выходов**
-4. **Поиск точек воздействия**
-
-**Инструменты:**
-• Диаграммы влияния
-• Карты стейкхолдеров
-• Модели потоков
-
-**Кейс Александра:**
-Как системный анализ помог оптимизировать логистическую цепочку и сократить издержки на 45%.
-        """,
-        video_url="https://example.com/video2.mp4",
-        assignment_question="Нарисуйте схему любой системы, с которой вы работаете (бизнес-процесс, проект и т.д.). Покажите основные элементы и связи.",
-        assignment_hint="Начните с определения границ системы"
-    ),
-    Lesson(
-        id=3,
-        title="Принятие решений в неопределенности",
-        description="Методы работы с рисками и неполными данными",
-        text_content="""
-📖 **Урок 3: Решения в условиях неопределенности**
-
-По словам Александра, "неопределенность - это не проблема, а условие работы".
-
-**Подходы:**
-1. **Сценарное планирование**
-2. **Анализ чувствительности**
-3. **Метод экспертных оценок**
-4. **Байесовское обновление**
-
-**Принцип Чижова:**
-> "Принимайте решения на основе лучшей доступной информации, но всегда имейте план Б, В и Г."
-
-**Практический пример:**
-Как Александр помог стартапу принять решение о выходе на новый рынок в условиях пандемии.
-        """,
-        video_url="https://example.com/video3.mp4",
-        assignment_question="Опишите решение, которое вам нужно принять. Какие факторы неопределенности существуют? Как можно их уменьшить?",
-        assignment_hint='Составьте таблицу "что если" для разных сценариев'
-    ),
-    Lesson(
-        id=4,
-        title="Аналитические инструменты",
-        description="Практические инструменты для ежедневной работы",
-        text_content="""
-📖 **Урок 4: Инструментарий аналитика**
-
-Александр собрал уникальную коллекцию инструментов, которые действительно работают.
-
-**Основные инструменты:**
-1. **PESTLE-анализ** для макросреды
-2. **SWOT-анализ 2.0** с динамическими факторами
-3. **Модель пяти сил Портера** с цифровыми корректировками
-4. **Матрица Эйзенхауэра** для приоритизации
-
-**Совет Александра:**
-> "Не используйте инструменты шаблонно. Адаптируйте их под свою конкретную задачу."
-
-**Результаты:**
-Компании, работающие с Александром, в среднем улучшают KPI на 25-40% после внедрения этих инструментов.
-        """,
-        video_url="https://example.com/video4.mp4",
-        assignment_question="Примените один из аналитических инструментов к вашему проекту. Что нового вы узнали?",
-        assignment_hint="Начните с самого простого - SWOT анализа"
-    ),
-    Lesson(
-        id=5,
-        title="Завершение и внедрение",
-        description="Как превратить анализ в конкретные действия и результаты",
-        text_content="""
-📖 **Урок 5: От анализа к действию**
-
-Финальный этап, на котором, по мнению Александра, "происходит магия".
-
-**Алгоритм внедрения:**
-1. **Формулировка конкретных действий**
-2. **Назначение ответственных**
-3. **Определение сроков и контрольных точек**
-4. **Система мониторинга результатов**
-
-**Заключительные слова Александра:**
-> "Анализ - это начало пути. Настоящая ценность создается только действиями. Начните с малого, но начните сегодня."
-
-**Успешные кейсы:**
-Истории 5 компаний, которые благодаря этим методикам достигли прорывных результатов.
-        """,
-        video_url="https://example.com/video5.mp4",
-        assignment_question="Составьте план внедрения одного изменения на основе пройденного курса. Что вы сделаете в первую очередь?",
-        assignment_hint="Разбейте план на конкретные шаги с датами"
-    )
-]
+# Курсы из файлов; экраны уроков и клавиатуры отрисованы заранее
+course_catalog = CourseCatalog(CONTENT_DIR, default_course=COURSE_ID)
+course_catalog.load()
+
+def current_course() -> Course:
+    """Текущая версия курса бота, чей апдейт обрабатывается (после обновления файлов - уже новая)"""
+    tenant = current_tenant.get()
+    return course_catalog.course(tenant.course_id if tenant else None)
+
+def user_key(user_id: int) -> int:
+    """Ключ пользователя в хранилищах с учетом бота, принявшего апдейт"""
+    tenant = current_tenant.get()
+    return tenant.user_key(user_id) if tenant else user_id
+
+# Хранилище данных пользователей
+# Бэкенд выбирается через PROGRESS_BACKEND: sqlite (по умолчанию) или memory
+user_progress_db = create_progress_store(
+    PROGRESS_BACKEND,
+    EVENT_LOG_DIR if PROGRESS_BACKEND == "eventlog" else PROGRESS_DB_PATH,
+    flush_interval=PROGRESS_FLUSH_INTERVAL,
+    snapshot_every=SNAPSHOT_EVERY_EVENTS,
+    cache_size=PROGRESS_CACHE_SIZE,
+    negative_cache_size=PROGRESS_NEGATIVE_CACHE_SIZE,
+    write_through=PROGRESS_CACHE_MODE == "write-through",
+)
+
+# События прогресса: журнал событий и статистика активности
+event_bus = EventBus()
+event_bus.subscribe(user_progress_db.record_event)
+
+# Активность по минутам, часам и дням в памяти фиксированного размера
+activity = ActivityTracker(days=ACTIVITY_DAYS)
+
+def record_activity(event: ProgressEvent):
+    # Админка ведет основной бот: события арендаторов в его статистику не попадают
+    if event.user_id <= USER_ID_MASK:
+        activity.record(event)
+
+event_bus.subscribe(record_activity)
+
+# Тексты ответов вне записей прогресса
+answer_store = AnswerStore(ANSWER_STORE_DIR, preview_chars=ANSWER_PREVIEW_CHARS)
+
+# Сданные задания в порядке сдачи для проверки кураторами
+review_queue = ReviewQueue(REVIEW_DB_PATH)
 
-# Хранилище данных пользователей (в памяти, для демонстрации)
-# В реальном приложении лучше использовать базу данных
-user_progress_db: Dict[int, UserProgress] = {}
+# Таймеры напоминаний неактивным и рассылки уроков
+scheduler = Scheduler(SCHEDULER_DB_PATH, rate=SCHEDULER_RATE)
+TIMER_REMINDER = "reminder"
+TIMER_DRIP = "drip"
+# События, после которых напоминание откладывается заново
+ACTIVITY_EVENTS = (
+    EventType.STATUS_CHANGED,
+    EventType.LESSON_VIEWED,
+    EventType.LESSON_COMPLETED,
+    EventType.ASSIGNMENT_SUBMITTED,
+)
+
+def schedule_user_timers(event: ProgressEvent):
+    """Отложить напоминание после активности пользователя, начать или снять рассылку уроков"""
+    if event.type == EventType.STATUS_CHANGED and event.current != UserStatus.IN_PROGRESS:
+        scheduler.cancel(event.user_id, TIMER_REMINDER)
+        scheduler.cancel(event.user_id, TIMER_DRIP)
+        return
+    if event.type == EventType.STATUS_CHANGED and DRIP_INTERVAL_HOURS > 0:
+        # Первый урок открывается сразу, со второго - по расписанию
+        scheduler.schedule(event.user_id, TIMER_DRIP, event.timestamp + DRIP_INTERVAL_HOURS * 3600, lesson_id=2)
+    if event.type in ACTIVITY_EVENTS and REMINDER_AFTER_HOURS > 0:
+        scheduler.schedule(event.user_id, TIMER_REMINDER, event.timestamp + REMINDER_AFTER_HOURS * 3600)
+
+event_bus.subscribe(schedule_user_timers)
+
+# Метрики обработки апдейтов и запросов к Telegram API (/metrics)
+metrics = MetricsRegistry()
 
 # Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+session = AiohttpSession(
+    api=TelegramAPIServer.from_base(TELEGRAM_API_BASE) if TELEGRAM_API_BASE else PRODUCTION,
+    limit=TELEGRAM_POOL_SIZE,
+)
+session.middleware(TelegramAPIMetrics(metrics))
+bot = Bot(token=BOT_TOKEN, session=session)
+
+# Боты-арендаторы делят сессию (пул соединений), dispatcher и хранилища
+tenants = TenantRegistry()
+tenants.add(Tenant(DEFAULT_TENANT, 0, bot, COURSE_ID))
+if TENANTS_FILE:
+    for entry in load_tenants_file(TENANTS_FILE):
+        tenants.add(Tenant(
+            entry["id"], entry["namespace"],
+            Bot(token=entry["token"], session=session),
+            entry.get("course"),
+        ))
+        # Курс арендатора должен существовать при запуске и не пропадать при обновлениях
+        course_catalog.require(entry.get("course"))
+tenant_usage = TenantUsage(tenants, metrics)
+outbox = OutboundQueue(max_concurrency=TELEGRAM_POOL_SIZE)
+if FSM_BACKEND == "sqlite":
+    storage = SQLiteStorage(FSM_STORAGE_DIR, shards=FSM_SHARDS, cache_ttl=FSM_CACHE_TTL)
+else:
+    storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
+# Апдейты одного пользователя обрабатываются по порядку, общее число ограничено
+update_ordering = UserOrderingMiddleware(
+    max_in_flight=MAX_IN_FLIGHT_UPDATES,
+    max_pending=MAX_PENDING_UPDATES,
+)
+# Метрики апдейта регистрируются первыми, чтобы учесть ожидание очереди
+dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+dp.update.outer_middleware(update_ordering)
+dp.update.outer_middleware(TenantMiddleware(tenants, metrics))
+
+async def prefetch_progress(handler, event: types.TelegramObject, data: Dict[str, Any]) -> Any:
+    """Прочитать запись пользователя из базы до обработчиков, не блокируя event loop"""
+    user = data.get("event_from_user")
+    if user is not None:
+        await user_progress_db.prefetch(user_key(user.id))
+    return await handler(event, data)
+
+# После TenantMiddleware: ключ пользователя зависит от арендатора
+dp.update.outer_middleware(prefetch_progress)
+
+handler_metrics = HandlerMetricsMiddleware(metrics)
+dp.message.middleware(handler_metrics)
+dp.callback_query.middleware(handler_metrics)
+metrics.register_collector("bot_outbox", "Очередь исходящих запросов", outbox.metrics)
+metrics.register_collector("bot_updates", "Очередность апдейтов пользователей", update_ordering.metrics)
+metrics.register_collector("bot_scheduler", "Таймеры напоминаний и рассылки уроков", scheduler.metrics)
+metrics.register_collector("bot_activity", "Статистика активности", activity.metrics)
+metrics.register_collector("bot_progress", "Хранилище прогресса", lambda: {"users": len(user_progress_db)})
+if isinstance(user_progress_db, CachedSQLiteProgressStore):
+    metrics.register_collector("bot_progress_cache", "Кэш записей прогресса", user_progress_db.metrics)
+
 # ========== СОСТОЯНИЯ ==========
 
 class CourseStates(StatesGroup):
@@ -246,39 +298,68 @@ def _create_progress_bar(percentage: float) -> str:
     filled = int(percentage / 100 * bars)
     return "█" * filled + "░" * (bars - filled)
 
+def emit_event(event_type: EventType, user_id: int, lesson_id: int = 0, previous=None, current=None,
+               answer: Optional[AnswerRef] = None):
+    """Отправить событие прогресса подписчикам"""
+    event_bus.emit(ProgressEvent(event_type, user_id, lesson_id, previous, current, answer=answer))
+
+def set_user_status(progress: UserProgress, status: UserStatus):
+    """Сменить статус пользователя с публикацией события"""
+    if progress.status == status:
+        return
+    previous = progress.status
+    progress.status = status
+    emit_event(EventType.STATUS_CHANGED, progress.user_id, previous=previous, current=status)
+
+def send_message(message: types.Message, text: str, reply_markup=None, parse_mode=None):
+    """Отправить новое сообщение в чат через очередь"""
+    return outbox.submit(
+        message.chat.id,
+        message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode),
+    )
+
+def edit_message(message: types.Message, text: str, reply_markup=None, parse_mode=None):
+    """Отредактировать сообщение через очередь (ждущие правки схлопываются)"""
+    return outbox.submit(
+        message.chat.id,
+        message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode),
+        key=(user_key(message.chat.id), message.message_id),
+    )
+
+def send_screen(message: types.Message, text: str, reply_markup=None, edit: bool = False, parse_mode='Markdown'):
+    """Показать экран: отредактировать текущее сообщение или отправить новое"""
+    if edit:
+        return edit_message(message, text, reply_markup=reply_markup, parse_mode=parse_mode)
+    return send_message(message, text, reply_markup=reply_markup, parse_mode=parse_mode)
+
+def parse_lesson_id(data: str) -> Optional[int]:
+    """Номер урока из callback_data вида <действие>_<номер>; None - испорченные данные"""
+    try:
+        lesson_id = int(data.rsplit("_", 1)[1])
+    except (IndexError, ValueError):
+        return None
+    return lesson_id if lesson_id >= 1 else None
+
+def answer_callback(callback: CallbackQuery, text: Optional[str] = None):
+    """Ответить на колбэк вне очереди сообщений чата"""
+    chat_id = callback.message.chat.id if callback.message else callback.from_user.id
+    return outbox.submit(chat_id, callback.answer(text), priority=PRIORITY_CALLBACK)
+
 # ========== ОБРАБОТЧИКИ КОМАНД ==========
 
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
     """Обработчик команды /start"""
     user = message.from_user
+    key = user_key(user.id)
     
-    if user.id not in user_progress_db:
-        user_progress_db[user.id] = UserProgress(user_id=user.id)
-    
-    welcome_message = f"""
-👋 Привет, {user.first_name}!
-
-{COURSE_DESCRIPTION}
-
-Автор курса: **Александр Чижов**
-• Эксперт в системном анализе
-• Более 15 лет практического опыта
-• Консультант Fortune 500 компаний
-• Автор методики "Практический анализ"
-
-Готовы начать обучение?
-    """
+    if key not in user_progress_db:
+        user_progress_db[key] = UserProgress(user_id=key)
+        emit_event(EventType.USER_REGISTERED, key)
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="🚀 Начать курс", callback_data="start_course")],
-            [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="profile")],
-            [InlineKeyboardButton(text="ℹ️ О курсе", callback_data="about_course")]
-        ]
-    )
+    welcome_message, keyboard = current_course().screens.welcome(user.first_name)
     
-    await message.answer(welcome_message, reply_markup=keyboard, parse_mode='Markdown')
+    send_message(message, welcome_message, reply_markup=keyboard, parse_mode='Markdown')
 
 @dp.message(Command("menu"))
 async def cmd_menu(message: types.Message):
@@ -295,502 +376,421 @@ async def cmd_progress(message: types.Message):
 @dp.callback_query(F.data == "main_menu")
 async def main_menu_callback(callback: CallbackQuery):
     """Главное меню"""
-    await show_main_menu(callback.message, callback.from_user.id, edit=True)
-    await callback.answer()
+    await show_main_menu(callback.message, user_key(callback.from_user.id), edit=True)
+    answer_callback(callback)
 
 @dp.callback_query(F.data == "start_course")
 async def start_course_callback(callback: CallbackQuery):
     """Начать курс"""
-    user = callback.from_user
-    progress = user_progress_db.get(user.id, UserProgress(user_id=user.id))
-    progress.status = UserStatus.IN_PROGRESS
-    user_progress_db[user.id] = progress
-    await show_lesson(callback.message, user.id, 1, edit=True)
-    await callback.answer()
+    key = user_key(callback.from_user.id)
+    progress = user_progress_db.get(key, UserProgress(user_id=key))
+    set_user_status(progress, UserStatus.IN_PROGRESS)
+    user_progress_db[key] = progress
+    await show_lesson(callback.message, key, 1, edit=True)
+    answer_callback(callback)
 
 @dp.callback_query(F.data == "profile")
 async def profile_callback(callback: CallbackQuery):
     """Показать прогресс"""
-    await show_progress(callback.message, callback.from_user.id, edit=True)
-    await callback.answer()
+    await show_progress(callback.message, user_key(callback.from_user.id), edit=True)
+    answer_callback(callback)
 
 @dp.callback_query(F.data == "about_course")
 async def about_course_callback(callback: CallbackQuery):
     """О курсе"""
-    await callback.message.edit_text(
-        COURSE_DESCRIPTION,
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="🚀 Начать обучение", callback_data="start_course")],
-                [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
-            ]
-        ),
-        parse_mode='Markdown'
-    )
-    await callback.answer()
+    text, keyboard = current_course().screens.about_course
+    edit_message(callback.message, text, reply_markup=keyboard, parse_mode='Markdown')
+    answer_callback(callback)
 
 @dp.callback_query(F.data.startswith("lesson_"))
 async def lesson_callback(callback: CallbackQuery):
     """Показать урок"""
-    lesson_id = int(callback.data.split("_")[1])
-    await show_lesson(callback.message, callback.from_user.id, lesson_id, edit=True)
-    await callback.answer()
+    lesson_id = parse_lesson_id(callback.data)
+    if lesson_id is None:
+        answer_callback(callback, "Урок не найден")
+        return
+    await show_lesson(callback.message, user_key(callback.from_user.id), lesson_id, edit=True)
+    answer_callback(callback)
 
 @dp.callback_query(F.data.startswith("submit_"))
 async def submit_assignment_callback(callback: CallbackQuery, state: FSMContext):
     """Сдать задание"""
-    lesson_id = int(callback.data.split("_")[1])
+    lesson_id = parse_lesson_id(callback.data)
+    if lesson_id is None:
+        answer_callback(callback, "Урок не найден")
+        return
+    prompt = current_course().screens.submit_prompt(lesson_id)
+    if prompt is None:
+        send_message(callback.message, "Урок не найден")
+        answer_callback(callback)
+        return
+    
     await state.set_state(CourseStates.awaiting_assignment_submission)
     await state.update_data(lesson_id=lesson_id)
     
-    lesson = LESSONS[lesson_id - 1]
-    
-    await callback.message.edit_text(
-        f"✍️ *Отправьте ваш ответ на задание:*\n\n{lesson.assignment_question}\n\n"
-        f"💡 *Подсказка:* {lesson.assignment_hint}\n\n"
-        "Просто напишите сообщение с вашим ответом в чат.",
-        parse_mode='Markdown'
-    )
-    await callback.answer()
+    edit_message(callback.message, prompt, parse_mode='Markdown')
+    answer_callback(callback)
 
 @dp.callback_query(F.data.startswith("check_"))
 async def check_assignment_callback(callback: CallbackQuery):
     """Проверить задание"""
-    lesson_id = int(callback.data.split("_")[1])
-    await show_submitted_assignment(callback.message, callback.from_user.id, lesson_id, edit=True)
-    await callback.answer()
+    lesson_id = parse_lesson_id(callback.data)
+    if lesson_id is None:
+        answer_callback(callback, "Урок не найден")
+        return
+    await show_submitted_assignment(callback.message, user_key(callback.from_user.id), lesson_id, edit=True)
+    answer_callback(callback)
 
 @dp.callback_query(F.data.startswith("complete_lesson_"))
 async def complete_lesson_callback(callback: CallbackQuery):
     """Завершить урок"""
-    lesson_id = int(callback.data.split("_")[2])
-    await complete_lesson(callback.message, callback.from_user.id, lesson_id, edit=True)
-    await callback.answer()
+    lesson_id = parse_lesson_id(callback.data)
+    if lesson_id is None:
+        answer_callback(callback, "Урок не найден")
+        return
+    await complete_lesson(callback.message, user_key(callback.from_user.id), lesson_id, edit=True)
+    answer_callback(callback)
 
 @dp.callback_query(F.data.startswith("assignment_"))
 async def assignment_callback(callback: CallbackQuery):
     """Показать задание"""
-    lesson_id = int(callback.data.split("_")[1])
-    await show_assignment(callback.message, callback.from_user.id, lesson_id, edit=True)
-    await callback.answer()
+    lesson_id = parse_lesson_id(callback.data)
+    if lesson_id is None:
+        answer_callback(callback, "Урок не найден")
+        return
+    await show_assignment(callback.message, user_key(callback.from_user.id), lesson_id, edit=True)
+    answer_callback(callback)
 
 @dp.callback_query(F.data == "about_author")
 async def about_author_callback(callback: CallbackQuery):
     """Об авторе"""
-    author_info = """
-👨‍🏫 *Александр Чижов*
-
-**Профессиональный путь:**
-• 15+ лет в аналитике и консалтинге
-• Работал с компаниями из Fortune 500
-• Основатель аналитического агентства "Системный подход"
-• Автор книги "Практический анализ для бизнеса"
-
-**Образование:**
-• МГУ, факультет вычислительной математики
-• MBA, Stanford Graduate School of Business
-• Сертифицированный специалист по data science
-
-**Философия:**
-> "Сложное нужно делать простым, а простое - понятным. Анализ должен служить действию."
-
-**Достижения:**
-• Помог 200+ компаниям оптимизировать процессы
-• Разработал уникальную методику системного анализа
-• Провел 500+ консультаций и воркшопов
-• Обучил более 5000 специалистов
-    """
-    
-    await callback.message.edit_text(
-        author_info,
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="📚 Начать курс", callback_data="start_course")],
-                [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
-            ]
-        ),
-        parse_mode='Markdown'
-    )
-    await callback.answer()
+    text, keyboard = current_course().screens.about_author
+    edit_message(callback.message, text, reply_markup=keyboard, parse_mode='Markdown')
+    answer_callback(callback)
 
 @dp.callback_query(F.data == "feedback")
 async def feedback_callback(callback: CallbackQuery):
     """Отзыв о курсе"""
-    await callback.message.edit_text(
+    edit_message(
+        callback.message,
         "📝 *Оставьте отзыв о курсе*\n\n"
         "Ваше мнение очень важно для нас! Напишите, что понравилось, "
         "а что можно улучшить. Это поможет сделать курс еще лучше!\n\n"
         "Просто отправьте ваше сообщение с отзывом в чат.",
         parse_mode='Markdown'
     )
-    await callback.answer()
+    answer_callback(callback)
 
 # ========== ОБРАБОТЧИКИ СООБЩЕНИЙ ==========
 
 @dp.message(CourseStates.awaiting_assignment_submission)
 async def handle_assignment_submission(message: types.Message, state: FSMContext):
     """Обработка сдачи домашнего задания"""
-    user = message.from_user
     user_data = await state.get_data()
     lesson_id = user_data.get('lesson_id')
     
     if not lesson_id:
-        await message.answer("Ошибка. Пожалуйста, попробуйте еще раз.")
+        send_message(message, "Ошибка. Пожалуйста, попробуйте еще раз.")
         await state.clear()
         return
     
-    progress = user_progress_db.get(user.id, UserProgress(user_id=user.id))
+    # Текст ответа уходит в хранилище ответов, в прогрессе - ссылка и превью
+    key = user_key(message.from_user.id)
+    answer = await answer_store.put(key, lesson_id, message.text)
+    progress = user_progress_db.get(key, UserProgress(user_id=key))
     
     # Сохраняем ответ
-    progress.submitted_assignments[lesson_id] = message.text
+    previous_status = progress.assignment_status(lesson_id)
+    progress.submitted_assignments[lesson_id] = answer
     progress.checked_assignments[lesson_id] = False
-    user_progress_db[user.id] = progress
+    user_progress_db[key] = progress
+    emit_event(
+        EventType.ASSIGNMENT_SUBMITTED, key, lesson_id,
+        previous=previous_status, current=AssignmentStatus.SUBMITTED, answer=answer,
+    )
+    await review_queue.enqueue(key, lesson_id)
     
     # Очищаем состояние
     await state.clear()
     
     # Отправляем подтверждение
-    confirmation_message = f"""
-✅ *Ваше задание к уроку {lesson_id} принято!*
-
-Александр или куратор проверят его в ближайшее время.
-
-💡 *Совет от Александра:*
-"Лучший способ научиться - это практика. Даже если ваш ответ не идеален, вы уже сделали важный шаг."
-
-📊 Проверить статус всех заданий можно в разделе "Мой прогресс".
-    """
+    confirmation_message, keyboard = current_course().screens.submission_confirmation(lesson_id)
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="📚 Следующий урок", callback_data=f"lesson_{lesson_id + 1}")],
-            [InlineKeyboardButton(text="📝 Посмотреть задание", callback_data=f"check_{lesson_id}")],
-            [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="profile")]
-        ]
-    )
-    
-    await message.answer(confirmation_message, reply_markup=keyboard, parse_mode='Markdown')
+    send_message(message, confirmation_message, reply_markup=keyboard, parse_mode='Markdown')
 
 @dp.message()
 async def handle_text(message: types.Message):
     """Обработка обычных текстовых сообщений"""
     if message.text and not message.text.startswith('/'):
-        await message.answer("Выберите раздел из меню:", reply_markup=get_main_menu_keyboard())
+        send_message(message, "Выберите раздел из меню:", reply_markup=get_main_menu_keyboard())
 
 # ========== ОСНОВНЫЕ ФУНКЦИИ ==========
 
 def get_main_menu_keyboard():
     """Клавиатура главного меню"""
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="📚 Продолжить обучение", callback_data="lesson_1")],
-            [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="profile")],
-            [InlineKeyboardButton(text="🏆 Домашние задания", callback_data="assignment_1")],
-            [InlineKeyboardButton(text="👨‍🏫 Об авторе", callback_data="about_author")]
-        ]
-    )
+    return current_course().screens.main_menu_keyboard
 
 async def show_main_menu(message: types.Message, user_id: int = None, edit: bool = False):
     """Показать главное меню"""
     if not user_id and message:
-        user_id = message.from_user.id
+        user_id = user_key(message.from_user.id)
     
     message_text = "🏠 *Главное меню курса*\nВыберите действие:"
     keyboard = get_main_menu_keyboard()
     
-    if edit:
-        await message.edit_text(message_text, reply_markup=keyboard, parse_mode='Markdown')
-    else:
-        await message.answer(message_text, reply_markup=keyboard, parse_mode='Markdown')
+    send_screen(message, message_text, keyboard, edit=edit)
 
 async def show_progress(message: types.Message, user_id: int = None, edit: bool = False):
     """Показать прогресс пользователя"""
     if not user_id and message:
-        user_id = message.from_user.id
+        user_id = user_key(message.from_user.id)
     
     progress = user_progress_db.get(user_id, UserProgress(user_id=user_id))
     
+    course = current_course()
     completed = len(progress.completed_lessons)
-    total = len(LESSONS)
+    total = course.total
     percentage = (completed / total * 100) if total > 0 else 0
     
     submitted = len(progress.submitted_assignments)
     checked = sum(1 for checked in progress.checked_assignments.values() if checked)
     
-    progress_text = f"""
-📊 *Ваш прогресс*
-
-🎯 **Прогресс по курсу:**
-{_create_progress_bar(percentage)} {percentage:.1f}%
-✅ Пройдено уроков: {completed}/{total}
-
-📝 **Домашние задания:**
-📤 Сдано: {submitted}/{total}
-✅ Проверено: {checked}/{total}
-
-🏆 **Текущий статус:** {progress.status.value.replace('_', ' ').title()}
-📖 **Текущий урок:** {progress.current_lesson}/{total}
-
-💡 *Продолжайте в том же духе! Каждый урок приближает вас к результату.*
-    """
-    
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="📚 Продолжить обучение", callback_data=f"lesson_{progress.current_lesson}")],
-            [InlineKeyboardButton(text="📝 Мои задания", callback_data=f"assignment_{progress.current_lesson}")],
-            [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
-        ]
+    progress_text, keyboard = course.screens.progress(
+        bar=_create_progress_bar(percentage),
+        percentage=percentage,
+        completed=completed,
+        submitted=submitted,
+        checked=checked,
+        status=progress.status.value.replace('_', ' ').title(),
+        current_lesson=progress.current_lesson,
     )
     
-    if edit:
-        await message.edit_text(progress_text, reply_markup=keyboard, parse_mode='Markdown')
-    else:
-        await message.answer(progress_text, reply_markup=keyboard, parse_mode='Markdown')
+    send_screen(message, progress_text, keyboard, edit=edit)
 
 async def show_lesson(message: types.Message, user_id: int, lesson_id: int, edit: bool = False):
     """Показать урок"""
     progress = user_progress_db.get(user_id, UserProgress(user_id=user_id))
+    course = current_course()
+    screen = course.screens.lesson(lesson_id)
     
-    if lesson_id < 1 or lesson_id > len(LESSONS):
+    if screen is None:
         # Отправляем сообщение об ошибке, если это новый запрос
         if not edit:
-            await message.answer("Урок не найден")
+            send_message(message, "Урок не найден")
         return
     
-    lesson = LESSONS[lesson_id - 1]
     progress.current_lesson = lesson_id
     user_progress_db[user_id] = progress
+    emit_event(EventType.LESSON_VIEWED, user_id, lesson_id)
     
-    # Формируем сообщение урока
-    lesson_message = f"""
-📖 *Урок {lesson_id}: {lesson.title}*
-
-{lesson.text_content}
-
-🎬 *Видео-материал:* {lesson.video_url if lesson.video_url else "Скоро будет добавлено"}
-    """
-    
-    # Создаем клавиатуру
-    keyboard_buttons = []
-    
-    if lesson.assignment_question:
-        keyboard_buttons.append([InlineKeyboardButton(
-            text="📝 Домашнее задание", 
-            callback_data=f"submit_{lesson_id}"
-        )])
-    
-    # Кнопки навигации
-    nav_buttons = []
-    if lesson_id > 1:
-        nav_buttons.append(InlineKeyboardButton(
-            text="◀️ Предыдущий", 
-            callback_data=f"lesson_{lesson_id - 1}"
-        ))
-    
-    if lesson_id < len(LESSONS):
-        nav_buttons.append(InlineKeyboardButton(
-            text="Следующий ▶️", 
-            callback_data=f"lesson_{lesson_id + 1}"
-        ))
-    
-    if nav_buttons:
-        keyboard_buttons.append(nav_buttons)
-    
-    keyboard_buttons.extend([
-        [InlineKeyboardButton(text="✅ Отметить как пройденный", callback_data=f"complete_lesson_{lesson_id}")],
-        [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="profile")],
-        [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
-    ])
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    parts, keyboard = screen
     
-    # Отправляем или редактируем сообщение
-    if edit:
-        await message.edit_text(lesson_message, reply_markup=keyboard, parse_mode='Markdown')
-    else:
-        await message.answer(lesson_message, reply_markup=keyboard, parse_mode='Markdown')
+    # Отправляем или редактируем сообщение; длинный урок - несколькими
+    # сообщениями, клавиатура под последним
+    send_screen(message, parts[0], keyboard if len(parts) == 1 else None, edit=edit)
+    for index, part in enumerate(parts[1:], 2):
+        send_message(message, part, reply_markup=keyboard if index == len(parts) else None, parse_mode='Markdown')
 
 async def show_assignment(message: types.Message, user_id: int, lesson_id: int, edit: bool = False):
     """Показать домашнее задание"""
     progress = user_progress_db.get(user_id, UserProgress(user_id=user_id))
+    course = current_course()
+    lesson = course.lesson(lesson_id)
     
-    if lesson_id < 1 or lesson_id > len(LESSONS):
+    if lesson is None:
         # Если это callback, отвечаем всплывающим сообщением
         if edit:
             # Для edit режима отправляем новое сообщение
-            await message.answer("Урок не найден")
+            send_message(message, "Урок не найден")
         return
     
-    lesson = LESSONS[lesson_id - 1]
-    
     if not lesson.assignment_question:
-        if edit:
-            await message.edit_text("Для этого урока нет задания")
-        else:
-            await message.answer("Для этого урока нет задания")
+        send_screen(message, "Для этого урока нет задания", edit=edit, parse_mode=None)
         return
     
-    assignment_status = "❌ Не сдано"
-    if lesson_id in progress.submitted_assignments:
-        assignment_status = "📤 Сдано (ожидает проверки)" if not progress.checked_assignments.get(lesson_id) else "✅ Проверено"
-    
-    assignment_message = f"""
-📝 *Домашнее задание к уроку {lesson_id}*
-
-**Тема:** {lesson.title}
-
-**Задание:**
-{lesson.assignment_question}
-
-💡 *Подсказка от Александра:*
-{lesson.assignment_hint}
-
-**Статус:** {assignment_status}
-    """
-    
-    keyboard_buttons = []
-    
-    if lesson_id not in progress.submitted_assignments:
-        keyboard_buttons.append([InlineKeyboardButton(
-            text="📤 Сдать задание", 
-            callback_data=f"submit_{lesson_id}"
-        )])
-    
-    if lesson_id in progress.submitted_assignments:
-        keyboard_buttons.append([InlineKeyboardButton(
-            text="👀 Посмотреть мой ответ", 
-            callback_data=f"check_{lesson_id}"
-        )])
-    
-    keyboard_buttons.extend([
-        [InlineKeyboardButton(text="📚 Вернуться к уроку", callback_data=f"lesson_{lesson_id}")],
-        [InlineKeyboardButton(text="📊 Все задания", callback_data="assignment_1")],
-        [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
-    ])
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    submitted = lesson_id in progress.submitted_assignments
+    checked = bool(progress.checked_assignments.get(lesson_id))
+    screen = course.screens.assignment(lesson_id, submitted, checked)
+    if screen is None:
+        send_message(message, "Урок не найден")
+        return
+    assignment_message, keyboard = screen
     
-    if edit:
-        await message.edit_text(assignment_message, reply_markup=keyboard, parse_mode='Markdown')
-    else:
-        await message.answer(assignment_message, reply_markup=keyboard, parse_mode='Markdown')
+    send_screen(message, assignment_message, keyboard, edit=edit)
 
 async def show_submitted_assignment(message: types.Message, user_id: int, lesson_id: int, edit: bool = False):
     """Показать сданное задание"""
     progress = user_progress_db.get(user_id, UserProgress(user_id=user_id))
     
-    answer = progress.submitted_assignments.get(lesson_id, "")
+    answer = await load_answer(progress, lesson_id)
     
     if not answer:
-        if edit:
-            await message.edit_text("Задание еще не сдано")
-        else:
-            await message.answer("Задание еще не сдано")
+        send_screen(message, "Задание еще не сдано", edit=edit, parse_mode=None)
         return
     
     is_checked = progress.checked_assignments.get(lesson_id, False)
-    status = "✅ Проверено" if is_checked else "📤 Ожидает проверки"
-    
-    message_text = f"""
-📝 *Ваш ответ к уроку {lesson_id}*
-
-**Статус:** {status}
-
-**Ваш ответ:**
-{answer[:1500]}{'...' if len(answer) > 1500 else ''}
-    """
-    
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="📚 Вернуться к уроку", callback_data=f"lesson_{lesson_id}")],
-            [InlineKeyboardButton(text="📝 Все задания", callback_data="assignment_1")],
-            [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
-        ]
-    )
+    message_text, keyboard = current_course().screens.answer(lesson_id, is_checked, answer)
     
-    if edit:
-        await message.edit_text(message_text, reply_markup=keyboard, parse_mode='Markdown')
-    else:
-        await message.answer(message_text, reply_markup=keyboard, parse_mode='Markdown')
+    send_screen(message, message_text, keyboard, edit=edit)
 
 async def complete_lesson(message: types.Message, user_id: int, lesson_id: int, edit: bool = False):
     """Отметить урок как пройденный"""
     progress = user_progress_db.get(user_id, UserProgress(user_id=user_id))
+    course = current_course()
+    
+    # Отмечаются только уроки курса: номер из колбэка может быть испорчен
+    if course.lesson(lesson_id) is None:
+        send_message(message, "Урок не найден")
+        return
     
     if lesson_id not in progress.completed_lessons:
         progress.completed_lessons.append(lesson_id)
         user_progress_db[user_id] = progress
+        emit_event(EventType.LESSON_COMPLETED, user_id, lesson_id)
     
     # Проверяем, завершен ли весь курс
-    if len(progress.completed_lessons) == len(LESSONS):
-        progress.status = UserStatus.COMPLETED
-        
-        completion_message = f"""
-🏆 *Поздравляем!*
-
-Вы успешно завершили курс "Методы анализа от Александра Чижова"!
-
-🎯 **Ваши достижения:**
-• Освоили {len(LESSONS)} ключевых методик
-• Выполнили {len(progress.submitted_assignments)} практических заданий
-• Приобрели навыки системного анализа
-
-💪 **Слова Александра:**
-> "Знание становится силой только тогда, когда применяется на практике. Вы сделали первый важный шаг. Продолжайте применять эти методы в своей работе!"
-
-📚 **Что дальше?**
-• Повторите сложные моменты
-• Примените методики к реальным задачам
-• Делитесь результатами с комьюнити
-
-Сертификат о прохождении курса будет отправлен вам в течение 24 часов.
-        """
+    if len(progress.completed_lessons) >= course.total:
+        set_user_status(progress, UserStatus.COMPLETED)
+        user_progress_db[user_id] = progress
         
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="📊 Итоговый прогресс", callback_data="profile")],
-                [InlineKeyboardButton(text="📝 Все задания", callback_data="assignment_1")],
-                [InlineKeyboardButton(text="👨‍🏫 Оставить отзыв", callback_data="feedback")]
-            ]
-        )
+        completion_message, keyboard = course.screens.completion(len(progress.submitted_assignments))
         
-        if edit:
-            await message.edit_text(completion_message, reply_markup=keyboard, parse_mode='Markdown')
-        else:
-            await message.answer(completion_message, reply_markup=keyboard, parse_mode='Markdown')
+        send_screen(message, completion_message, keyboard, edit=edit)
     else:
         # Отправляем всплывающее уведомление
         if hasattr(message, 'answer'):
-            await message.answer(f"Урок {lesson_id} отмечен как пройденный! ✅")
+            send_message(message, f"Урок {lesson_id} отмечен как пройденный! ✅")
         
         # Показываем следующий урок
-        next_lesson = lesson_id + 1 if lesson_id < len(LESSONS) else lesson_id
+        next_lesson = lesson_id + 1 if lesson_id < course.total else lesson_id
         if edit:
             await show_lesson(message, user_id, next_lesson, edit=True)
         else:
             await show_lesson(message, user_id, next_lesson)
 
+async def load_answer(progress: UserProgress, lesson_id: int) -> str:
+    """Полный текст ответа: из хранилища ответов или из самой записи"""
+    ref = progress.answer_ref(lesson_id)
+    if ref is None:
+        return progress.submitted_assignments.get(lesson_id, "")
+    return await answer_store.get(ref)
+
+def read_answer(progress: UserProgress, lesson_id: int) -> str:
+    """То же, что load_answer, но синхронно - для выгрузок в отдельном потоке"""
+    ref = progress.answer_ref(lesson_id)
+    if ref is None:
+        return progress.submitted_assignments.get(lesson_id, "")
+    return answer_store.read(ref.handle)
+
+async def apply_review_result(user_id: int, lesson_id: int):
+    """Результат проверки из админки"""
+    await user_progress_db.prefetch(user_id)
+    mark_assignment_checked(user_id, lesson_id)
+
+def mark_assignment_checked(user_id: int, lesson_id: int) -> bool:
+    """Отметить сданное задание как проверенное"""
+    progress = user_progress_db.get(user_id)
+    if progress is None or progress.assignment_status(lesson_id) != AssignmentStatus.SUBMITTED:
+        return False
+    
+    progress.checked_assignments[lesson_id] = True
+    user_progress_db[user_id] = progress
+    emit_event(
+        EventType.ASSIGNMENT_CHECKED, user_id, lesson_id,
+        previous=AssignmentStatus.SUBMITTED, current=AssignmentStatus.CHECKED,
+    )
+    return True
+
+# ========== НАПОМИНАНИЯ И РАССЫЛКА УРОКОВ ==========
+
+async def timer_target(timer: Timer):
+    """Арендатор, курс и прогресс пользователя таймера; None, если курс он не проходит"""
+    tenant = tenants.for_key(timer.user_id)
+    await user_progress_db.prefetch(timer.user_id)
+    progress = user_progress_db.get(timer.user_id)
+    if tenant is None or progress is None or progress.status != UserStatus.IN_PROGRESS:
+        return None
+    course = course_catalog.courses().get(tenant.course_id or course_catalog.default_course)
+    if course is None:
+        return None
+    return tenant, course, progress
+
+def send_scheduled(tenant: Tenant, key: int, text: str, lesson_id: int):
+    """Отправить сообщение планировщика с кнопкой перехода к уроку"""
+    chat_id = split_user_key(key)[1]
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📖 Открыть урок", callback_data=f"lesson_{lesson_id}")]
+    ])
+    return outbox.submit(chat_id, tenant.bot.send_message(chat_id, text, reply_markup=keyboard))
+
+async def fire_reminder(timer: Timer) -> Optional[Timer]:
+    """Напомнить неактивному пользователю, на каком уроке он остановился"""
+    target = await timer_target(timer)
+    if target is None:
+        return None
+    tenant, course, progress = target
+    lesson = course.lesson(progress.current_lesson)
+    if lesson is None:
+        return None
+    
+    send_scheduled(tenant, timer.user_id, f"👋 Вы остановились на уроке {lesson.id}: {lesson.title}\nПродолжим?", lesson.id)
+    
+    attempt = timer.attempt + 1
+    if attempt >= REMINDER_MAX:
+        return None
+    return Timer(timer.user_id, TIMER_REMINDER, time.time() + REMINDER_AFTER_HOURS * 3600 * 2 ** attempt, attempt=attempt)
+
+async def fire_drip(timer: Timer) -> Optional[Timer]:
+    """Прислать следующий урок по расписанию курса"""
+    target = await timer_target(timer)
+    if target is None:
+        return None
+    tenant, course, progress = target
+    lesson = course.lesson(timer.lesson_id)
+    if lesson is None:
+        return None
+    
+    # Кто уже дошел до урока сам, напоминание о нем не получает
+    if progress.current_lesson < lesson.id and lesson.id not in progress.completed_lessons:
+        send_scheduled(tenant, timer.user_id, f"📬 Открыт урок {lesson.id}: {lesson.title}", lesson.id)
+    
+    if lesson.id >= course.total:
+        return None
+    return Timer(timer.user_id, TIMER_DRIP, time.time() + DRIP_INTERVAL_HOURS * 3600, lesson_id=lesson.id + 1)
+
+scheduler.handler(TIMER_REMINDER, fire_reminder)
+scheduler.handler(TIMER_DRIP, fire_drip)
+
 # ========== WEBHOOK НАСТРОЙКИ ==========
 
+def tenant_webhook_url(tenant: Tenant) -> str:
+    """Адрес webhook бота: основной на /webhook, остальные на /webhook/<id>"""
+    return WEBHOOK_URL if tenant.id == DEFAULT_TENANT else f"{WEBHOOK_URL}/{tenant.id}"
+
 async def on_startup(bot: Bot):
     """Установка webhook при запуске"""
-    if WEBHOOK_URL:
-        webhook_info = await bot.get_webhook_info()
-        if webhook_info.url != WEBHOOK_URL:
-            await bot.set_webhook(
-                url=WEBHOOK_URL,
-                drop_pending_updates=True
-            )
-            logger.info(f"Webhook установлен на {WEBHOOK_URL}")
-        else:
-            logger.info("Webhook уже установлен")
+    if WEBHOOK_URL and not WEBHOOK_REGISTER:
+        logger.info("Регистрация webhook выполняется другим процессом")
+    elif WEBHOOK_URL:
+        for tenant in tenants:
+            url = tenant_webhook_url(tenant)
+            webhook_info = await tenant.bot.get_webhook_info()
+            if webhook_info.url != url:
+                await tenant.bot.set_webhook(
+                    url=url,
+                    drop_pending_updates=True
+                )
+                logger.info(f"Webhook {tenant.id} установлен на {url}")
+            else:
+                logger.info(f"Webhook {tenant.id} уже установлен")
     else:
         logger.warning("WEBHOOK_URL не задан. Работаю в polling режиме.")
 
 async def on_shutdown(bot: Bot):
     """Удаление webhook при остановке"""
-    if WEBHOOK_URL:
-        await bot.delete_webhook()
+    if WEBHOOK_URL and WEBHOOK_REGISTER:
+        for tenant in tenants:
+            await tenant.bot.delete_webhook()
         logger.info("Webhook удален")
 
 async def health_check(request):
@@ -801,38 +801,186 @@ async def handle_main(request):
     """Корневой endpoint"""
     return web.Response(text="Telegram Bot is running! Use /start in Telegram.", status=200)
 
+def owns_user(key: int) -> bool:
+    """Пользователь закреплен за этим воркером (фронт multiworker выбирает воркер по id в Telegram)"""
+    return split_user_key(key)[1] % WORKER_COUNT == WORKER_INDEX
+
+async def start_storage():
+    """Загрузка прогресса и запуск фоновых задач хранилищ"""
+    await user_progress_db.start()
+    await answer_store.start()
+    # Разовые переносы данных в общих базах делает только воркер 0:
+    # multiworker запускает остальные воркеры после него
+    if WORKER_INDEX == 0 and not os.path.exists(INLINE_ANSWERS_MOVED):
+        await move_inline_answers()
+    await review_queue.start(backfill=pending_reviews if WORKER_INDEX == 0 else None)
+    await review_queue.watch_results(apply_review_result, REVIEW_RESULTS_INTERVAL, WORKER_INDEX, WORKER_COUNT)
+    if isinstance(storage, SQLiteStorage):
+        await storage.start()
+
+# Сколько записей из памяти обходить между передачами управления event loop
+SCAN_BATCH = 10000
+
+async def scan_progress(collect: Callable[[Iterable[UserProgress]], List[Any]]) -> List[Any]:
+    """Собрать collect(записи) по всем записям прогресса, не занимая event loop надолго
+
+    sqlite-cached читает базу своим соединением в потоке. Остальные бэкенды
+    держат записи в словаре, и обход его из потока может совпасть с записью
+    обработчика, поэтому ключи копируются, а записи обходятся в event loop
+    пачками по SCAN_BATCH.
+    """
+    if isinstance(user_progress_db, CachedSQLiteProgressStore):
+        return await asyncio.to_thread(collect, user_progress_db.values())
+    keys = list(user_progress_db.keys())
+    result: List[Any] = []
+    for start in range(0, len(keys), SCAN_BATCH):
+        batch = (user_progress_db.get(key) for key in keys[start:start + SCAN_BATCH])
+        result.extend(collect(progress for progress in batch if progress is not None))
+        await asyncio.sleep(0)
+    return result
+
+async def move_inline_answers():
+    """Перенести ответы, сохраненные прямо в записях, в хранилище ответов (один раз)"""
+    def find_inline(progresses):
+        return [
+            (progress, lesson_id, progress.submitted_assignments[lesson_id])
+            for progress in progresses
+            if progress.submitted_mask
+            for lesson_id in progress.submitted_assignments
+            if progress.answer_ref(lesson_id) is None
+        ]
+    
+    inline = await scan_progress(find_inline)
+    if inline:
+        def write_answers():
+            return [answer_store.append(progress.user_id, lesson_id, text) for progress, lesson_id, text in inline]
+        
+        for (progress, lesson_id, _), answer in zip(inline, await asyncio.to_thread(write_answers)):
+            progress.submitted_assignments[lesson_id] = answer
+            # Запись, прочитанная обходом, может не быть в памяти хранилища - записываем целиком
+            user_progress_db[progress.user_id] = progress
+            # Журнал событий восстанавливает записи только по событиям
+            emit_event(EventType.ANSWER_MOVED, progress.user_id, lesson_id, answer=answer)
+        await user_progress_db.flush()
+        logger.info(f"В хранилище ответов перенесено ответов: {len(inline)}")
+    # Новые ответы сразу пишутся в хранилище, повторять обход не нужно
+    with open(INLINE_ANSWERS_MOVED, "w"):
+        pass
+
+async def pending_reviews():
+    """Сданные, но не проверенные задания по данным прогресса"""
+    def collect(progresses):
+        return [
+            (progress.user_id, lesson_id)
+            for progress in progresses
+            for lesson_id in progress.submitted_assignments
+            if not progress.checked_assignments[lesson_id]
+        ]
+    
+    return await scan_progress(collect)
+
+async def close_storage():
+    """Сохранение прогресса при остановке"""
+    await user_progress_db.close()
+    await review_queue.close()
+    await answer_store.close()
+    logger.info("Прогресс пользователей сохранен")
+
+async def start_scheduler():
+    """Запуск таймеров после загрузки прогресса"""
+    await scheduler.start(backfill=existing_reminders)
+
+async def existing_reminders():
+    """Напоминания для тех, кто начал курс до появления планировщика (у каждого воркера - свои)"""
+    if REMINDER_AFTER_HOURS <= 0:
+        return []
+    due_at = time.time() + REMINDER_AFTER_HOURS * 3600
+    
+    def collect(progresses):
+        return [
+            Timer(progress.user_id, TIMER_REMINDER, due_at)
+            for progress in progresses
+            if progress.status == UserStatus.IN_PROGRESS and owns_user(progress.user_id)
+        ]
+    
+    return await scan_progress(collect)
+
+async def start_activity():
+    """Восстановление статистики активности и ее периодическое сохранение"""
+    await activity.start(ACTIVITY_PATH, ACTIVITY_SAVE_INTERVAL)
+
+async def start_content_watch():
+    """Отслеживание изменений файлов курсов"""
+    await course_catalog.start(CONTENT_WATCH_INTERVAL)
+
+async def start_tenant_usage():
+    """Периодическая оценка памяти арендаторов для /metrics"""
+    # С одним арендатором разбивка не нужна: объем прогресса виден в метриках хранилища
+    if len(tenants) > 1:
+        await tenant_usage.start(user_progress_db, TENANT_MEASURE_INTERVAL)
+
+dp.startup.register(start_storage)
+dp.startup.register(start_scheduler)
+dp.startup.register(start_content_watch)
+dp.startup.register(start_tenant_usage)
+dp.startup.register(start_activity)
+dp.shutdown.register(scheduler.close)
+dp.shutdown.register(tenant_usage.close)
+dp.shutdown.register(activity.close)
+dp.shutdown.register(close_storage)
+dp.shutdown.register(course_catalog.close)
+dp.shutdown.register(outbox.close)
+
 # ========== ЗАПУСК ПРИЛОЖЕНИЯ ==========
 
-async def main_webhook():
-    """Запуск в режиме Webhook"""
+async def start_webhook(host: str = "0.0.0.0", port: Optional[int] = None, sock=None) -> web.AppRunner:
+    """Собрать приложение webhook и запустить сервер (sock - уже открытый слушающий сокет)"""
     logger.info("Запуск бота в режиме Webhook...")
     
     # Регистрируем обработчики startup/shutdown
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
     
-    # Создаем aiohttp приложение
-    app = web.Application()
+    # Создаем aiohttp приложение (при перегрузке webhook отвечает 503)
+    app = web.Application(middlewares=[backpressure_middleware(update_ordering)])
     
     # Регистрируем health check и корневой endpoint
     app.router.add_get("/health", health_check)
+    app.router.add_get("/metrics", metrics.handle)
     app.router.add_get("/", handle_main)
     
-    # Создаем обработчик webhook
-    webhook_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot,
-    )
-    
-    # Регистрируем webhook endpoint
-    webhook_handler.register(app, path="/webhook")
+    # Создаем обработчик webhook и регистрируем endpoint
+    if WEBHOOK_MODE == "queued":
+        def resolve_tenant_bot(request: web.Request) -> Optional[Bot]:
+            tenant = tenants.get(request.match_info.get("tenant", DEFAULT_TENANT))
+            return tenant.bot if tenant else None
+        
+        ingest = WebhookIngest(
+            dp,
+            workers=INGEST_WORKERS,
+            max_queue=MAX_PENDING_UPDATES,
+            dedupe_window=INGEST_DEDUPE_WINDOW,
+            resolve_bot=resolve_tenant_bot,
+        )
+        ingest.register(app, path="/webhook")
+        if len(tenants) > 1:
+            app.router.add_post("/webhook/{tenant}", ingest.handle)
+        metrics.register_collector("bot_ingest", "Очередь приема webhook", ingest.metrics)
+    else:
+        webhook_handler = SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+        )
+        webhook_handler.register(app, path="/webhook")
+        if len(tenants) > 1:
+            TenantRequestHandler(tenants, dispatcher=dp).register(app, path="/webhook/{tenant}")
     
     # Настраиваем приложение aiogram
     setup_application(app, dp, bot=bot)
     
     # Получаем порт из переменной окружения
-    port = int(os.environ.get("PORT", 10000))
-    host = "0.0.0.0"
+    if port is None:
+        port = int(os.environ.get("PORT", 10000))
     
     logger.info(f"Запуск сервера на {host}:{port}")
     if WEBHOOK_URL:
@@ -848,11 +996,44 @@ async def main_webhook():
     # Запускаем сервер
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, host, port)
+    if sock is not None:
+        site = web.SockSite(runner, sock)
+    else:
+        site = web.TCPSite(runner, host, port)
     await site.start()
+    return runner
+
+async def wait_for_stop():
+    """Ждать SIGTERM (остановка сервиса, фронт multiworker) или SIGINT"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    signals = (signal.SIGTERM, signal.SIGINT)
+    try:
+        for signum in signals:
+            loop.add_signal_handler(signum, stop.set)
+    except NotImplementedError:
+        # Windows: остановка только по KeyboardInterrupt
+        pass
+    try:
+        await stop.wait()
+        logger.info("Получен сигнал остановки")
+    finally:
+        for signum in signals:
+            try:
+                loop.remove_signal_handler(signum)
+            except NotImplementedError:
+                pass
+
+async def main_webhook(host: str = "0.0.0.0", port: Optional[int] = None):
+    """Запуск в режиме Webhook"""
+    runner = await start_webhook(host, port)
     
-    # Бесконечный цикл
-    await asyncio.Event().wait()
+    # Работаем до сигнала остановки
+    try:
+        await wait_for_stop()
+    finally:
+        # Останавливаем сервер, чтобы отработали shutdown-хуки
+        await runner.cleanup()
 
 async def main_polling():
     """Запуск в режиме Polling (для локальной разработки)"""
@@ -860,17 +1041,22 @@ async def main_polling():
     
     # Удаляем webhook перед запуском polling
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
+        for tenant in tenants:
+            await tenant.bot.delete_webhook(drop_pending_updates=True)
         logger.info("Webhook удален, запускаем polling...")
     except Exception as e:
         logger.warning(f"Ошибка при удалении webhook: {e}")
     
-    await dp.start_polling(bot)
+    await dp.start_polling(*(tenant.bot for tenant in tenants))
     
 if __name__ == "__main__":
     try:
         # Если задан WEBHOOK_URL - запускаем в режиме webhook
-        if WEBHOOK_URL:
+        if WEBHOOK_URL and WEB_WORKERS > 1:
+            # Несколько процессов за фронтом, распределяющим апдейты по user_id
+            from multiworker import run_multiworker
+            run_multiworker(WEB_WORKERS)
+        elif WEBHOOK_URL:
             asyncio.run(main_webhook())
         else:
             # Иначе запускаем в режиме polling (для локальной разработки)
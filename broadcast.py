@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, asdict
+from datetime import timedelta
+from typing import Awaitable, Callable, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram для обычных ботов: ~30 сообщений в секунду суммарно
+# и не больше одного сообщения в секунду в один чат. С платными рассылками
+# (allow_paid_broadcast, звезды за сообщения сверх 30 в секунду) суммарный
+# лимит - до 1000 сообщений в секунду
+DEFAULT_GLOBAL_RATE = 25.0
+PAID_GLOBAL_RATE = 1000.0
+DEFAULT_PER_CHAT_INTERVAL = 1.0
+
+SendFunc = Callable[[int], Awaitable[None]]
+
+# ========== ОГРАНИЧЕНИЕ СКОРОСТИ ==========
+
+class TokenBucket:
+    """Асинхронный token bucket с возможностью общей паузы"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов (например, после RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Достать задержку из ошибки флуд-контроля (aiogram или python-telegram-bot)"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None:
+        return None
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+# ========== ЧЕКПОИНТ ==========
+
+@dataclass
+class BroadcastCheckpoint:
+    """Состояние рассылки, достаточное для продолжения после перезапуска"""
+    text: str
+    last_user_id: int = 0
+    sent: int = 0
+    failed: int = 0
+    started_at: float = 0.0
+    finished: bool = False
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BroadcastCheckpoint"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл и атомарно подменяем
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+class _Watermark:
+    """Наибольший user_id, до которого включительно все получатели обработаны"""
+
+    def __init__(self, start: int):
+        self.value = start
+        self._pending: Deque[int] = deque()
+        self._done: Dict[int, bool] = {}
+
+    def add(self, user_id: int):
+        self._pending.append(user_id)
+        self._done[user_id] = False
+
+    def complete(self, user_id: int):
+        self._done[user_id] = True
+        while self._pending and self._done[self._pending[0]]:
+            self.value = self._pending.popleft()
+            del self._done[self.value]
+
+# ========== РАССЫЛКА ==========
+
+class BroadcastEngine:
+    """Рассылка сообщения всем пользователям с ограничением скорости
+
+    Получатели читаются из хранилища прогресса пачками по возрастанию
+    user_id, поэтому в памяти находится не больше одной пачки и очереди
+    воркеров. Отправку выполняет пул из workers задач: общий token bucket
+    держит суммарную скорость, отдельный интервал - скорость в один чат.
+    При RetryAfter весь пул встает на паузу. Чекпоинт хранит user_id, до
+    которого рассылка гарантированно дошла, и периодически пишется на диск.
+    """
+
+    def __init__(
+        self,
+        send: SendFunc,
+        recipients: Callable[[int], Iterator[List[int]]],
+        checkpoint_path: str,
+        rate: float = DEFAULT_GLOBAL_RATE,
+        workers: int = 16,
+        per_chat_interval: float = DEFAULT_PER_CHAT_INTERVAL,
+        max_retries: int = 3,
+        is_permanent_error: Callable[[Exception], bool] = lambda e: False,
+        checkpoint_interval: float = 5.0,
+    ):
+        self.send = send
+        self.recipients = recipients
+        self.checkpoint_path = checkpoint_path
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.is_permanent_error = is_permanent_error
+        self.checkpoint_interval = checkpoint_interval
+        self._last_sent: Dict[int, float] = {}
+
+    async def _send_one(self, chat_id: int) -> bool:
+        for attempt in range(self.max_retries + 1):
+            last_sent = self._last_sent.get(chat_id)
+            if last_sent is not None:
+                delay = last_sent + self.per_chat_interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            await self.bucket.acquire()
+            self._last_sent[chat_id] = time.monotonic()
+            try:
+                await self.send(chat_id)
+                return True
+            except Exception as e:
+                retry_after = retry_after_seconds(e)
+                if retry_after is not None:
+                    logger.warning(f"Флуд-контроль при рассылке, пауза {retry_after} с")
+                    self.bucket.pause(retry_after)
+                    continue
+                if self.is_permanent_error(e) or attempt == self.max_retries:
+                    logger.info(f"Не удалось отправить рассылку {chat_id}: {e}")
+                    return False
+                await asyncio.sleep(2 ** attempt)
+        return False
+
+    async def run(self, checkpoint: BroadcastCheckpoint) -> BroadcastCheckpoint:
+        """Выполнить (или продолжить) рассылку"""
+        if not checkpoint.started_at:
+            checkpoint.started_at = time.time()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 4)
+        watermark = _Watermark(checkpoint.last_user_id)
+
+        async def worker():
+            while True:
+                chat_id = await queue.get()
+                try:
+                    if await self._send_one(chat_id):
+                        checkpoint.sent += 1
+                    else:
+                        checkpoint.failed += 1
+                finally:
+                    self._last_sent.pop(chat_id, None)
+                    watermark.complete(chat_id)
+                    queue.task_done()
+
+        async def checkpointer():
+            while True:
+                await asyncio.sleep(self.checkpoint_interval)
+                checkpoint.last_user_id = watermark.value
+                await asyncio.to_thread(checkpoint.save, self.checkpoint_path)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        tasks.append(asyncio.create_task(checkpointer()))
+        try:
+            batches = self.recipients(checkpoint.last_user_id)
+            while True:
+                # Чтение следующей пачки может идти с диска
+                batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    break
+                for chat_id in batch:
+                    watermark.add(chat_id)
+                    await queue.put(chat_id)
+            await queue.join()
+            checkpoint.finished = True
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            checkpoint.last_user_id = watermark.value
+            await asyncio.to_thread(checkpoint.save, self.checkpoint_path)
+
+        logger.info(f"Рассылка завершена: отправлено {checkpoint.sent}, ошибок {checkpoint.failed}")
+        return checkpoint
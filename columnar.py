@@ -0,0 +1,175 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import NAMESPACE_SHIFT, STATUS_CODES, UserProgress, UserStatus
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Ширина масок уроков в столбцах: уроки с большими номерами колонки не вмещают
+MASK_BITS = 64
+
+class ColumnarProgress:
+    """Колоночная копия прогресса для аналитики админки
+
+    Каждому пользователю соответствует строка в наборе массивов NumPy
+    (user_id, текущий урок, код статуса и битовые маски уроков), поэтому
+    итоги, воронка и страницы списка по всем пользователям считаются
+    векторными операциями без цикла на Python. Строки обновляются при
+    каждом примененном событии (update), массивы растут удвоением.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        if np is None:
+            raise RuntimeError("Для колоночной статистики нужен numpy")
+        self.size = 0
+        self._rows: Dict[int, int] = {}
+        self.user_id = None
+        self._allocate(capacity)
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    @staticmethod
+    def fits(progress: UserProgress) -> bool:
+        """Помещаются ли маски записи в столбцы"""
+        return max(progress.completed_mask, progress.submitted_mask, progress.checked_mask) >> MASK_BITS == 0
+
+    def _allocate(self, capacity: int):
+        old = self._columns() if self.user_id is not None else None
+        self.user_id = np.zeros(capacity, dtype=np.int64)
+        self.current_lesson = np.zeros(capacity, dtype=np.int16)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.completed = np.zeros(capacity, dtype=np.uint64)
+        self.submitted = np.zeros(capacity, dtype=np.uint64)
+        self.checked = np.zeros(capacity, dtype=np.uint64)
+        if old is not None:
+            for name, values in old.items():
+                getattr(self, name)[:self.size] = values
+
+    def _columns(self, namespace: Optional[int] = None) -> Dict[str, "np.ndarray"]:
+        """Заполненная часть столбцов; с namespace - только строки одного арендатора"""
+        n = self.size
+        columns = {
+            "user_id": self.user_id[:n],
+            "current_lesson": self.current_lesson[:n],
+            "status": self.status[:n],
+            "completed": self.completed[:n],
+            "submitted": self.submitted[:n],
+            "checked": self.checked[:n],
+        }
+        if namespace is not None:
+            rows = np.right_shift(columns["user_id"], NAMESPACE_SHIFT) == namespace
+            columns = {name: values[rows] for name, values in columns.items()}
+        return columns
+
+    def update(self, progress: UserProgress):
+        """Записать (или добавить) строку пользователя"""
+        row = self._rows.get(progress.user_id)
+        if row is None:
+            if self.size == len(self.user_id):
+                self._allocate(len(self.user_id) * 2)
+            row = self.size
+            self.size += 1
+            self._rows[progress.user_id] = row
+            self.user_id[row] = progress.user_id
+        self.current_lesson[row] = progress.current_lesson
+        self.status[row] = STATUS_CODES[progress.status]
+        self.completed[row] = progress.completed_mask
+        self.submitted[row] = progress.submitted_mask
+        self.checked[row] = progress.checked_mask & progress.submitted_mask
+
+    def rebuild(self, progresses: Iterable[UserProgress]):
+        """Заполнить копию заново"""
+        self.size = 0
+        self._rows = {}
+        for progress in progresses:
+            self.update(progress)
+        logger.info(f"Колоночная статистика построена: {self.size} пользователей")
+
+    @staticmethod
+    def _per_lesson(masks: "np.ndarray", lessons: "np.ndarray") -> "np.ndarray":
+        """Количество строк с установленным битом для каждого урока из lessons"""
+        bits = np.left_shift(np.uint64(1), lessons.astype(np.uint64))
+        return np.count_nonzero(masks[:, None] & bits[None, :], axis=0)
+
+    def stats(self, namespace: int = 0) -> dict:
+        """Итоги в формате AdminBot.get_stats"""
+        columns = self._columns(namespace)
+        status_counts = np.bincount(columns["status"], minlength=len(STATUS_CODES))
+        lessons = np.arange(MASK_BITS)
+        completions = self._per_lesson(columns["completed"], lessons)
+        return {
+            'total_users': len(columns["user_id"]),
+            'active_users': int(status_counts[STATUS_CODES[UserStatus.IN_PROGRESS]]),
+            'completed_users': int(status_counts[STATUS_CODES[UserStatus.COMPLETED]]),
+            'lesson_stats': {int(lesson_id): int(count) for lesson_id, count in zip(lessons, completions) if count},
+            'submitted_assignments': int(self._per_lesson(columns["submitted"], lessons).sum()),
+            'checked_assignments': int(self._per_lesson(columns["checked"], lessons).sum()),
+        }
+
+    def funnel(self, total_lessons: int, namespace: int = 0) -> List[dict]:
+        """Воронка по урокам: дошли, прошли, сдали и проверено"""
+        columns = self._columns(namespace)
+        total = max(len(columns["user_id"]), 1)
+        lessons = np.arange(1, min(total_lessons, MASK_BITS - 1) + 1)
+        bits = np.left_shift(np.uint64(1), lessons.astype(np.uint64))
+        # Дошел до урока N: текущий урок не меньше N или урок N уже пройден
+        reached = np.count_nonzero(
+            (columns["current_lesson"][:, None] >= lessons[None, :])
+            | ((columns["completed"][:, None] & bits[None, :]) != 0),
+            axis=0,
+        )
+        completed = self._per_lesson(columns["completed"], lessons)
+        submitted = self._per_lesson(columns["submitted"], lessons)
+        checked = self._per_lesson(columns["checked"], lessons)
+
+        return [
+            {
+                'lesson_id': int(lesson_id),
+                'reached': int(reached[index]),
+                'completed': int(completed[index]),
+                'submitted': int(submitted[index]),
+                'checked': int(checked[index]),
+                'completed_percent': float(completed[index] * 100 / total),
+            }
+            for index, lesson_id in enumerate(lessons)
+        ]
+
+    def page(
+        self,
+        status: Optional[UserStatus] = None,
+        lesson: Optional[int] = None,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: int = 50,
+        namespace: int = 0,
+    ) -> Tuple[List[int], bool, bool]:
+        """Страница id по фильтру: (ids, есть ли предыдущая, есть ли следующая)"""
+        columns = self._columns(namespace)
+        rows = np.ones(len(columns["user_id"]), dtype=bool)
+        if status is not None:
+            rows &= columns["status"] == STATUS_CODES[status]
+        if lesson is not None:
+            rows &= columns["current_lesson"] == lesson
+        ids = np.sort(columns["user_id"][rows])
+        if before is not None:
+            end = int(np.searchsorted(ids, before, side="left"))
+            start = max(0, end - limit)
+        else:
+            start = int(np.searchsorted(ids, after if after is not None else -1, side="right"))
+            end = start + limit
+        page = ids[start:end].tolist()
+        return page, bool(page) and start > 0, bool(page) and end < len(ids)
+
+def create_columnar_mirror() -> Optional[ColumnarProgress]:
+    """Создать колоночную копию, если установлен numpy"""
+    if not ColumnarProgress.available():
+        logger.info("numpy не установлен, статистика админки считается обходом записей")
+        return None
+    return ColumnarProgress()
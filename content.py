@@ -0,0 +1,241 @@
+import os
+import json
+import asyncio
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from models import Lesson
+from render_cache import CourseAuthor, RenderCache
+
+try:
+    import yaml
+except ImportError:  # PyYAML - необязательная зависимость, JSON читается всегда
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_EXTENSIONS = (".json", ".yaml", ".yml")
+LESSON_FIELDS = ("id", "title", "description", "video_url", "text_content",
+                 "assignment_question", "assignment_hint")
+
+@dataclass(frozen=True)
+class Course:
+    """Скомпилированный курс: уроки и готовые экраны, не меняется после сборки"""
+    id: str
+    title: str
+    description: str
+    lessons: Tuple[Lesson, ...]
+    screens: RenderCache
+
+    @property
+    def total(self) -> int:
+        return len(self.lessons)
+
+    def lesson(self, lesson_id: int) -> Optional[Lesson]:
+        if 0 < lesson_id <= len(self.lessons):
+            return self.lessons[lesson_id - 1]
+        return None
+
+def _read_file(path: str) -> dict:
+    with open(path, "rb") as f:
+        raw = f.read()
+    if path.endswith(".json"):
+        return json.loads(raw)
+    if yaml is None:
+        raise RuntimeError("Для YAML-файлов курса нужен PyYAML")
+    return yaml.safe_load(raw)
+
+def compile_course(course_id: str, data: dict) -> Course:
+    """Проверить описание курса и построить все его экраны"""
+    lessons = tuple(
+        Lesson(**{field: item.get(field) for field in LESSON_FIELDS})
+        for item in data.get("lessons", ())
+    )
+    if not lessons:
+        raise ValueError(f"В курсе {course_id} нет уроков")
+    # Номера уроков - позиции битов в масках прогресса и цели навигации, поэтому подряд с 1
+    for position, lesson in enumerate(lessons, 1):
+        if lesson.id != position:
+            raise ValueError(f"Курс {course_id}: урок {lesson.id} на месте {position}, ожидаются номера 1..N")
+        if not lesson.title:
+            raise ValueError(f"Курс {course_id}: у урока {lesson.id} нет названия")
+    description = data.get("description", "")
+    screens = RenderCache(
+        list(lessons),
+        description=description,
+        author_intro=data.get("author_intro", ""),
+        author_info=data.get("author_info", ""),
+        course_name=data.get("course_name", ""),
+        completion_skill=data.get("completion_skill", ""),
+        author=CourseAuthor(
+            name=data.get("author_name", ""),
+            name_genitive=data.get("author_name_genitive", ""),
+            quote=data.get("author_quote", ""),
+            tip=data.get("author_tip", ""),
+        ),
+    )
+    return Course(
+        id=course_id,
+        title=data.get("title", course_id),
+        description=description,
+        lessons=lessons,
+        screens=screens,
+    )
+
+class _CatalogState:
+    """Неизменяемый набор курсов; заменяется целиком при перезагрузке"""
+    __slots__ = ("courses", "lessons", "files")
+
+    def __init__(self, courses: Dict[str, Course], files: Dict[str, Tuple[int, int]]):
+        self.courses: Mapping[str, Course] = MappingProxyType(courses)
+        self.lessons: Mapping[Tuple[str, int], Lesson] = MappingProxyType({
+            (course.id, lesson.id): lesson for course in courses.values() for lesson in course.lessons
+        })
+        self.files = files
+
+class CourseCatalog:
+    """Курсы из файлов JSON/YAML каталога с подменой на лету
+
+    Каждый файл <course_id>.json|.yaml - отдельный курс. При загрузке курс
+    компилируется целиком (уроки проверяются, экраны строятся заранее), и
+    новый набор курсов подменяет старый одним присваиванием. Обработчик,
+    получивший Course, дорабатывает со своей версией, а следующие запросы
+    видят новую. Изменения файлов ищет фоновая задача по mtime; сборка
+    идет в отдельном потоке, event loop не останавливается. Файл с
+    ошибкой пропускается с записью в лог, а курс остается в прежней версии.
+    Обновление, в котором пропал курс по умолчанию или курс из require
+    (на него ссылаются арендаторы), отклоняется целиком.
+    """
+
+    def __init__(self, directory: str, default_course: Optional[str] = None):
+        self.directory = directory
+        self.default_course = default_course
+        self._state = _CatalogState({}, {})
+        self._listeners: List[Callable[[Mapping[str, Course]], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        # Курсы, без которых обновление не применяется (кроме курса по умолчанию)
+        self._required: Set[str] = set()
+        # Файлы последнего отклоненного обновления: пока они те же, сборку не повторяем
+        self._rejected_files: Optional[Dict[str, Tuple[int, int]]] = None
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        files = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(CONTENT_EXTENSIONS):
+                stat = entry.stat()
+                files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _build(self, previous: _CatalogState) -> Optional[_CatalogState]:
+        """Новый набор курсов или None, если файлы не менялись"""
+        files = self._scan()
+        if files == previous.files or files == self._rejected_files:
+            return None
+        courses: Dict[str, Course] = {}
+        for path in sorted(files):
+            course_id = os.path.splitext(os.path.basename(path))[0]
+            old = previous.courses.get(course_id)
+            if previous.files.get(path) == files[path]:
+                # Файл не менялся: прежняя сборка или уже записанная в лог ошибка
+                if old is not None:
+                    courses[course_id] = old
+                continue
+            try:
+                courses[course_id] = compile_course(course_id, _read_file(path))
+                logger.info(f"Курс {course_id} загружен из {path}")
+            except Exception as e:
+                logger.error(f"Ошибка загрузки курса из {path}: {e}")
+                if old is not None:
+                    courses[course_id] = old
+        return _CatalogState(courses, files)
+
+    def _swap(self, state: _CatalogState):
+        self._state = state
+        for listener in self._listeners:
+            try:
+                listener(state.courses)
+            except Exception as e:
+                logger.error(f"Ошибка подписчика обновления курсов: {e}")
+
+    def load(self):
+        """Синхронная загрузка при запуске: без единого курса работать нельзя"""
+        state = self._build(self._state)
+        if state is None or not state.courses:
+            raise RuntimeError(f"В каталоге {self.directory} не найдено ни одного курса")
+        if self.default_course is None:
+            self.default_course = next(iter(state.courses))
+        missing = self._missing(state)
+        if missing:
+            raise RuntimeError(f"Курс {', '.join(missing)} не найден в {self.directory}")
+        self._swap(state)
+
+    def _missing(self, state: _CatalogState) -> List[str]:
+        """Обязательные курсы, которых нет в наборе"""
+        required = self._required | {self.default_course}
+        return sorted(course_id for course_id in required if course_id not in state.courses)
+
+    def require(self, course_id: Optional[str]):
+        """Запретить обновления без курса course_id (None - курс по умолчанию)
+
+        Курса уже сейчас нет в каталоге - RuntimeError.
+        """
+        if course_id is None:
+            return
+        if course_id not in self._state.courses:
+            raise RuntimeError(f"Курс {course_id} не найден в {self.directory}")
+        self._required.add(course_id)
+
+    async def reload(self) -> bool:
+        """Перечитать изменившиеся файлы; True, если набор курсов заменен"""
+        state = await asyncio.to_thread(self._build, self._state)
+        if state is None:
+            return False
+        missing = self._missing(state)
+        if missing:
+            logger.error(f"Из {self.directory} пропали используемые курсы {', '.join(missing)}, обновление отклонено")
+            # Запоминаем файлы, чтобы не повторять ошибку на каждой проверке.
+            # Набор остается прежним, и правки, сделанные за это время,
+            # применятся вместе с возвращением курса
+            self._rejected_files = state.files
+            return False
+        self._rejected_files = None
+        self._swap(state)
+        logger.info(f"Курсы обновлены: {', '.join(state.courses)}")
+        return True
+
+    def subscribe(self, listener: Callable[[Mapping[str, Course]], None]):
+        """Вызывать listener(courses) после каждой подмены набора курсов"""
+        self._listeners.append(listener)
+
+    def course(self, course_id: Optional[str] = None) -> Course:
+        return self._state.courses[course_id or self.default_course]
+
+    def lesson(self, course_id: str, lesson_id: int) -> Optional[Lesson]:
+        return self._state.lessons.get((course_id, lesson_id))
+
+    def courses(self) -> Mapping[str, Course]:
+        return self._state.courses
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Ошибка проверки файлов курсов: {e}")
+
+    async def start(self, interval: float):
+        """Запустить отслеживание файлов (interval <= 0 - без отслеживания)"""
+        if interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch(interval))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
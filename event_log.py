@@ -0,0 +1,370 @@
+import os
+import re
+import zlib
+import struct
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models import STATUS_CODES, AnswerRef, AssignmentStatus, UserProgress, UserStatus
+from events import EventType, ProgressEvent
+
+logger = logging.getLogger(__name__)
+
+# ========== ФОРМАТ ЗАПИСЕЙ ==========
+
+EVENT_TYPES = tuple(EventType)
+EVENT_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+USER_STATUSES = tuple(STATUS_CODES)
+ASSIGNMENT_STATUSES = tuple(AssignmentStatus)
+ASSIGNMENT_CODES = {status: code for code, status in enumerate(ASSIGNMENT_STATUSES)}
+
+_STATUS_CHANGED = EVENT_CODES[EventType.STATUS_CHANGED]
+_LESSON_VIEWED = EVENT_CODES[EventType.LESSON_VIEWED]
+_LESSON_COMPLETED = EVENT_CODES[EventType.LESSON_COMPLETED]
+_ASSIGNMENT_SUBMITTED = EVENT_CODES[EventType.ASSIGNMENT_SUBMITTED]
+_ASSIGNMENT_CHECKED = EVENT_CODES[EventType.ASSIGNMENT_CHECKED]
+_ANSWER_MOVED = EVENT_CODES[EventType.ANSWER_MOVED]
+
+# Сегмент журнала начинается с версии формата, за ней идут записи:
+# длина тела, crc32 тела, затем само тело
+_SEGMENT_MAGIC = b"PLOG0002"
+_FRAME = struct.Struct("<II")
+# Тело: тип, user_id, урок, статус до/после (-1 - нет), время, handle ответа
+# (0 - ответ хранится прямо в записи); дальше превью или текст ответа
+_EVENT = struct.Struct("<BqHbbdQ")
+
+_SNAPSHOT_MAGIC = b"PSNAP001"
+# Заголовок снимка: магия, номер первого не вошедшего события, число записей
+_SNAPSHOT_HEADER = struct.Struct("<8sQQ")
+# Запись снимка: user_id, текущий урок, статус, три маски, число ответов
+_SNAPSHOT_USER = struct.Struct("<qHBQQQB")
+# Ответ: урок, handle (0 - текст хранится прямо в снимке), длина текста
+_SNAPSHOT_ANSWER = struct.Struct("<HQI")
+
+_SEGMENT_NAME = re.compile(r"^events-(\d{12})\.log$")
+_SNAPSHOT_NAME = re.compile(r"^snapshot-(\d{12})\.snap$")
+
+def _status_code(status) -> int:
+    if status is None:
+        return -1
+    if isinstance(status, UserStatus):
+        return STATUS_CODES[status]
+    return ASSIGNMENT_CODES[status]
+
+def _status_from_code(event_code: int, code: int):
+    if code < 0:
+        return None
+    return USER_STATUSES[code] if event_code == _STATUS_CHANGED else ASSIGNMENT_STATUSES[code]
+
+def encode_event(event: ProgressEvent) -> bytes:
+    """Запись журнала для события"""
+    answer = event.answer
+    body = _EVENT.pack(
+        EVENT_CODES[event.type], event.user_id, event.lesson_id,
+        _status_code(event.previous), _status_code(event.current),
+        event.timestamp, answer.handle if answer is not None else 0,
+    )
+    if answer is not None:
+        body += answer.preview.encode("utf-8")
+    return _FRAME.pack(len(body), zlib.crc32(body)) + body
+
+def _first_record(buffer: bytes) -> int:
+    """Смещение первой записи сегмента"""
+    if buffer.startswith(_SEGMENT_MAGIC):
+        return len(_SEGMENT_MAGIC)
+    if _SEGMENT_MAGIC.startswith(buffer):
+        # Пустой сегмент или заголовок, оборванный при создании
+        return 0
+    raise ValueError("Неизвестный формат сегмента журнала")
+
+def _iter_frames(buffer: bytes, offset: Optional[int] = None) -> Iterator[Tuple[int, tuple, bytes]]:
+    """(смещение конца записи, поля, превью) для целых записей сегмента
+
+    offset - начало первой записи, если buffer прочитан не с начала сегмента.
+    """
+    if offset is None:
+        offset = _first_record(buffer)
+    end = len(buffer)
+    while offset + _FRAME.size <= end:
+        length, crc = _FRAME.unpack_from(buffer, offset)
+        start = offset + _FRAME.size
+        body = buffer[start:start + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            return
+        offset = start + length
+        yield offset, _EVENT.unpack_from(body), body[_EVENT.size:]
+
+def apply_record(data: Dict[int, UserProgress], fields: tuple, preview: bytes):
+    """Применить событие журнала к словарю прогресса
+
+    Каждое событие задает значение поля, а не приращение, поэтому
+    повторное применение уже учтенного события ничего не ломает.
+    """
+    code, user_id, lesson_id, _, current, _, handle = fields
+    progress = data.get(user_id)
+    if progress is None:
+        progress = data[user_id] = UserProgress(user_id=user_id)
+    if code == _STATUS_CHANGED:
+        progress.status = USER_STATUSES[current]
+    elif code == _LESSON_VIEWED:
+        progress.current_lesson = lesson_id
+    elif code == _LESSON_COMPLETED:
+        progress.completed_mask |= 1 << lesson_id
+    elif code == _ASSIGNMENT_SUBMITTED or code == _ANSWER_MOVED:
+        text = preview.decode("utf-8")
+        progress.submitted_assignments[lesson_id] = AnswerRef(handle, text) if handle else text
+        if code == _ASSIGNMENT_SUBMITTED:
+            progress.checked_mask &= ~(1 << lesson_id)
+    elif code == _ASSIGNMENT_CHECKED:
+        progress.checked_mask |= 1 << lesson_id
+
+def event_from_record(fields: tuple, preview: bytes) -> ProgressEvent:
+    code, user_id, lesson_id, previous, current, timestamp, handle = fields
+    return ProgressEvent(
+        EVENT_TYPES[code], user_id, lesson_id,
+        previous=_status_from_code(code, previous),
+        current=_status_from_code(code, current),
+        timestamp=timestamp,
+        answer=AnswerRef(handle, preview.decode("utf-8")) if handle else None,
+    )
+
+# ========== СНИМКИ ==========
+
+def encode_snapshot_users(progresses: Iterable[UserProgress]) -> Tuple[bytes, int]:
+    """Упаковать записи прогресса для снимка: (данные, число записей)"""
+    parts: List[bytes] = []
+    count = 0
+    for progress in progresses:
+        answers = progress._answers or {}
+        parts.append(_SNAPSHOT_USER.pack(
+            progress.user_id, progress.current_lesson, STATUS_CODES[progress.status],
+            progress.completed_mask, progress.submitted_mask, progress.checked_mask, len(answers),
+        ))
+        for lesson_id, answer in answers.items():
+            if isinstance(answer, AnswerRef):
+                text = answer.preview.encode("utf-8")
+                parts.append(_SNAPSHOT_ANSWER.pack(lesson_id, answer.handle, len(text)))
+            else:
+                text = answer.encode("utf-8")
+                parts.append(_SNAPSHOT_ANSWER.pack(lesson_id, 0, len(text)))
+            parts.append(text)
+        count += 1
+    return b"".join(parts), count
+
+def decode_snapshot(buffer: bytes) -> Tuple[int, Dict[int, UserProgress]]:
+    """Прочитать снимок: (номер первого не вошедшего события, записи)"""
+    magic, seq, count = _SNAPSHOT_HEADER.unpack_from(buffer)
+    if magic != _SNAPSHOT_MAGIC:
+        raise ValueError("Неизвестный формат снимка")
+    data: Dict[int, UserProgress] = {}
+    offset = _SNAPSHOT_HEADER.size
+    for _ in range(count):
+        user_id, current_lesson, status, completed, submitted, checked, answers = \
+            _SNAPSHOT_USER.unpack_from(buffer, offset)
+        offset += _SNAPSHOT_USER.size
+        progress = UserProgress(user_id, current_lesson=current_lesson, status=USER_STATUSES[status])
+        progress.completed_mask = completed
+        progress.checked_mask = checked
+        if answers:
+            progress._answers = {}
+            for _ in range(answers):
+                lesson_id, handle, length = _SNAPSHOT_ANSWER.unpack_from(buffer, offset)
+                offset += _SNAPSHOT_ANSWER.size
+                text = buffer[offset:offset + length].decode("utf-8")
+                offset += length
+                progress._answers[lesson_id] = AnswerRef(handle, text) if handle else text
+        progress.submitted_mask = submitted
+        data[user_id] = progress
+    return seq, data
+
+# ========== ЖУРНАЛ ==========
+
+class EventLog:
+    """Журнал событий прогресса в двоичных сегментах и снимки состояния
+
+    Сегмент events-<seq>.log начинается с события номер seq, снимок
+    snapshot-<seq>.snap содержит состояние со всеми событиями до seq.
+    После записи снимка более старые сегменты и снимки удаляются, поэтому
+    запуск - это чтение последнего снимка и короткого хвоста журнала.
+    Запись в конце сегмента, оборванная падением процесса, отбрасывается
+    по crc32 при следующем открытии.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.next_seq = 0
+        # Сколько событий воспроизведено поверх снимка при загрузке
+        self.replayed = 0
+        self._segment_seq = 0
+        self._writer: Optional[int] = None
+
+    def _files(self, pattern) -> List[Tuple[int, str]]:
+        result = []
+        for name in os.listdir(self.directory):
+            match = pattern.match(name)
+            if match:
+                result.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(result)
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"events-{seq:012d}.log")
+
+    def _open_segment(self, seq: int):
+        if self._writer is not None:
+            os.fsync(self._writer)
+            os.close(self._writer)
+        self._segment_seq = seq
+        self._writer = os.open(self._segment_path(seq), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if os.fstat(self._writer).st_size == 0:
+            os.write(self._writer, _SEGMENT_MAGIC)
+
+    def load(self) -> Dict[int, UserProgress]:
+        """Восстановить состояние: последний снимок плюс хвост журнала"""
+        os.makedirs(self.directory, exist_ok=True)
+        data: Dict[int, UserProgress] = {}
+        snapshot_seq = 0
+        snapshots = self._files(_SNAPSHOT_NAME)
+        if snapshots:
+            with open(snapshots[-1][1], "rb") as f:
+                snapshot_seq, data = decode_snapshot(f.read())
+
+        seq = snapshot_seq
+        replayed = 0
+        segments = self._files(_SEGMENT_NAME)
+        for index, (first_seq, path) in enumerate(segments):
+            with open(path, "rb") as f:
+                buffer = f.read()
+            seq = first_seq
+            good_end = _first_record(buffer)
+            for good_end, fields, preview in _iter_frames(buffer):
+                if seq >= snapshot_seq:
+                    apply_record(data, fields, preview)
+                    replayed += 1
+                seq += 1
+            if good_end < len(buffer):
+                logger.warning(f"Журнал {path}: отброшено {len(buffer) - good_end} байт оборванной записи")
+                with open(path, "r+b") as f:
+                    f.truncate(good_end)
+            if index < len(segments) - 1 and seq != segments[index + 1][0]:
+                logger.error(f"Журнал {path}: ожидалось продолжение с события {seq}")
+
+        self.next_seq = max(seq, snapshot_seq)
+        self.replayed = replayed
+        if segments and segments[-1][0] <= self.next_seq:
+            self._open_segment(segments[-1][0])
+        else:
+            self._open_segment(self.next_seq)
+        logger.info(
+            f"Журнал событий: снимок на {snapshot_seq}, воспроизведено {replayed} событий, "
+            f"записей прогресса {len(data)}"
+        )
+        return data
+
+    def write(self, records: bytes):
+        """Дописать пачку закодированных событий (синхронно)"""
+        os.write(self._writer, records)
+
+    def rotate(self, records: bytes, seq: int):
+        """Дописать последние события старого сегмента и начать новый с номера seq"""
+        if records:
+            self.write(records)
+        self._open_segment(seq)
+
+    def write_snapshot(self, seq: int, users: bytes, count: int):
+        """Атомарно записать снимок и удалить покрытые им сегменты и снимки"""
+        path = os.path.join(self.directory, f"snapshot-{seq:012d}.snap")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, seq, count))
+            f.write(users)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        for old_seq, old_path in self._files(_SNAPSHOT_NAME):
+            if old_seq < seq:
+                os.remove(old_path)
+        for first_seq, old_path in self._files(_SEGMENT_NAME):
+            if first_seq < seq:
+                os.remove(old_path)
+
+    def close(self):
+        if self._writer is not None:
+            os.fsync(self._writer)
+            os.close(self._writer)
+            self._writer = None
+
+class EventLogTail:
+    """Чтение журнала, который пишет другой процесс: снимок и затем новые записи
+
+    Ничего не меняет в каталоге: оборванная запись в конце сегмента не
+    обрезается, а дочитывается при следующем poll, когда процесс допишет
+    ее. Переход к следующему сегменту - только после всех записей
+    текущего. Если непрочитанные сегменты уже удалены после снимка, poll
+    возвращает None, и состояние нужно заново взять из snapshot.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.next_seq = 0
+        # Прочитанная часть сегмента: путь, смещение и номер события на нем
+        self._path: Optional[str] = None
+        self._offset = 0
+        self._offset_seq = 0
+
+    def snapshot(self) -> Dict[int, UserProgress]:
+        """Записи последнего снимка; poll продолжит с первого не вошедшего события"""
+        snapshots = EventLog(self.directory)._files(_SNAPSHOT_NAME)
+        data: Dict[int, UserProgress] = {}
+        self.next_seq = 0
+        if snapshots:
+            with open(snapshots[-1][1], "rb") as f:
+                self.next_seq, data = decode_snapshot(f.read())
+        self._path = None
+        return data
+
+    def poll(self) -> Optional[List[Tuple[tuple, bytes]]]:
+        """Новые записи (поля, превью) с номера next_seq; None - нужен снимок"""
+        segments = EventLog(self.directory)._files(_SEGMENT_NAME)
+        if not segments:
+            return []
+        if segments[0][0] > self.next_seq:
+            return None
+        records: List[Tuple[tuple, bytes]] = []
+        for index, (first_seq, path) in enumerate(segments):
+            if index + 1 < len(segments) and segments[index + 1][0] <= self.next_seq:
+                continue
+            if path == self._path:
+                offset, seq = self._offset, self._offset_seq
+            else:
+                offset, seq = None, first_seq
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset or 0)
+                    buffer = f.read()
+            except FileNotFoundError:
+                # Сегмент удален после снимка: прочитанное отдаем, остальное - из снимка
+                return records or None
+            end = _first_record(buffer) if offset is None else 0
+            for end, fields, preview in _iter_frames(buffer, offset=None if offset is None else 0):
+                if seq >= self.next_seq:
+                    records.append((fields, preview))
+                    self.next_seq = seq + 1
+                seq += 1
+            self._path, self._offset, self._offset_seq = path, (offset or 0) + end, seq
+            if index + 1 < len(segments) and seq != segments[index + 1][0]:
+                # Сегмент дописан не до конца: следующий читаем в другой раз
+                break
+        return records
+
+def read_events(directory: str, after_seq: int = 0) -> Iterator[Tuple[int, ProgressEvent]]:
+    """События журнала с номера after_seq - для пересборки производных индексов"""
+    log = EventLog(directory)
+    for first_seq, path in log._files(_SEGMENT_NAME):
+        with open(path, "rb") as f:
+            buffer = f.read()
+        seq = first_seq
+        for _, fields, preview in _iter_frames(buffer):
+            if seq >= after_seq:
+                yield seq, event_from_record(fields, preview)
+            seq += 1
@@ -0,0 +1,57 @@
+import time
+import logging
+from enum import Enum
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Union
+
+from models import AnswerRef, AssignmentStatus, UserStatus
+
+logger = logging.getLogger(__name__)
+
+class EventType(Enum):
+    # Номер типа в журнале событий - его позиция, новые типы только в конец
+    USER_REGISTERED = "user_registered"
+    STATUS_CHANGED = "status_changed"
+    LESSON_VIEWED = "lesson_viewed"
+    LESSON_COMPLETED = "lesson_completed"
+    ASSIGNMENT_SUBMITTED = "assignment_submitted"
+    ASSIGNMENT_CHECKED = "assignment_checked"
+    # Ответ перенесен из записи в хранилище ответов, статус задания не меняется
+    ANSWER_MOVED = "answer_moved"
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """Изменение прогресса пользователя
+
+    previous/current - состояние до и после события: UserStatus для
+    STATUS_CHANGED и AssignmentStatus для событий по заданиям. По ним
+    подписчики обновляют счетчики без чтения всей записи пользователя.
+    answer - ссылка на ответ для ASSIGNMENT_SUBMITTED и ANSWER_MOVED, чтобы
+    журнал событий мог восстановить запись целиком.
+    """
+    type: EventType
+    user_id: int
+    lesson_id: int = 0
+    previous: Optional[Union[UserStatus, AssignmentStatus]] = None
+    current: Optional[Union[UserStatus, AssignmentStatus]] = None
+    timestamp: float = field(default_factory=time.time)
+    answer: Optional[AnswerRef] = None
+
+EventHandler = Callable[[ProgressEvent], None]
+
+class EventBus:
+    """Синхронная рассылка событий прогресса подписчикам"""
+
+    def __init__(self):
+        self._handlers: List[EventHandler] = []
+
+    def subscribe(self, handler: EventHandler):
+        self._handlers.append(handler)
+
+    def emit(self, event: ProgressEvent):
+        for handler in self._handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                # Ошибка подписчика не должна ломать обработку апдейта
+                logger.error(f"Ошибка обработчика события {event.type.value}: {e}")
@@ -0,0 +1,253 @@
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List
+
+from models import UserProgress, split_user_key
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow - необязательная зависимость, без нее только CSV и JSONL
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Лимит Telegram на документ, отправляемый ботом, - 50 МБ; части берем с запасом
+MAX_PART_BYTES = 45 * 2 ** 20
+
+PROGRESS_COLUMNS = (
+    "user_id", "status", "current_lesson", "completed_count", "completed_percent",
+    "completed_lessons", "submitted_lessons", "checked_lessons",
+)
+SUBMISSION_COLUMNS = ("user_id", "lesson_id", "checked", "answer")
+FUNNEL_COLUMNS = ("lesson_id", "reached", "completed", "submitted", "checked", "completed_percent")
+
+def export_formats() -> List[str]:
+    """Доступные форматы выгрузки"""
+    return ["csv", "jsonl"] + (["parquet"] if pq is not None else [])
+
+# ========== ЗАПИСЬ ЧАСТЯМИ ==========
+
+class _TextPart:
+    """Часть выгрузки в CSV или JSONL, сжатая gzip"""
+
+    def __init__(self, path: str, fmt: str, columns: tuple):
+        self.path = path
+        self._raw = open(path, "wb")
+        # Уровень 6 вместо 9 по умолчанию: вдвое быстрее при почти том же размере
+        gz = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        self._text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._text, fieldnames=columns)
+            self._csv.writeheader()
+
+    def write(self, rows: List[dict]):
+        if self._csv is not None:
+            self._csv.writerows(rows)
+        else:
+            self._text.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    def size(self) -> int:
+        # Сброс буферов текста и zlib (sync flush) раз на пачку почти не ухудшает сжатие
+        self._text.flush()
+        return self._raw.tell()
+
+    def close(self):
+        self._text.close()
+        self._raw.close()
+
+class _ParquetPart:
+    """Часть выгрузки в Parquet: каждый записанный кусок строк - отдельная row group"""
+
+    def __init__(self, path: str, fmt: str, columns: tuple):
+        self.path = path
+        self.columns = columns
+        self._raw = open(path, "wb")
+        self._writer = None
+
+    def write(self, rows: List[dict]):
+        table = pa.Table.from_pylist(rows)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._raw, table.schema, compression="zstd")
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def size(self) -> int:
+        return self._raw.tell()
+
+    def close(self):
+        if self._writer is None:
+            # Пустая таблица: файл со схемой из одних строковых столбцов
+            self._writer = pq.ParquetWriter(self._raw, pa.schema([(name, pa.string()) for name in self.columns]))
+        self._writer.close()
+        self._raw.close()
+
+class ChunkedWriter:
+    """Таблица выгрузки: строки пишутся пачками, файл делится на части по размеру"""
+
+    ROTATE_ROWS = 1000
+
+    def __init__(self, directory: str, name: str, fmt: str, columns: tuple,
+                 max_part_bytes: int = MAX_PART_BYTES):
+        if fmt not in export_formats():
+            raise ValueError(f"Формат выгрузки недоступен: {fmt}")
+        self.directory = directory
+        self.name = name
+        self.fmt = fmt
+        self.columns = columns
+        self.max_part_bytes = max_part_bytes
+        self.rows = 0
+        self.paths: List[str] = []
+        self._part = None
+
+    def _open_part(self):
+        suffix = "parquet" if self.fmt == "parquet" else f"{self.fmt}.gz"
+        number = f"-{len(self.paths) + 1}" if self.paths else ""
+        path = os.path.join(self.directory, f"{self.name}{number}.{suffix}")
+        part_class = _ParquetPart if self.fmt == "parquet" else _TextPart
+        self._part = part_class(path, self.fmt, self.columns)
+        self.paths.append(path)
+
+    def write(self, rows: List[dict]):
+        # Размер проверяется между кусками по ROTATE_ROWS строк: часть превышает предел не больше чем на кусок
+        for start in range(0, len(rows), self.ROTATE_ROWS):
+            if self._part is None:
+                self._open_part()
+            elif self._part.size() >= self.max_part_bytes:
+                self._part.close()
+                self._open_part()
+            self._part.write(rows[start:start + self.ROTATE_ROWS])
+        self.rows += len(rows)
+
+    def close(self) -> List[str]:
+        if self._part is None:
+            self._open_part()
+        self._part.close()
+        self._part = None
+        return self.paths
+
+# ========== СТРОКИ ВЫГРУЗКИ ==========
+
+def _lessons(lesson_ids: Iterable[int]) -> str:
+    return " ".join(str(lesson_id) for lesson_id in lesson_ids)
+
+def progress_row(progress: UserProgress, total_lessons: int) -> dict:
+    completed = len(progress.completed_lessons)
+    return {
+        "user_id": split_user_key(progress.user_id)[1],
+        "status": progress.status.value,
+        "current_lesson": progress.current_lesson,
+        "completed_count": completed,
+        "completed_percent": round(completed * 100 / total_lessons, 1) if total_lessons else 0.0,
+        "completed_lessons": _lessons(progress.completed_lessons),
+        "submitted_lessons": _lessons(progress.submitted_assignments),
+        "checked_lessons": _lessons(
+            lesson_id for lesson_id, checked in progress.checked_assignments.items() if checked
+        ),
+    }
+
+class _FunnelCounter:
+    """Воронка по урокам, накапливаемая по ходу обхода (память - O(число уроков))"""
+
+    def __init__(self, total_lessons: int):
+        self.total_lessons = total_lessons
+        self.users = 0
+        self.counts: Dict[int, Dict[str, int]] = {
+            lesson_id: {"reached": 0, "completed": 0, "submitted": 0, "checked": 0}
+            for lesson_id in range(1, total_lessons + 1)
+        }
+
+    def add(self, progress: UserProgress):
+        self.users += 1
+        for lesson_id, counts in self.counts.items():
+            completed = lesson_id in progress.completed_lessons
+            # Дошел до урока N: текущий урок не меньше N или урок N уже пройден
+            if progress.current_lesson >= lesson_id or completed:
+                counts["reached"] += 1
+            if completed:
+                counts["completed"] += 1
+            if progress.submitted_mask >> lesson_id & 1:
+                counts["submitted"] += 1
+                if progress.checked_mask >> lesson_id & 1:
+                    counts["checked"] += 1
+
+    def rows(self) -> List[dict]:
+        total = max(self.users, 1)
+        return [
+            {"lesson_id": lesson_id, **counts, "completed_percent": round(counts["completed"] * 100 / total, 1)}
+            for lesson_id, counts in self.counts.items()
+        ]
+
+# ========== ВЫГРУЗКА ==========
+
+@dataclass
+class ExportResult:
+    """Файлы готовой выгрузки и итоги"""
+    paths: List[str] = field(default_factory=list)
+    users: int = 0
+    submissions: int = 0
+    seconds: float = 0.0
+
+def export_course(
+    batches: Iterable[List[UserProgress]],
+    directory: str,
+    fmt: str,
+    total_lessons: int,
+    read_answer: Callable[[UserProgress, int], str],
+    chunk_size: int = 10000,
+    max_part_bytes: int = MAX_PART_BYTES,
+) -> ExportResult:
+    """Выгрузить прогресс, ответы и воронку курса в файлы directory
+
+    batches - записи прогресса пачками (например, ProgressReader.iter_progress), в
+    памяти одновременно находятся одна пачка и до chunk_size готовых строк
+    на таблицу. Функция синхронная и читает ответы с диска: ее нужно
+    вызывать в отдельном потоке (asyncio.to_thread).
+    """
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    progress_table = ChunkedWriter(directory, "progress", fmt, PROGRESS_COLUMNS, max_part_bytes)
+    submission_table = ChunkedWriter(directory, "submissions", fmt, SUBMISSION_COLUMNS, max_part_bytes)
+    funnel = _FunnelCounter(total_lessons)
+    progress_rows: List[dict] = []
+    submission_rows: List[dict] = []
+
+    for batch in batches:
+        for progress in batch:
+            funnel.add(progress)
+            progress_rows.append(progress_row(progress, total_lessons))
+            for lesson_id in progress.submitted_assignments:
+                submission_rows.append({
+                    "user_id": split_user_key(progress.user_id)[1],
+                    "lesson_id": lesson_id,
+                    "checked": bool(progress.checked_mask >> lesson_id & 1),
+                    "answer": read_answer(progress, lesson_id),
+                })
+            if len(progress_rows) >= chunk_size:
+                progress_table.write(progress_rows)
+                progress_rows = []
+            if len(submission_rows) >= chunk_size:
+                submission_table.write(submission_rows)
+                submission_rows = []
+    if progress_rows:
+        progress_table.write(progress_rows)
+    if submission_rows:
+        submission_table.write(submission_rows)
+
+    funnel_table = ChunkedWriter(directory, "funnel", fmt, FUNNEL_COLUMNS, max_part_bytes)
+    funnel_table.write(funnel.rows())
+
+    result = ExportResult(
+        paths=progress_table.close() + submission_table.close() + funnel_table.close(),
+        users=progress_table.rows,
+        submissions=submission_table.rows,
+        seconds=time.perf_counter() - started,
+    )
+    logger.info(f"Выгрузка {fmt}: {result.users} пользователей, {result.submissions} ответов за {result.seconds:.1f} с")
+    return result
@@ -0,0 +1,170 @@
+# Быстрый холодный старт webhook-режима (Render free tier)
+#
+# Импорт bot.py занимает секунды: aiogram при импорте строит сотни
+# pydantic-моделей типов Telegram, а сам модуль создает Bot, Dispatcher,
+# хранилища и компилирует курсы. Все это время порт закрыт: Render ждет,
+# а апдейт, разбудивший сервис, ждет еще дольше. Здесь порт занимается
+# сразу легким aiohttp-приложением - /health отвечает 200, запросы к боту
+# ждут прогрева. bot.py импортируется в отдельном потоке, event loop в это
+# время продолжает отвечать. Затем приложение бота запускается на том же
+# слушающем сокете (копия дескриптора), временный сервер закрывается, а
+# дождавшиеся прогрева запросы пересылаются уже запущенному боту.
+#
+# Этапы запуска пишутся в лог и отдаются в /metrics как bot_startup_*.
+#
+# Запуск: python faststart.py (вместо python bot.py). Polling и
+# многопроцессный режим запускаются как обычно.
+import time
+
+STARTED = time.perf_counter()
+
+import os
+import sys
+import socket
+import asyncio
+import logging
+import importlib
+from typing import Dict, Optional
+
+from aiohttp import web, ClientSession, ClientTimeout
+
+logger = logging.getLogger(__name__)
+
+# Сколько запрос к боту может ждать прогрева, секунды
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "60"))
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class StartupProfile:
+    """Этапы запуска: секунды от старта процесса до конца этапа"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def mark(self, stage: str):
+        self.stages[stage] = time.perf_counter() - STARTED
+
+    def summary(self) -> str:
+        return ", ".join(f"{stage} {seconds:.2f} с" for stage, seconds in self.stages.items())
+
+    def metrics(self) -> Dict[str, float]:
+        return {f"{stage}_seconds": seconds for stage, seconds in self.stages.items()}
+
+class FastStart:
+    """Временный сервер на порту бота на время импорта bot.py"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.profile = StartupProfile()
+        self.ready = asyncio.Event()
+        self.bot = None
+        self.session: Optional[ClientSession] = None
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.Response(text="OK (прогрев)", status=200)
+
+    async def hold(self, request: web.Request) -> web.Response:
+        """Запрос к боту во время прогрева: дождаться запуска бота и переслать"""
+        body = await request.read()
+        try:
+            await asyncio.wait_for(self.ready.wait(), WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            return web.Response(status=503, headers={"Retry-After": "5"})
+        if self.bot is None:
+            return web.Response(status=503, headers={"Retry-After": "5"})
+
+        headers = {"Content-Type": request.headers.get("Content-Type", "application/json")}
+        if SECRET_HEADER in request.headers:
+            headers[SECRET_HEADER] = request.headers[SECRET_HEADER]
+        # Временный сервер уже закрыт, на сокете слушает только бот
+        host = "127.0.0.1" if self.host in ("0.0.0.0", "") else self.host
+        try:
+            async with self.session.request(
+                request.method, f"http://{host}:{self.port}{request.path_qs}", data=body, headers=headers
+            ) as response:
+                return web.Response(body=await response.read(), status=response.status,
+                                    content_type=response.content_type)
+        except Exception as e:
+            logger.warning(f"Не удалось передать запрос боту после прогрева: {e}")
+            return web.Response(status=503)
+
+    async def first_update(self, handler, event, data):
+        """Outer middleware: отметить обработку первого апдейта"""
+        try:
+            return await handler(event, data)
+        finally:
+            if "first_update" not in self.profile.stages:
+                self.profile.mark("first_update")
+                logger.info(f"Первый апдейт обработан через {self.profile.stages['first_update']:.2f} с после старта")
+
+    async def _import_bot(self):
+        # Импорты тяжелые и синхронные: в потоке, чтобы loop отвечал на /health
+        await asyncio.to_thread(importlib.import_module, "aiogram")
+        self.profile.mark("aiogram_imported")
+        bot = await asyncio.to_thread(importlib.import_module, "bot")
+        self.profile.mark("bot_imported")
+        bot.dp.update.outer_middleware(self.first_update)
+        bot.metrics.register_collector("bot_startup", "Этапы запуска, секунды от старта процесса",
+                                       self.profile.metrics)
+        return bot
+
+    async def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(128)
+        sock.setblocking(False)
+
+        app = web.Application()
+        app.router.add_get("/health", self.health)
+        app.router.add_route("*", "/{path:.*}", self.hold)
+        warmup = web.AppRunner(app)
+        await warmup.setup()
+        # Временный сервер работает на копии дескриптора: его закрытие не закрывает сокет бота
+        warmup_site = web.SockSite(warmup, sock.dup())
+        await warmup_site.start()
+        self.profile.mark("port_bound")
+        logger.info(f"Порт {self.port} открыт через {self.profile.stages['port_bound']:.2f} с, загружаю бота...")
+
+        self.session = ClientSession(timeout=ClientTimeout(total=WARMUP_TIMEOUT))
+        runner = None
+        try:
+            self.bot = await self._import_bot()
+            runner = await self.bot.start_webhook(self.host, self.port, sock=sock)
+            self.profile.mark("app_started")
+        finally:
+            # Дальше принимает только бот; ждущие запросы пересылаются ему (или получают 503)
+            await warmup_site.stop()
+            self.ready.set()
+            await warmup.cleanup()
+            await self.session.close()
+        logger.info(f"Профиль запуска: {self.profile.summary()}")
+
+        try:
+            await self.bot.wait_for_stop()
+        finally:
+            await runner.cleanup()
+
+def main():
+    # Режим выбираем так же, как bot.py, но без его импорта
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    if not os.getenv("RENDER_EXTERNAL_URL") or int(os.getenv("WEB_WORKERS", "1")) > 1:
+        import runpy
+        runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py"), run_name="__main__")
+        return
+
+    try:
+        asyncio.run(FastStart("0.0.0.0", int(os.environ.get("PORT", 10000))).run())
+    except KeyboardInterrupt:
+        logger.info("Бот остановлен")
+    except Exception as e:
+        logger.error(f"Ошибка при запуске бота: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
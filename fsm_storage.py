@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+class _Shard:
+    """Один файл SQLite со своим соединением и блокировкой"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, "
+            "state TEXT, "
+            "data TEXT NOT NULL DEFAULT '{}', "
+            "updated_at REAL NOT NULL)"
+        )
+
+    def read(self, key: str) -> Optional[Tuple[Optional[str], str, float]]:
+        with self.lock:
+            return self.conn.execute(
+                "SELECT state, data, updated_at FROM fsm WHERE key = ?", (key,)
+            ).fetchone()
+
+    def write(self, key: str, state: Optional[str], data: str, updated_at: float):
+        with self.lock:
+            if state is None and data == "{}":
+                # Пустая запись ничем не отличается от отсутствующей
+                self.conn.execute(
+                    "DELETE FROM fsm WHERE key = ? AND updated_at <= ?", (key, updated_at)
+                )
+            else:
+                self.conn.execute(
+                    "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, "
+                    "data = excluded.data, updated_at = excluded.updated_at "
+                    # Не даем более старой записи из другого потока затереть новую
+                    "WHERE excluded.updated_at >= fsm.updated_at",
+                    (key, state, data, updated_at),
+                )
+
+    def delete_older_than(self, timestamp: float) -> int:
+        with self.lock:
+            return self.conn.execute("DELETE FROM fsm WHERE updated_at < ?", (timestamp,)).rowcount
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class _CacheRecord:
+    __slots__ = ("state", "data", "updated_at", "loaded_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated_at: float, loaded_at: float):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+        self.loaded_at = loaded_at
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище на SQLite, разбитое на шарды по user_id
+
+    Каждый шард - отдельный файл в WAL-режиме, поэтому запись одного
+    пользователя не блокирует остальных, а несколько процессов на одной
+    машине могут работать с одними и теми же файлами.
+
+    Прочитанные записи кэшируются в памяти на cache_ttl секунд. Если
+    несколько реплик обрабатывают одного пользователя без маршрутизации
+    по user_id, кэш нужно отключить (cache_ttl=0). Состояния, которые не
+    менялись дольше state_ttl секунд, считаются устаревшими и удаляются.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        shards: int = 8,
+        cache_ttl: float = 60.0,
+        state_ttl: Optional[float] = 7 * 24 * 3600,
+    ):
+        if shards < 1:
+            raise ValueError("Количество шардов должно быть положительным")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.cache_ttl = cache_ttl
+        self.state_ttl = state_ttl
+        self._shards: List[_Shard] = [
+            _Shard(os.path.join(directory, f"fsm-{i}.sqlite3")) for i in range(shards)
+        ]
+        self._cache: Dict[StorageKey, _CacheRecord] = {}
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _build_key(key: StorageKey) -> str:
+        parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        if key.thread_id:
+            parts.append(str(key.thread_id))
+        if key.business_connection_id:
+            parts.append(str(key.business_connection_id))
+        parts.append(key.destiny)
+        return ":".join(parts)
+
+    def _shard(self, key: StorageKey) -> _Shard:
+        return self._shards[key.user_id % len(self._shards)]
+
+    def _is_stale(self, updated_at: float, now: float) -> bool:
+        return self.state_ttl is not None and updated_at + self.state_ttl < now
+
+    async def _load(self, key: StorageKey) -> _CacheRecord:
+        now = time.time()
+        record = self._cache.get(key)
+        if record is not None and record.loaded_at + self.cache_ttl > now:
+            if not self._is_stale(record.updated_at, now):
+                return record
+            record.state, record.data = None, {}
+            return record
+
+        row = await asyncio.to_thread(self._shard(key).read, self._build_key(key))
+        if row is None or self._is_stale(row[2], now):
+            record = _CacheRecord(None, {}, now, now)
+        else:
+            record = _CacheRecord(row[0], json.loads(row[1]), row[2], now)
+
+        if self.cache_ttl > 0:
+            self._cache[key] = record
+        return record
+
+    async def _save(self, key: StorageKey, record: _CacheRecord):
+        now = time.time()
+        record.updated_at = now
+        record.loaded_at = now
+        if self.cache_ttl > 0:
+            self._cache[key] = record
+        await asyncio.to_thread(
+            self._shard(key).write,
+            self._build_key(key),
+            record.state,
+            json.dumps(record.data, ensure_ascii=False, separators=(",", ":")),
+            now,
+        )
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._load(key)
+        new_record = _CacheRecord(
+            state.state if isinstance(state, State) else state,
+            record.data,
+            record.updated_at,
+            record.loaded_at,
+        )
+        await self._save(key, new_record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        record = await self._load(key)
+        new_record = _CacheRecord(record.state, data.copy(), record.updated_at, record.loaded_at)
+        await self._save(key, new_record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(key)).data.copy()
+
+    def evict_expired(self) -> int:
+        """Убрать из кэша записи, срок жизни которых истек"""
+        deadline = time.time() - self.cache_ttl
+        expired = [key for key, record in self._cache.items() if record.loaded_at < deadline]
+        for key in expired:
+            del self._cache[key]
+        return len(expired)
+
+    async def purge_stale(self) -> int:
+        """Удалить из базы устаревшие состояния"""
+        if self.state_ttl is None:
+            return 0
+        deadline = time.time() - self.state_ttl
+        removed = 0
+        for shard in self._shards:
+            removed += await asyncio.to_thread(shard.delete_older_than, deadline)
+        self.evict_expired()
+        if removed:
+            logger.info(f"Удалено устаревших FSM-состояний: {removed}")
+        return removed
+
+    async def start(self, purge_interval: float = 3600.0):
+        """Запустить периодическую очистку кэша и устаревших состояний"""
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop(purge_interval))
+
+    async def _maintenance_loop(self, purge_interval: float):
+        evict_interval = max(self.cache_ttl, 1.0)
+        next_purge = time.monotonic() + purge_interval
+        while True:
+            await asyncio.sleep(evict_interval)
+            try:
+                self.evict_expired()
+                if time.monotonic() >= next_purge:
+                    next_purge = time.monotonic() + purge_interval
+                    await self.purge_stale()
+            except Exception as e:
+                logger.error(f"Ошибка при очистке FSM-хранилища: {e}")
+
+    async def close(self) -> None:
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        self._cache.clear()
+        for shard in self._shards:
+            await asyncio.to_thread(shard.close)
@@ -0,0 +1,153 @@
+import json
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from multiworker import extract_user_id
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+class RecentIds:
+    """Последние N увиденных ключей апдейтов для отсева повторных доставок"""
+
+    def __init__(self, size: int):
+        self._order = deque(maxlen=size)
+        self._ids = set()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._ids
+
+    def add(self, key: Hashable):
+        if len(self._order) == self._order.maxlen:
+            self._ids.discard(self._order[0])
+        self._order.append(key)
+        self._ids.add(key)
+
+class WebhookIngest:
+    """Прием webhook с немедленным ответом и обработкой из очереди
+
+    Обработчик запроса только разбирает JSON, проверяет update_id, отсеивает
+    повторы и кладет апдейт в очередь - Telegram получает 200 сразу, не
+    дожидаясь обработчиков бота. Очередь разбита по пользователям: у каждой
+    задачи-обработчика своя часть, и апдейты одного пользователя всегда
+    попадают в одну часть, поэтому передаются в dispatcher строго по
+    порядку, какие бы await ни были внутри обработки. Если в очереди уже
+    max_queue апдейтов, webhook отвечает 503 и апдейт не запоминается,
+    чтобы повтор Telegram был обработан. Несколько ботов на одной очереди различаются через
+    resolve_bot (бот по запросу), повторы отсеиваются по паре (бот, update_id).
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Optional[Bot] = None, workers: int = 256,
+                 max_queue: int = 5000, dedupe_window: int = 100000, retry_after: int = 1,
+                 resolve_bot: Optional[Callable[[web.Request], Optional[Bot]]] = None):
+        self.dispatcher = dispatcher
+        self.resolve_bot = resolve_bot or (lambda request: bot)
+        self.workers = workers
+        self.retry_after = retry_after
+        self.max_queue = max_queue
+        self._queues: "List[asyncio.Queue[Tuple[Bot, Dict[str, Any]]]]" = [
+            asyncio.Queue() for _ in range(workers)
+        ]
+        self._queued = 0
+        self._seen = RecentIds(dedupe_window)
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+
+        # Метрики
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.invalid = 0
+        self.processed = 0
+        self.errors = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """aiohttp-обработчик /webhook"""
+        bot = self.resolve_bot(request)
+        if bot is None:
+            return web.Response(status=404)
+        try:
+            update = _loads(await request.read())
+            update_id = update["update_id"]
+        except (ValueError, TypeError, KeyError):
+            self.invalid += 1
+            return web.Response(status=400)
+        if not isinstance(update_id, int):
+            self.invalid += 1
+            return web.Response(status=400)
+
+        key = (bot.id, update_id)
+        if key in self._seen:
+            # Повторная доставка уже принятого апдейта: подтверждаем, но не обрабатываем
+            self.duplicates += 1
+            return web.Response()
+        if not self._accepting or self._queued >= self.max_queue:
+            self.rejected += 1
+            return web.Response(status=503, headers={"Retry-After": str(self.retry_after)})
+
+        self._queues[extract_user_id(update) % self.workers].put_nowait((bot, update))
+        self._queued += 1
+        self._seen.add(key)
+        self.accepted += 1
+        return web.Response()
+
+    async def _worker(self, queue: "asyncio.Queue[Tuple[Bot, Dict[str, Any]]]"):
+        while True:
+            bot, update = await queue.get()
+            try:
+                await self.dispatcher.feed_raw_update(bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+            finally:
+                self._queued -= 1
+                queue.task_done()
+
+    async def start(self, app: Optional[web.Application] = None):
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+        self._accepting = True
+        logger.info(f"Прием webhook через очередь: {self.workers} обработчиков, очередь {self.max_queue}")
+
+    async def join(self):
+        """Дождаться обработки всех принятых апдейтов"""
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def stop(self, app: Optional[web.Application] = None, timeout: float = 30):
+        """Перестать принимать апдейты и дообработать очередь"""
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не дообработано апдейтов при остановке: {self._queued}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def register(self, app: web.Application, path: str = "/webhook"):
+        app.router.add_post(path, self.handle)
+        app.on_startup.append(self.start)
+        # До остановки dispatcher, чтобы очередь дообработалась с живыми хранилищами
+        app.on_shutdown.append(self.stop)
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "queued": self._queued,
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "invalid": self.invalid,
+            "processed": self.processed,
+            "errors": self.errors,
+        }
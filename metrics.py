@@ -0,0 +1,268 @@
+import time
+import logging
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """Монотонный счетчик с метками"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in self.values.items()
+        ]
+
+class Gauge(Counter):
+    """Текущее значение, которое может уменьшаться"""
+    kind = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values: str, value: float):
+        self.values[label_values] = value
+
+class _HistogramSeries:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.total = 0.0
+        self.count = 0
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами
+
+    Наблюдение - бинарный поиск корзины и три сложения int. Все вызовы
+    идут из одного event loop, поэтому блокировки не нужны.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[LabelValues, _HistogramSeries] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = _HistogramSeries(len(self.buckets) + 1)
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.total += value
+        series.count += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series.total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series.count}")
+        return lines
+
+class MetricsRegistry:
+    """Набор метрик и функций-сборщиков для вывода в формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Tuple[str, str, Callable[[], Dict[str, float]]]] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def register_collector(self, prefix: str, documentation: str, collect: Callable[[], Dict[str, float]]):
+        """Снимать gauge-значения из metrics() компонента в момент запроса"""
+        self._collectors.append((prefix, documentation, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        for prefix, documentation, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                logger.error(f"Ошибка сборщика метрик {prefix}: {e}")
+                continue
+            for key, value in values.items():
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {documentation}: {key}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """aiohttp-обработчик /metrics"""
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: полное время обработки и ошибки
+
+    Регистрируется до UserOrderingMiddleware, поэтому время включает
+    ожидание очереди пользователя.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.duration = registry.histogram(
+            "bot_update_seconds", "Время от получения апдейта до конца обработки", ("type",)
+        )
+        self.errors = registry.counter("bot_update_errors_total", "Апдейты, завершившиеся исключением", ("type",))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = getattr(event, "event_type", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc(update_type)
+            raise
+        finally:
+            self.duration.observe(time.perf_counter() - started, update_type)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: задержка и число выполняющихся вызовов по обработчикам"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.duration = registry.histogram("bot_handler_seconds", "Время выполнения обработчика", ("handler",))
+        self.in_flight = registry.gauge("bot_handler_in_flight", "Выполняющиеся обработчики", ("handler",))
+        self.errors = registry.counter("bot_handler_errors_total", "Исключения в обработчиках", ("handler",))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        self.in_flight.inc(name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc(name)
+            raise
+        finally:
+            self.duration.observe(time.perf_counter() - started, name)
+            self.in_flight.dec(name)
+
+class TelegramAPIMetrics(BaseRequestMiddleware):
+    """Middleware сессии бота: задержка и ошибки запросов к Telegram API"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.duration = registry.histogram("telegram_api_seconds", "Время запроса к Telegram API", ("method",))
+        self.errors = registry.counter(
+            "telegram_api_errors_total", "Ошибки запросов к Telegram API", ("method", "error")
+        )
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            self.errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.duration.observe(time.perf_counter() - started, name)
+
+def merge_expositions(sources: Iterable[Tuple[str, str]], label: str = "worker") -> str:
+    """Объединить тексты /metrics нескольких процессов, добавив метку источника
+
+    Строки одного семейства метрик остаются рядом, HELP/TYPE выводятся
+    один раз.
+    """
+    families: Dict[str, List[str]] = {}
+    headers: Dict[str, List[str]] = {}
+    for source, text in sources:
+        family = None
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("#"):
+                parts = line.split(" ", 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = parts[2]
+                    families.setdefault(family, [])
+                    if len(headers.setdefault(family, [])) < 2:
+                        headers[family].append(line)
+                continue
+            extra = f'{label}="{_escape(source)}"'
+            name, _, rest = line.partition(" ")
+            if name.endswith("}"):
+                name = name[:-1] + "," + extra + "}"
+            else:
+                name = name + "{" + extra + "}"
+            families.setdefault(family or name, []).append(f"{name} {rest}")
+    lines: List[str] = []
+    for family, samples in families.items():
+        lines.extend(headers.get(family, []))
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,296 @@
+from typing import Dict, Iterable, Iterator, Optional, Union
+from enum import Enum
+from dataclasses import dataclass
+from collections.abc import MutableMapping
+
+# Структуры данных
+class UserStatus(Enum):
+    NOT_STARTED = "not_started"
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+
+# Компактные коды статусов для двоичного журнала событий, снимков и колоночной статистики админки
+STATUS_CODES = {
+    UserStatus.NOT_STARTED: 0,
+    UserStatus.IN_PROGRESS: 1,
+    UserStatus.COMPLETED: 2,
+}
+
+# Ключ пользователя в общих хранилищах: номер арендатора (бота) в старших
+# битах, id Telegram (не больше 52 значащих бит) - в младших. У арендатора
+# 0 ключ совпадает с id пользователя.
+NAMESPACE_SHIFT = 52
+USER_ID_MASK = (1 << NAMESPACE_SHIFT) - 1
+MAX_NAMESPACE = (1 << (63 - NAMESPACE_SHIFT)) - 1
+
+def make_user_key(namespace: int, user_id: int) -> int:
+    return (namespace << NAMESPACE_SHIFT) | user_id
+
+def split_user_key(key: int) -> tuple:
+    """(номер арендатора, id пользователя в Telegram)"""
+    return key >> NAMESPACE_SHIFT, key & USER_ID_MASK
+
+class AssignmentStatus(Enum):
+    NOT_SUBMITTED = "not_submitted"
+    SUBMITTED = "submitted"
+    CHECKED = "checked"
+
+def _mask_bits(mask: int) -> Iterator[int]:
+    """Номера установленных битов по возрастанию"""
+    bit = 0
+    while mask:
+        if mask & 1:
+            yield bit
+        mask >>= 1
+        bit += 1
+
+def popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+class AnswerRef:
+    """Ссылка на ответ в хранилище ответов: handle для чтения и короткое превью"""
+    __slots__ = ("handle", "preview")
+
+    def __init__(self, handle: int, preview: str):
+        self.handle = handle
+        self.preview = preview
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, AnswerRef):
+            return NotImplemented
+        return self.handle == other.handle and self.preview == other.preview
+
+    def __repr__(self) -> str:
+        return f"AnswerRef(handle={self.handle!r}, preview={self.preview!r})"
+
+class CompletedLessonsView:
+    """Список пройденных уроков поверх битовой маски"""
+    __slots__ = ("_progress",)
+
+    def __init__(self, progress: "UserProgress"):
+        self._progress = progress
+
+    def append(self, lesson_id: int):
+        self._progress.completed_mask |= 1 << lesson_id
+
+    def remove(self, lesson_id: int):
+        if lesson_id not in self:
+            raise ValueError(f"{lesson_id} is not in list")
+        self._progress.completed_mask &= ~(1 << lesson_id)
+
+    def __contains__(self, lesson_id: int) -> bool:
+        return lesson_id >= 0 and bool(self._progress.completed_mask >> lesson_id & 1)
+
+    def __len__(self) -> int:
+        return popcount(self._progress.completed_mask)
+
+    def __iter__(self) -> Iterator[int]:
+        return _mask_bits(self._progress.completed_mask)
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+class SubmittedAssignmentsView(MutableMapping):
+    """Сданные задания (lesson_id: ответ) поверх маски и внешнего словаря ответов
+
+    Значение - текст ответа или AnswerRef, если ответ вынесен в хранилище
+    ответов; при чтении для AnswerRef возвращается превью.
+    """
+    __slots__ = ("_progress",)
+
+    def __init__(self, progress: "UserProgress"):
+        self._progress = progress
+
+    def __getitem__(self, lesson_id: int) -> str:
+        progress = self._progress
+        if not (lesson_id >= 0 and progress.submitted_mask >> lesson_id & 1):
+            raise KeyError(lesson_id)
+        answer = progress._answers.get(lesson_id, "") if progress._answers else ""
+        return answer.preview if isinstance(answer, AnswerRef) else answer
+
+    def __setitem__(self, lesson_id: int, answer: Union[str, AnswerRef]):
+        progress = self._progress
+        progress.submitted_mask |= 1 << lesson_id
+        if progress._answers is None:
+            progress._answers = {}
+        progress._answers[lesson_id] = answer
+
+    def __delitem__(self, lesson_id: int):
+        progress = self._progress
+        if not (lesson_id >= 0 and progress.submitted_mask >> lesson_id & 1):
+            raise KeyError(lesson_id)
+        progress.submitted_mask &= ~(1 << lesson_id)
+        progress.checked_mask &= ~(1 << lesson_id)
+        if progress._answers:
+            progress._answers.pop(lesson_id, None)
+            if not progress._answers:
+                progress._answers = None
+
+    def __contains__(self, lesson_id) -> bool:
+        return isinstance(lesson_id, int) and lesson_id >= 0 and bool(self._progress.submitted_mask >> lesson_id & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        return _mask_bits(self._progress.submitted_mask)
+
+    def __len__(self) -> int:
+        return popcount(self._progress.submitted_mask)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+class CheckedAssignmentsView(MutableMapping):
+    """Проверенные задания (lesson_id: bool) для сданных уроков"""
+    __slots__ = ("_progress",)
+
+    def __init__(self, progress: "UserProgress"):
+        self._progress = progress
+
+    def __getitem__(self, lesson_id: int) -> bool:
+        progress = self._progress
+        if not (lesson_id >= 0 and progress.submitted_mask >> lesson_id & 1):
+            raise KeyError(lesson_id)
+        return bool(progress.checked_mask >> lesson_id & 1)
+
+    def __setitem__(self, lesson_id: int, checked: bool):
+        if checked:
+            self._progress.checked_mask |= 1 << lesson_id
+        else:
+            self._progress.checked_mask &= ~(1 << lesson_id)
+
+    def __delitem__(self, lesson_id: int):
+        self[lesson_id] = False
+
+    def __contains__(self, lesson_id) -> bool:
+        return lesson_id in self._progress.submitted_assignments
+
+    def __iter__(self) -> Iterator[int]:
+        return _mask_bits(self._progress.submitted_mask)
+
+    def __len__(self) -> int:
+        return popcount(self._progress.submitted_mask)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+class UserProgress:
+    """Компактный прогресс пользователя
+
+    Пройденные, сданные и проверенные уроки хранятся битовыми масками
+    (бит N - урок N), ответы (AnswerRef на хранилище ответов или, для
+    старых записей, сам текст) - в отдельном словаре, который создается
+    только после первой сдачи. Для курса из 5 уроков маски -
+    это малые int, которые Python не выделяет заново, поэтому запись
+    занимает около сотни байт вместо сотен байт у dataclass со списком
+    и двумя словарями. Атрибуты completed_lessons, submitted_assignments
+    и checked_assignments остаются и работают как прежние list/dict.
+    """
+    __slots__ = (
+        "user_id", "current_lesson", "status",
+        "completed_mask", "submitted_mask", "checked_mask", "_answers",
+        # Кэш хранилища находит вытесненные записи по слабой ссылке
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        user_id: int,
+        current_lesson: int = 1,
+        completed_lessons: Optional[Iterable[int]] = None,
+        submitted_assignments: Optional[Dict[int, str]] = None,  # lesson_id: answer
+        checked_assignments: Optional[Dict[int, bool]] = None,  # lesson_id: is_checked
+        status: UserStatus = UserStatus.NOT_STARTED,
+    ):
+        self.user_id = user_id
+        self.current_lesson = current_lesson
+        self.status = status
+        self.completed_mask = 0
+        self.submitted_mask = 0
+        self.checked_mask = 0
+        self._answers: Optional[Dict[int, Union[str, AnswerRef]]] = None
+        if completed_lessons:
+            self.completed_lessons = completed_lessons
+        if submitted_assignments:
+            self.submitted_assignments = submitted_assignments
+        if checked_assignments:
+            self.checked_assignments = checked_assignments
+
+    @property
+    def completed_lessons(self) -> CompletedLessonsView:
+        return CompletedLessonsView(self)
+
+    @completed_lessons.setter
+    def completed_lessons(self, lessons: Iterable[int]):
+        mask = 0
+        for lesson_id in lessons:
+            mask |= 1 << lesson_id
+        self.completed_mask = mask
+
+    @property
+    def submitted_assignments(self) -> SubmittedAssignmentsView:
+        return SubmittedAssignmentsView(self)
+
+    @submitted_assignments.setter
+    def submitted_assignments(self, answers: Dict[int, str]):
+        self.submitted_mask = 0
+        self._answers = None
+        view = SubmittedAssignmentsView(self)
+        for lesson_id, answer in answers.items():
+            view[lesson_id] = answer
+
+    @property
+    def checked_assignments(self) -> CheckedAssignmentsView:
+        return CheckedAssignmentsView(self)
+
+    @checked_assignments.setter
+    def checked_assignments(self, checked: Dict[int, bool]):
+        self.checked_mask = 0
+        for lesson_id, is_checked in checked.items():
+            if is_checked:
+                self.checked_mask |= 1 << lesson_id
+
+    def answer_ref(self, lesson_id: int) -> Optional[AnswerRef]:
+        """Ссылка на вынесенный ответ (None, если ответ хранится в записи)"""
+        answer = self._answers.get(lesson_id) if self._answers else None
+        return answer if isinstance(answer, AnswerRef) else None
+
+    def assignment_status(self, lesson_id: int) -> AssignmentStatus:
+        """Статус задания к уроку"""
+        if not (self.submitted_mask >> lesson_id & 1):
+            return AssignmentStatus.NOT_SUBMITTED
+        if self.checked_mask >> lesson_id & 1:
+            return AssignmentStatus.CHECKED
+        return AssignmentStatus.SUBMITTED
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, UserProgress):
+            return NotImplemented
+        return (
+            self.user_id == other.user_id
+            and self.current_lesson == other.current_lesson
+            and self.status == other.status
+            and self.completed_mask == other.completed_mask
+            and self.submitted_mask == other.submitted_mask
+            and self.checked_mask == other.checked_mask
+            and (self._answers or {}) == (other._answers or {})
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"UserProgress(user_id={self.user_id!r}, current_lesson={self.current_lesson!r}, "
+            f"completed_lessons={self.completed_lessons!r}, "
+            f"submitted_assignments={self.submitted_assignments!r}, "
+            f"checked_assignments={self.checked_assignments!r}, status={self.status!r})"
+        )
+
+@dataclass
+class Lesson:
+    id: int
+    title: str
+    description: str
+    video_url: Optional[str] = None
+    text_content: Optional[str] = None
+    assignment_question: Optional[str] = None
+    assignment_hint: Optional[str] = None
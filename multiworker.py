@@ -0,0 +1,292 @@
+# Многопроцессный режим webhook
+#
+# Фронт-процесс принимает апдейты на /webhook и по user_id отправляет
+# каждый апдейт в один и тот же воркер, поэтому апдейты пользователя
+# обрабатываются по порядку одним процессом. Воркеры - обычные копии
+# bot.py на локальных портах, общие хранилища прогресса и FSM лежат в
+# SQLite-файлах в DATA_DIR. Webhook в Telegram регистрирует и разовые
+# переносы данных выполняет только воркер 0, остальные запускаются после
+# него. Остановка - SIGTERM воркерам: каждый сохраняет прогресс и
+# дожидается отправки своей очереди сообщений.
+#
+# Прогресс воркеры берут из общего SQLite-файла через sqlite-cached: с
+# PROGRESS_BACKEND=sqlite каждый воркер (и каждый его перезапуск) грузил
+# бы всю таблицу в память, поэтому sqlite заменяется на sqlite-cached
+# (формат файла тот же). memory в этом режиме не поддерживается: прогресс
+# не был бы общим и пропадал бы при перезапуске воркера. У eventlog журнал
+# у каждого воркера свой, и в памяти только его пользователи.
+#
+# SO_REUSEPORT здесь не подходит: ядро распределяет соединения, а не
+# пользователей, и апдейты одного пользователя попадали бы в разные
+# процессы.
+import os
+import sys
+import json
+import signal
+import asyncio
+import logging
+from typing import List, Optional
+
+from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
+
+from metrics import merge_expositions
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "18000"))
+# Сколько ждать готовности воркера 0 (он переносит данные в общих базах) и
+# завершения воркера после SIGTERM, секунды
+WORKER_START_TIMEOUT = float(os.getenv("WORKER_START_TIMEOUT", "120"))
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", "30"))
+# Перезапуск упавших воркеров: пауза растет вдвое от WORKER_RESTART_DELAY до
+# WORKER_RESTART_MAX_DELAY секунд. После WORKER_MAX_RESTARTS падений подряд
+# фронт останавливается целиком, и сервис перезапускает платформа. Падение
+# после WORKER_STABLE_SECONDS секунд работы снова считается первым
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "1"))
+WORKER_RESTART_MAX_DELAY = float(os.getenv("WORKER_RESTART_MAX_DELAY", "60"))
+WORKER_MAX_RESTARTS = int(os.getenv("WORKER_MAX_RESTARTS", "5"))
+WORKER_STABLE_SECONDS = float(os.getenv("WORKER_STABLE_SECONDS", "300"))
+WORKER_HOST = "127.0.0.1"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def extract_user_id(update: dict) -> int:
+    """Найти id пользователя (или чата) в апдейте Telegram"""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        for field in ("from", "user"):
+            user = payload.get(field)
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+        chat = payload.get("chat")
+        if chat is None and isinstance(payload.get("message"), dict):
+            chat = payload["message"].get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    # Апдейты без пользователя распределяем по update_id
+    return update.get("update_id", 0)
+
+class _Worker:
+    def __init__(self, index: int, port: int, count: int):
+        self.index = index
+        self.port = port
+        self.count = count
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.started_at = 0.0
+        # Падений подряд и время следующего запуска после падения
+        self.crashes = 0
+        self.restart_at: Optional[float] = None
+
+    def crashed(self, now: float) -> Optional[float]:
+        """Учесть падение: пауза перед перезапуском или None, если пора сдаваться"""
+        self.crashes = 1 if now - self.started_at >= WORKER_STABLE_SECONDS else self.crashes + 1
+        if self.crashes > WORKER_MAX_RESTARTS:
+            return None
+        return min(WORKER_RESTART_MAX_DELAY, WORKER_RESTART_DELAY * 2 ** (self.crashes - 1))
+
+    async def start(self):
+        env = dict(os.environ)
+        # Webhook регистрирует только один воркер
+        env["WEBHOOK_REGISTER"] = "1" if self.index == 0 else "0"
+        env["WEB_WORKERS"] = "1"
+        env["WORKER_INDEX"] = str(self.index)
+        env["WORKER_COUNT"] = str(self.count)
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "worker", str(self.index), str(self.port),
+            env=env,
+        )
+        self.started_at = asyncio.get_running_loop().time()
+        logger.info(f"Воркер {self.index} запущен (pid {self.process.pid}, порт {self.port})")
+
+    async def stop(self):
+        """SIGTERM: воркер сохраняет прогресс и отправляет очередь сообщений"""
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), WORKER_STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error(f"Воркер {self.index} не завершился за {WORKER_STOP_TIMEOUT:.0f} с, останавливаем принудительно")
+                self.process.kill()
+                await self.process.wait()
+
+class WorkerFront:
+    """Фронт, распределяющий апдейты по воркерам"""
+
+    def __init__(self, workers: int):
+        self.workers: List[_Worker] = [
+            _Worker(i, WORKER_BASE_PORT + i, workers) for i in range(workers)
+        ]
+        self.session: Optional[ClientSession] = None
+        self._supervisor: Optional[asyncio.Task] = None
+
+    def route(self, user_id: int) -> _Worker:
+        return self.workers[user_id % len(self.workers)]
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        try:
+            update = _loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        worker = self.route(extract_user_id(update))
+        headers = {"Content-Type": "application/json"}
+        if SECRET_HEADER in request.headers:
+            headers[SECRET_HEADER] = request.headers[SECRET_HEADER]
+
+        try:
+            async with self.session.post(
+                f"http://{WORKER_HOST}:{worker.port}{request.path}", data=body, headers=headers
+            ) as response:
+                return web.Response(body=await response.read(), status=response.status,
+                                    content_type=response.content_type)
+        except Exception as e:
+            # Telegram повторит доставку, если ответить ошибкой
+            logger.warning(f"Воркер {worker.index} недоступен: {e}")
+            return web.Response(status=503)
+
+    async def _worker_ready(self, worker: _Worker) -> bool:
+        if not worker.process or worker.process.returncode is not None:
+            return False
+        try:
+            async with self.session.get(
+                f"http://{WORKER_HOST}:{worker.port}/health", timeout=ClientTimeout(total=2)
+            ) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    async def _wait_ready(self, worker: _Worker, timeout: float) -> bool:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not await self._worker_ready(worker):
+            if worker.process.returncode is not None or asyncio.get_running_loop().time() > deadline:
+                return False
+            await asyncio.sleep(0.5)
+        return True
+
+    async def health_check(self, request: web.Request) -> web.Response:
+        ready = await asyncio.gather(*(self._worker_ready(w) for w in self.workers))
+        alive = sum(ready)
+        status = 200 if alive == len(self.workers) else 503
+        return web.Response(text=f"OK {alive}/{len(self.workers)}", status=status)
+
+    async def _worker_metrics(self, worker: _Worker) -> Optional[str]:
+        try:
+            async with self.session.get(
+                f"http://{WORKER_HOST}:{worker.port}/metrics", timeout=ClientTimeout(total=5)
+            ) as response:
+                if response.status == 200:
+                    return await response.text()
+        except Exception as e:
+            logger.warning(f"Метрики воркера {worker.index} недоступны: {e}")
+        return None
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """Метрики всех воркеров с меткой worker"""
+        texts = await asyncio.gather(*(self._worker_metrics(w) for w in self.workers))
+        body = merge_expositions(
+            (str(worker.index), text) for worker, text in zip(self.workers, texts) if text is not None
+        )
+        return web.Response(text=body, content_type="text/plain", charset="utf-8")
+
+    async def handle_main(self, request: web.Request) -> web.Response:
+        return web.Response(text="Telegram Bot is running! Use /start in Telegram.", status=200)
+
+    async def _supervise(self):
+        """Перезапускать упавшие воркеры с растущей паузой"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(1)
+            for worker in self.workers:
+                if not worker.process or worker.process.returncode is None:
+                    continue
+                now = loop.time()
+                if worker.restart_at is None:
+                    delay = worker.crashed(now)
+                    if delay is None:
+                        logger.critical(
+                            f"Воркер {worker.index} упал {worker.crashes} раз подряд, останавливаем сервис"
+                        )
+                        # Штатная остановка run_app: on_cleanup останавливает остальные воркеры
+                        os.kill(os.getpid(), signal.SIGTERM)
+                        return
+                    worker.restart_at = now + delay
+                    logger.error(
+                        f"Воркер {worker.index} завершился с кодом {worker.process.returncode}, "
+                        f"перезапуск через {delay:g} с (падений подряд: {worker.crashes})"
+                    )
+                if now >= worker.restart_at:
+                    worker.restart_at = None
+                    await worker.start()
+
+    async def on_startup(self, app: web.Application):
+        self.session = ClientSession(
+            connector=TCPConnector(limit=0, keepalive_timeout=60),
+            timeout=ClientTimeout(total=60),
+        )
+        # Воркер 0 при запуске переносит данные в общих базах; остальные
+        # открывают их, когда он готов принимать апдейты
+        first, *rest = self.workers
+        await first.start()
+        if not await self._wait_ready(first, WORKER_START_TIMEOUT):
+            logger.error(f"Воркер 0 не готов за {WORKER_START_TIMEOUT:.0f} с, запускаем остальные")
+        for worker in rest:
+            await worker.start()
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def on_cleanup(self, app: web.Application):
+        if self._supervisor:
+            self._supervisor.cancel()
+        for worker in self.workers:
+            await worker.stop()
+        await self.session.close()
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/webhook", self.handle_webhook)
+        # Боты-арендаторы (TENANTS_FILE) - тот же воркер по user_id, путь сохраняется
+        app.router.add_post("/webhook/{tenant}", self.handle_webhook)
+        app.router.add_get("/health", self.health_check)
+        app.router.add_get("/metrics", self.metrics)
+        app.router.add_get("/", self.handle_main)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+def worker_progress_backend(backend: str) -> str:
+    """Бэкенд прогресса для воркеров: без загрузки всей базы в каждый процесс"""
+    if backend == "sqlite":
+        logger.warning("PROGRESS_BACKEND=sqlite заменен на sqlite-cached: воркеры не грузят базу целиком")
+        return "sqlite-cached"
+    if backend == "memory":
+        raise ValueError("Для нескольких воркеров нужен общий прогресс: PROGRESS_BACKEND=sqlite-cached или eventlog")
+    return backend
+
+def run_multiworker(workers: int):
+    """Запустить фронт и воркеры (блокирующий вызов)"""
+    # Воркеры наследуют окружение фронта
+    os.environ["PROGRESS_BACKEND"] = worker_progress_backend(os.getenv("PROGRESS_BACKEND", "sqlite"))
+    port = int(os.environ.get("PORT", 10000))
+    logger.info(f"Запуск фронта на порту {port} с {workers} воркерами")
+    web.run_app(WorkerFront(workers).build_app(), host="0.0.0.0", port=port, print=None)
+
+def _run_worker(index: int, port: int):
+    import bot
+    bot.logger.info(f"Воркер {index} слушает {WORKER_HOST}:{port}")
+    asyncio.run(bot.main_webhook(host=WORKER_HOST, port=port))
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "worker":
+        try:
+            _run_worker(int(sys.argv[2]), int(sys.argv[3]))
+        except KeyboardInterrupt:
+            pass
+    else:
+        logging.basicConfig(level=logging.INFO)
+        run_multiworker(int(os.getenv("WEB_WORKERS", "2")))
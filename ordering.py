@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+class _KeyLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+class UserOrderingMiddleware(BaseMiddleware):
+    """Последовательная обработка апдейтов одного пользователя
+
+    Апдейты пользователя выполняются строго по одному (asyncio.Lock на
+    user_id), апдейты разных пользователей - параллельно, но не больше
+    max_in_flight обработчиков одновременно. Свободные блокировки хранятся
+    в LRU и вытесняются, когда их больше max_idle_locks, поэтому словарь не
+    растет вместе с числом пользователей. Если ждущих апдейтов больше
+    max_pending, флаг overloaded сообщает webhook-серверу, что новые
+    апдейты пора отклонять.
+    """
+
+    def __init__(self, max_in_flight: int = 256, max_idle_locks: int = 10000, max_pending: int = 5000):
+        self.max_in_flight = max_in_flight
+        self.max_idle_locks = max_idle_locks
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._locks: "OrderedDict[int, _KeyLock]" = OrderedDict()
+        self.in_flight = 0
+        self.pending = 0
+
+    @property
+    def overloaded(self) -> bool:
+        return self.pending >= self.max_pending
+
+    def _acquire_entry(self, key: int) -> _KeyLock:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyLock()
+        else:
+            self._locks.move_to_end(key)
+        entry.users += 1
+        return entry
+
+    def _release_entry(self, key: int, entry: _KeyLock):
+        entry.users -= 1
+        if len(self._locks) <= self.max_idle_locks:
+            return
+        # Вытесняем самые давние свободные блокировки
+        for _ in range(len(self._locks) - self.max_idle_locks):
+            stale_key, stale = next(iter(self._locks.items()))
+            if stale.users:
+                # Занятую блокировку оставляем, ее освободит владелец
+                self._locks.move_to_end(stale_key)
+            else:
+                del self._locks[stale_key]
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            async with self._semaphore:
+                return await handler(event, data)
+
+        entry = self._acquire_entry(user.id)
+        self.pending += 1
+        started = False
+        try:
+            async with entry.lock:
+                async with self._semaphore:
+                    self.pending -= 1
+                    started = True
+                    self.in_flight += 1
+                    try:
+                        return await handler(event, data)
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            # Апдейт могли отменить, пока он ждал своей очереди
+            if not started:
+                self.pending -= 1
+            self._release_entry(user.id, entry)
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "pending": self.pending,
+            "locks": len(self._locks),
+        }
+
+def backpressure_middleware(ordering: UserOrderingMiddleware, path: str = "/webhook", retry_after: int = 1):
+    """aiohttp-middleware: отвечать 503 на webhook, пока очередь переполнена
+
+    Действует на path и все пути под ним (webhook арендаторов
+    /webhook/<id>). Telegram повторит доставку отклоненного апдейта позже.
+    """
+    prefix = path.rstrip("/") + "/"
+
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        if (request.path == path or request.path.startswith(prefix)) and ordering.overloaded:
+            logger.warning(f"Перегрузка: {ordering.pending} апдейтов в ожидании, отклоняем webhook")
+            return web.Response(status=503, headers={"Retry-After": str(retry_after)})
+        return await handler(request)
+
+    return middleware
@@ -0,0 +1,164 @@
+import time
+import heapq
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Ответы на колбэки не создают сообщений в чате, поэтому их можно
+# отправлять раньше остальных запросов этого чата
+PRIORITY_CALLBACK = 0
+PRIORITY_MESSAGE = 1
+
+class _Job:
+    __slots__ = ("priority", "seq", "request", "key", "enqueued_at", "future")
+
+    def __init__(self, priority: int, seq: int, request: Awaitable, key: Optional[Hashable], future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.request = request
+        self.key = key
+        self.enqueued_at = time.perf_counter()
+        self.future = future
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class _ChatQueue:
+    __slots__ = ("heap", "task")
+
+    def __init__(self):
+        self.heap: List[_Job] = []
+        self.task: Optional[asyncio.Task] = None
+
+class OutboundQueue:
+    """Очередь исходящих запросов к Bot API с разбивкой по чатам
+
+    Запросы одного чата выполняются строго по очереди (с учетом приоритета),
+    разные чаты - параллельно, но не больше max_concurrency одновременно.
+    Если в очереди уже ждет редактирование того же сообщения, новый запрос
+    заменяет его: отправится только последняя версия, причем в порядке
+    новой постановки - после запросов, поставленных раньше нее. Обработчик
+    не ждет ответа Telegram, а ошибки отправки пишутся в лог.
+    """
+
+    def __init__(self, max_concurrency: int = 100, latency_window: int = 2048):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._chats: Dict[int, _ChatQueue] = {}
+        self._pending_by_key: Dict[Hashable, _Job] = {}
+        self._seq = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        # Метрики
+        self.depth = 0
+        self.sent = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.latencies: Deque[float] = deque(maxlen=latency_window)
+        self.queue_waits: Deque[float] = deque(maxlen=latency_window)
+
+    def submit(
+        self,
+        chat_id: int,
+        request: Awaitable,
+        priority: int = PRIORITY_MESSAGE,
+        key: Optional[Hashable] = None,
+    ) -> asyncio.Future:
+        """Поставить запрос в очередь чата
+
+        request - awaitable метод aiogram (например, message.edit_text(...)).
+        key - ключ для схлопывания: ждущий запрос с тем же ключом заменяется.
+        """
+        future = None
+        if key is not None:
+            pending = self._pending_by_key.get(key)
+            if pending is not None:
+                # Предыдущую версию не отправляем, ее ожидающие получат результат новой.
+                # Она остается в куче пустой и пропускается, а новая встает в конец
+                if hasattr(pending.request, "close"):
+                    pending.request.close()
+                pending.request = None
+                future = pending.future
+                self.depth -= 1
+                self.coalesced += 1
+
+        self._seq += 1
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+        job = _Job(priority, self._seq, request, key, future)
+        if key is not None:
+            self._pending_by_key[key] = job
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _ChatQueue()
+        heapq.heappush(chat.heap, job)
+        self.depth += 1
+        self._idle.clear()
+
+        if chat.task is None:
+            chat.task = asyncio.create_task(self._drain(chat_id, chat))
+        return future
+
+    async def _drain(self, chat_id: int, chat: _ChatQueue):
+        try:
+            while chat.heap:
+                job = heapq.heappop(chat.heap)
+                if job.request is None:
+                    # Версия, замененная более новой
+                    continue
+                if job.key is not None:
+                    self._pending_by_key.pop(job.key, None)
+                self.depth -= 1
+
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    self.queue_waits.append(started - job.enqueued_at)
+                    try:
+                        result = await job.request
+                    except Exception as e:
+                        self.errors += 1
+                        logger.warning(f"Ошибка отправки в чат {chat_id}: {e}")
+                        if not job.future.done():
+                            job.future.set_exception(e)
+                            # Ошибка уже записана в лог, не требуем ее забирать
+                            job.future.exception()
+                    else:
+                        self.sent += 1
+                        if not job.future.done():
+                            job.future.set_result(result)
+                    finally:
+                        self.latencies.append(time.perf_counter() - started)
+        finally:
+            del self._chats[chat_id]
+            if not self._chats:
+                self._idle.set()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Текущие метрики очереди"""
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+        return {
+            "depth": self.depth,
+            "active_chats": len(self._chats),
+            "sent": self.sent,
+            "errors": self.errors,
+            "coalesced": self.coalesced,
+            "send_latency_p50": percentile(0.50),
+            "send_latency_p99": percentile(0.99),
+        }
+
+    async def close(self, timeout: float = 10.0):
+        """Дождаться отправки поставленных в очередь запросов"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не отправлено запросов при остановке: {self.depth}")
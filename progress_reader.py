@@ -0,0 +1,468 @@
+import os
+import asyncio
+import bisect
+import logging
+import pathlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from models import USER_ID_MASK, UserProgress, UserStatus, make_user_key
+from progress_store import STATS_COUNTERS, progress_from_record
+from event_log import EventLogTail, apply_record
+from columnar import MASK_BITS, ColumnarProgress, create_columnar_mirror
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class ProgressSnapshot:
+    """Согласованный срез прогресса: все запросы видят базу на один момент
+
+    Живет внутри одной читающей транзакции SQLite (WAL): запись бота в это
+    время идет параллельно и в срез не попадает. Итоги и воронка читаются
+    из счетчиков course_stats, которые бот ведет триггерами при записи
+    прогресса: запрос стоит O(число уроков), а не обход всех записей.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    @staticmethod
+    def _range(namespace: int) -> Tuple[int, int]:
+        return make_user_key(namespace, 0), make_user_key(namespace, USER_ID_MASK)
+
+    def get(self, user_id: int) -> Optional[UserProgress]:
+        row = self._conn.execute("SELECT data FROM progress WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return progress_from_record(user_id, row[0])
+        except (ValueError, KeyError) as e:
+            logger.error(f"Поврежденная запись прогресса {user_id}: {e}")
+            return None
+
+    def _filters(self, namespace: int, status: Optional[UserStatus], lesson: Optional[int]) -> Tuple[List[str], list]:
+        where, params = ["user_id BETWEEN ? AND ?"], list(self._range(namespace))
+        if status is not None:
+            where.append("json_extract(data, '$.status') = ?")
+            params.append(status.value)
+        if lesson is not None:
+            where.append("json_extract(data, '$.current_lesson') = ?")
+            params.append(lesson)
+        return where, params
+
+    def _exists(self, where: List[str], params: list) -> bool:
+        sql = f"SELECT 1 FROM progress WHERE {' AND '.join(where)} LIMIT 1"
+        return self._conn.execute(sql, params).fetchone() is not None
+
+    def page(
+        self,
+        status: Optional[UserStatus] = None,
+        lesson: Optional[int] = None,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: int = 50,
+        namespace: int = 0,
+    ) -> Tuple[List[int], bool, bool]:
+        """Страница id по фильтру: (ids, есть ли предыдущая, есть ли следующая)
+
+        С фильтром идет по индексу выражения (статус, текущий урок или оба),
+        внутри значения фильтра строки упорядочены по user_id, поэтому
+        страница читается от курсора без сортировки и обхода чужих строк.
+        """
+        where, params = self._filters(namespace, status, lesson)
+        if before is not None:
+            sql = f"SELECT user_id FROM progress WHERE {' AND '.join(where + ['user_id < ?'])} ORDER BY user_id DESC LIMIT ?"
+            ids = [row[0] for row in self._conn.execute(sql, params + [before, limit + 1])]
+            has_prev = len(ids) > limit
+            ids = ids[:limit][::-1]
+            has_next = bool(ids) and self._exists(where + ["user_id > ?"], params + [ids[-1]])
+        else:
+            sql = f"SELECT user_id FROM progress WHERE {' AND '.join(where + ['user_id > ?'])} ORDER BY user_id LIMIT ?"
+            ids = [row[0] for row in self._conn.execute(sql, params + [after if after is not None else -1, limit + 1])]
+            has_next = len(ids) > limit
+            ids = ids[:limit]
+            has_prev = bool(ids) and self._exists(where + ["user_id < ?"], params + [ids[0]])
+        return ids, has_prev, has_next
+
+    def _counters(self, namespace: int) -> Dict[str, Dict]:
+        counters: Dict[str, Dict] = {name: {} for name, *_ in STATS_COUNTERS}
+        for name, key, count in self._conn.execute(
+            "SELECT name, key, count FROM course_stats WHERE namespace = ? AND count != 0", (namespace,)
+        ):
+            counters[name][key] = count
+        return counters
+
+    def stats(self, namespace: int = 0) -> dict:
+        """Итоги в формате AdminBot.get_stats"""
+        counters = self._counters(namespace)
+        statuses = counters["status"]
+        return {
+            'total_users': sum(statuses.values()),
+            'active_users': statuses.get(UserStatus.IN_PROGRESS.value, 0),
+            'completed_users': statuses.get(UserStatus.COMPLETED.value, 0),
+            'lesson_stats': {int(lesson_id): count for lesson_id, count in counters["completed"].items()},
+            'submitted_assignments': sum(counters["submitted"].values()),
+            'checked_assignments': sum(counters["checked"].values()),
+        }
+
+    def funnel(self, total_lessons: int, namespace: int = 0) -> List[dict]:
+        """Воронка по урокам: дошли, прошли, сдали и проверено"""
+        counters = self._counters(namespace)
+        current = counters["current"]
+        # Пройденные уроки дальше текущего: до них пользователь тоже дошел
+        ahead = counters["ahead"]
+        completed = counters["completed"]
+        submitted = counters["submitted"]
+        checked = counters["checked"]
+        total = max(sum(current.values()), 1)
+        result = []
+        for lesson_id in range(1, total_lessons + 1):
+            reached = sum(count for lesson, count in current.items() if lesson is not None and lesson >= lesson_id)
+            result.append({
+                'lesson_id': lesson_id,
+                'reached': reached + ahead.get(lesson_id, 0),
+                'completed': completed.get(lesson_id, 0),
+                'submitted': submitted.get(lesson_id, 0),
+                'checked': checked.get(lesson_id, 0),
+                'completed_percent': completed.get(lesson_id, 0) * 100 / total,
+            })
+        return result
+
+class ProgressReader:
+    """Прогресс пользователей из базы бота, только для чтения (для процесса админки)
+
+    Бот с PROGRESS_BACKEND=sqlite или sqlite-cached держит прогресс в
+    SQLite-файле (WAL) и записывает изменения раз в секунду. Админка
+    открывает тот же файл в режиме только чтения и работает со срезами
+    (ProgressSnapshot): читатели WAL не блокируют запись бота и не ждут
+    ее, а бот не тратит на админку ни памяти, ни времени event loop.
+    Данные отстают от бота не больше чем на его интервал записи.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            uri = f"{pathlib.Path(self.path).absolute().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("SELECT 1 FROM progress LIMIT 1")
+            conn.execute("SELECT 1 FROM course_stats LIMIT 1")
+        except sqlite3.OperationalError as e:
+            raise RuntimeError(
+                f"Не удалось открыть базу прогресса {self.path} ({e}): "
+                f"у бота и админки должен быть один PROGRESS_BACKEND (sqlite или sqlite-cached)"
+            ) from e
+        return conn
+
+    async def start(self):
+        self._conn = await asyncio.to_thread(self._connect)
+        logger.info(f"База прогресса открыта только для чтения: {self.path}")
+
+    @contextmanager
+    def snapshot(self) -> Iterator[ProgressSnapshot]:
+        """Срез базы на момент первого запроса внутри блока (синхронно)"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield ProgressSnapshot(self._conn)
+            finally:
+                self._conn.execute("COMMIT")
+
+    def _query(self, fn: Callable[[ProgressSnapshot], T]) -> T:
+        with self.snapshot() as view:
+            return fn(view)
+
+    async def query(self, fn: Callable[[ProgressSnapshot], T]) -> T:
+        """Выполнить fn над одним срезом в отдельном потоке"""
+        return await asyncio.to_thread(self._query, fn)
+
+    async def get(self, user_id: int) -> Optional[UserProgress]:
+        return await self.query(lambda view: view.get(user_id))
+
+    def iter_user_ids(self, after: int = 0, batch_size: int = 1000) -> Iterator[List[int]]:
+        """Идентификаторы пользователей по возрастанию, пачками (отдельное соединение)"""
+        conn = self._connect()
+        try:
+            while True:
+                batch = [row[0] for row in conn.execute(
+                    "SELECT user_id FROM progress WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (after, batch_size),
+                )]
+                if not batch:
+                    return
+                yield batch
+                after = batch[-1]
+        finally:
+            conn.close()
+
+    def iter_progress(self, after: int = 0, batch_size: int = 1000) -> Iterator[List[UserProgress]]:
+        """Записи прогресса пачками из одного среза - для выгрузок из потока
+
+        Весь обход - одна читающая транзакция на отдельном соединении:
+        выгрузка согласована и не блокирует запросы админки. Пока она
+        идет, SQLite не может сжать WAL бота, поэтому файл WAL на это
+        время растет.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            while True:
+                rows = conn.execute(
+                    "SELECT user_id, data FROM progress WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (after, batch_size),
+                ).fetchall()
+                if not rows:
+                    return
+                batch = []
+                for user_id, record in rows:
+                    try:
+                        batch.append(progress_from_record(user_id, record))
+                    except (ValueError, KeyError) as e:
+                        logger.error(f"Поврежденная запись прогресса {user_id}: {e}")
+                yield batch
+                after = rows[-1][0]
+        finally:
+            conn.close()
+
+    async def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+
+# ========== ПРОГРЕСС В ПАМЯТИ АДМИНКИ ==========
+
+def _copy_progress(progress: UserProgress) -> UserProgress:
+    """Копия записи: оригинал продолжает меняться при чтении журнала"""
+    copy = UserProgress(progress.user_id, current_lesson=progress.current_lesson, status=progress.status)
+    copy.completed_mask = progress.completed_mask
+    copy.submitted_mask = progress.submitted_mask
+    copy.checked_mask = progress.checked_mask
+    copy._answers = dict(progress._answers) if progress._answers else None
+    return copy
+
+class MemoryProgressView:
+    """Срез записей в памяти с тем же интерфейсом, что у ProgressSnapshot
+
+    Живет, пока читатель держит блокировку: записи в это время не меняются.
+    Итоги, воронка и страницы считаются векторно по колоночной копии, а
+    без numpy - обходом записей пространства ключей.
+    """
+
+    def __init__(self, data: Dict[int, UserProgress], columns: Optional[ColumnarProgress] = None):
+        self._data = data
+        self._columns = columns
+
+    def get(self, user_id: int) -> Optional[UserProgress]:
+        progress = self._data.get(user_id)
+        return _copy_progress(progress) if progress is not None else None
+
+    def _records(self, namespace: int) -> Iterator[UserProgress]:
+        low, high = make_user_key(namespace, 0), make_user_key(namespace, USER_ID_MASK)
+        return (progress for user_id, progress in self._data.items() if low <= user_id <= high)
+
+    def page(
+        self,
+        status: Optional[UserStatus] = None,
+        lesson: Optional[int] = None,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: int = 50,
+        namespace: int = 0,
+    ) -> Tuple[List[int], bool, bool]:
+        """Страница id по фильтру: (ids, есть ли предыдущая, есть ли следующая)"""
+        if self._columns is not None:
+            return self._columns.page(status, lesson, after, before, limit, namespace)
+        ids = sorted(
+            progress.user_id for progress in self._records(namespace)
+            if (status is None or progress.status == status)
+            and (lesson is None or progress.current_lesson == lesson)
+        )
+        if before is not None:
+            end = bisect.bisect_left(ids, before)
+            start = max(0, end - limit)
+        else:
+            start = bisect.bisect_right(ids, after if after is not None else -1)
+            end = start + limit
+        page = ids[start:end]
+        return page, bool(page) and start > 0, bool(page) and end < len(ids)
+
+    def _counters(self, namespace: int) -> Dict[str, Dict]:
+        counters: Dict[str, Dict] = {name: {} for name, *_ in STATS_COUNTERS}
+        for progress in self._records(namespace):
+            status = counters["status"]
+            status[progress.status.value] = status.get(progress.status.value, 0) + 1
+            current = counters["current"]
+            current[progress.current_lesson] = current.get(progress.current_lesson, 0) + 1
+            for lesson_id in progress.completed_lessons:
+                counters["completed"][lesson_id] = counters["completed"].get(lesson_id, 0) + 1
+                if lesson_id > progress.current_lesson:
+                    counters["ahead"][lesson_id] = counters["ahead"].get(lesson_id, 0) + 1
+            for lesson_id, checked in progress.checked_assignments.items():
+                counters["submitted"][lesson_id] = counters["submitted"].get(lesson_id, 0) + 1
+                if checked:
+                    counters["checked"][lesson_id] = counters["checked"].get(lesson_id, 0) + 1
+        return counters
+
+    def stats(self, namespace: int = 0) -> dict:
+        """Итоги в формате AdminBot.get_stats"""
+        if self._columns is not None:
+            return self._columns.stats(namespace)
+        # Без numpy - из тех же счетчиков, что и в базе
+        return ProgressSnapshot.stats(self, namespace)
+
+    def funnel(self, total_lessons: int, namespace: int = 0) -> List[dict]:
+        """Воронка по урокам: дошли, прошли, сдали и проверено"""
+        if self._columns is not None and total_lessons < MASK_BITS:
+            return self._columns.funnel(total_lessons, namespace)
+        return ProgressSnapshot.funnel(self, total_lessons, namespace)
+
+class MemoryProgressReader:
+    """Прогресс в памяти процесса админки с интерфейсом ProgressReader
+
+    Сам по себе пуст: так админка работает, когда бот хранит прогресс
+    только у себя в памяти (PROGRESS_BACKEND=memory). Наполняет его
+    EventLogReader.
+    """
+
+    def __init__(self):
+        self._data: Dict[int, UserProgress] = {}
+        self._lock = threading.Lock()
+        self._columns = create_columnar_mirror()
+
+    def _track(self, progress: UserProgress):
+        """Обновить строку колоночной копии (под блокировкой)"""
+        if self._columns is None:
+            return
+        if not ColumnarProgress.fits(progress):
+            logger.warning(
+                f"Уроки записи {progress.user_id} не помещаются в {MASK_BITS} бит, "
+                f"колоночная статистика отключена"
+            )
+            self._columns = None
+            return
+        self._columns.update(progress)
+
+    async def start(self):
+        pass
+
+    def _query(self, fn: Callable[[MemoryProgressView], T]) -> T:
+        with self._lock:
+            return fn(MemoryProgressView(self._data, self._columns))
+
+    async def query(self, fn: Callable[[MemoryProgressView], T]) -> T:
+        """Выполнить fn над срезом в отдельном потоке"""
+        return await asyncio.to_thread(self._query, fn)
+
+    async def get(self, user_id: int) -> Optional[UserProgress]:
+        return await self.query(lambda view: view.get(user_id))
+
+    def _ids_after(self, after: int) -> List[int]:
+        with self._lock:
+            return sorted(user_id for user_id in self._data if user_id > after)
+
+    def iter_user_ids(self, after: int = 0, batch_size: int = 1000) -> Iterator[List[int]]:
+        """Идентификаторы пользователей по возрастанию, пачками"""
+        ids = self._ids_after(after)
+        for start in range(0, len(ids), batch_size):
+            yield ids[start:start + batch_size]
+
+    def iter_progress(self, after: int = 0, batch_size: int = 1000) -> Iterator[List[UserProgress]]:
+        """Копии записей прогресса пачками - для выгрузок из потока"""
+        ids = self._ids_after(after)
+        for start in range(0, len(ids), batch_size):
+            with self._lock:
+                batch = [self._data.get(user_id) for user_id in ids[start:start + batch_size]]
+            yield [_copy_progress(progress) for progress in batch if progress is not None]
+
+    async def close(self):
+        pass
+
+class EventLogReader(MemoryProgressReader):
+    """Прогресс из журналов событий воркеров бота (PROGRESS_BACKEND=eventlog)
+
+    Каждый воркер пишет свой журнал в подкаталог worker-N каталога root.
+    При запуске читается последний снимок каждого журнала и его хвост,
+    затем раз в refresh_interval секунд - только новые записи: данные
+    отстают от бота на его интервал записи журнала плюс этот интервал.
+    Журналы только читаются, бот о читателе не знает.
+    """
+
+    def __init__(self, root: str, refresh_interval: float = 1.0):
+        super().__init__()
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self._tails: Dict[str, EventLogTail] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _directories(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            entry.path for entry in os.scandir(self.root)
+            if entry.is_dir() and entry.name.startswith("worker-")
+        )
+
+    def refresh(self) -> int:
+        """Применить новые записи всех журналов (синхронно); число примененных событий"""
+        applied = 0
+        for directory in self._directories():
+            tail = self._tails.get(directory)
+            records = None if tail is None else tail.poll()
+            if records is None:
+                # Новый журнал или непрочитанное уже сжато в снимок
+                tail = self._tails[directory] = tail or EventLogTail(directory)
+                snapshot = tail.snapshot()
+                with self._lock:
+                    self._data.update(snapshot)
+                    for progress in snapshot.values():
+                        self._track(progress)
+                records = tail.poll() or []
+            with self._lock:
+                for fields, preview in records:
+                    apply_record(self._data, fields, preview)
+                    self._track(self._data[fields[1]])
+            applied += len(records)
+        return applied
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"Ошибка чтения журналов прогресса: {e}")
+
+    async def start(self):
+        await asyncio.to_thread(self.refresh)
+        logger.info(f"Журналы прогресса из {self.root}: записей {len(self._data)}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+def open_progress_reader(backend: str, db_path: str, event_log_root: str, refresh_interval: float = 1.0):
+    """Читатель прогресса под бэкенд бота (значение PROGRESS_BACKEND)"""
+    if backend == "eventlog":
+        return EventLogReader(event_log_root, refresh_interval)
+    if backend == "memory":
+        logger.warning(
+            "Бот хранит прогресс только в своей памяти (PROGRESS_BACKEND=memory): "
+            "статистика и списки пользователей в админке будут пустыми"
+        )
+        return MemoryProgressReader()
+    return ProgressReader(db_path)
@@ -0,0 +1,866 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+from models import NAMESPACE_SHIFT, USER_ID_MASK, AnswerRef, UserProgress, UserStatus
+from events import ProgressEvent
+from event_log import EventLog, encode_event, encode_snapshot_users
+
+logger = logging.getLogger(__name__)
+
+# ========== СЕРИАЛИЗАЦИЯ ==========
+
+def progress_to_record(progress: UserProgress) -> str:
+    """Сериализовать прогресс пользователя в JSON-строку"""
+    record = {
+        "current_lesson": progress.current_lesson,
+        "completed_lessons": list(progress.completed_lessons),
+        # Для вынесенных ответов здесь только превью, полный текст - по answer_handles
+        "submitted_assignments": dict(progress.submitted_assignments),
+        "checked_assignments": dict(progress.checked_assignments),
+        "status": progress.status.value,
+    }
+    handles = {}
+    for lesson_id in progress.submitted_assignments:
+        ref = progress.answer_ref(lesson_id)
+        if ref is not None:
+            handles[lesson_id] = ref.handle
+    if handles:
+        record["answer_handles"] = handles
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+def progress_from_record(user_id: int, record: str) -> UserProgress:
+    """Восстановить прогресс пользователя из JSON-строки"""
+    data = json.loads(record)
+    progress = UserProgress(
+        user_id=user_id,
+        current_lesson=data.get("current_lesson", 1),
+        completed_lessons=list(data.get("completed_lessons", [])),
+        # Ключи JSON-объектов всегда строки, возвращаем им тип int
+        submitted_assignments={int(k): v for k, v in data.get("submitted_assignments", {}).items()},
+        checked_assignments={int(k): v for k, v in data.get("checked_assignments", {}).items()},
+        status=UserStatus(data.get("status", UserStatus.NOT_STARTED.value)),
+    )
+    for lesson_id, handle in data.get("answer_handles", {}).items():
+        lesson_id = int(lesson_id)
+        progress.submitted_assignments[lesson_id] = AnswerRef(handle, progress.submitted_assignments[lesson_id])
+    return progress
+
+# ========== СЧЕТЧИКИ КУРСА ==========
+
+# Счетчики для админки в таблице course_stats: (имя, ключ, массив JSON для
+# обхода, условие). {r} - строка progress, e - элемент массива. Ключ -
+# статус или номер урока; ahead - пройденные уроки дальше текущего
+STATS_COUNTERS = (
+    ("status", "json_extract({r}.data, '$.status')", None, None),
+    ("current", "json_extract({r}.data, '$.current_lesson')", None, None),
+    ("completed", "e.value", "$.completed_lessons", None),
+    ("ahead", "e.value", "$.completed_lessons", "e.value > json_extract({r}.data, '$.current_lesson')"),
+    ("submitted", "CAST(e.key AS INTEGER)", "$.submitted_assignments", None),
+    ("checked", "CAST(e.key AS INTEGER)", "$.checked_assignments", "e.value"),
+)
+
+# Версия схемы базы прогресса (PRAGMA user_version): 1 - заполнена course_stats
+_STATS_VERSION = 1
+
+def _stats_select(record: str, delta: str, grouped: bool) -> List[str]:
+    """SELECT строк (namespace, name, key, delta) для каждого счетчика"""
+    selects = []
+    for name, key, array, condition in STATS_COUNTERS:
+        key = key.format(r=record)
+        sources = ["progress"] if grouped else []
+        if array is not None:
+            sources.append(f"json_each({record}.data, '{array}') AS e")
+        where = [f"{key} IS NOT NULL"]
+        if condition is not None:
+            where.append(condition.format(r=record))
+        sql = f"SELECT {record}.user_id >> {NAMESPACE_SHIFT} AS namespace, '{name}' AS name, {key} AS key, {delta} AS delta"
+        if sources:
+            sql += f" FROM {', '.join(sources)}"
+        sql += f" WHERE {' AND '.join(where)}"
+        if grouped:
+            sql += " GROUP BY 1, 3"
+        selects.append(sql)
+    return selects
+
+def _stats_upsert(*changes: Tuple[str, int]) -> str:
+    """Одна вставка в course_stats для всех счетчиков записей (record, delta)
+
+    Изменения суммируются по ключу, и счетчики, которые запись не
+    поменяла (старое -1 и новое +1), не пишутся вовсе.
+    """
+    rows = " UNION ALL ".join(
+        select for record, delta in changes for select in _stats_select(record, str(delta), grouped=False)
+    )
+    return (
+        f"INSERT INTO course_stats (namespace, name, key, count) "
+        f"SELECT namespace, name, key, SUM(delta) FROM ({rows}) "
+        f"GROUP BY 1, 2, 3 HAVING SUM(delta) != 0 "
+        f"ON CONFLICT (namespace, name, key) DO UPDATE SET count = count + excluded.count;"
+    )
+
+# Счетчики меняются триггерами в той же транзакции, что и записи, поэтому
+# совпадают с базой при любом числе пишущих процессов
+PROGRESS_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS course_stats ("
+    "namespace INTEGER NOT NULL, name TEXT NOT NULL, key NOT NULL, count INTEGER NOT NULL, "
+    "PRIMARY KEY (namespace, name, key)) WITHOUT ROWID",
+    f"CREATE TRIGGER IF NOT EXISTS progress_stats_insert AFTER INSERT ON progress "
+    f"BEGIN {_stats_upsert(('NEW', 1))} END",
+    f"CREATE TRIGGER IF NOT EXISTS progress_stats_update AFTER UPDATE OF data ON progress "
+    f"WHEN OLD.data IS NOT NEW.data "
+    f"BEGIN {_stats_upsert(('OLD', -1), ('NEW', 1))} END",
+    f"CREATE TRIGGER IF NOT EXISTS progress_stats_delete AFTER DELETE ON progress "
+    f"BEGIN {_stats_upsert(('OLD', -1))} END",
+    # Фильтры списка пользователей в админке: по статусу, уроку и обоим сразу
+    "CREATE INDEX IF NOT EXISTS progress_status ON progress (json_extract(data, '$.status'))",
+    "CREATE INDEX IF NOT EXISTS progress_lesson ON progress (json_extract(data, '$.current_lesson'))",
+    "CREATE INDEX IF NOT EXISTS progress_status_lesson ON progress "
+    "(json_extract(data, '$.status'), json_extract(data, '$.current_lesson'))",
+)
+
+def _fill_course_stats(conn: sqlite3.Connection):
+    """Один раз посчитать course_stats по уже сохраненным записям"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] < _STATS_VERSION:
+            conn.execute("DELETE FROM course_stats")
+            for select in _stats_select("progress", "COUNT(*)", grouped=True):
+                conn.execute(f"INSERT INTO course_stats (namespace, name, key, count) {select}")
+            conn.execute(f"PRAGMA user_version = {_STATS_VERSION}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+# ========== ХРАНИЛИЩА ==========
+
+class ProgressStore:
+    """Базовое хранилище прогресса с dict-подобным интерфейсом
+
+    Обработчики работают с объектами в памяти, а бэкенды сами решают,
+    когда и как сохранять изменения. После изменения объекта его нужно
+    записать обратно (store[user_id] = progress) или вызвать mark_dirty.
+    """
+
+    # Сколько ключей каждого пространства запоминать для sample
+    SAMPLE_KEYS = 64
+
+    def __init__(self):
+        self._data: Dict[int, UserProgress] = {}
+        self._listeners: List[Callable[[UserProgress], None]] = []
+        # Число записей по пространствам ключей (арендаторам), без обхода ключей
+        self._namespaces: Dict[int, int] = {}
+        # Первые SAMPLE_KEYS ключей каждого пространства
+        self._sample_keys: Dict[int, List[int]] = {}
+
+    def get(self, user_id: int, default: Optional[UserProgress] = None) -> Optional[UserProgress]:
+        return self._data.get(user_id, default)
+
+    def __getitem__(self, user_id: int) -> UserProgress:
+        return self._data[user_id]
+
+    def __setitem__(self, user_id: int, progress: UserProgress):
+        if user_id not in self._data:
+            self._count_new(user_id)
+        self._data[user_id] = progress
+        self.mark_dirty(user_id)
+        for listener in self._listeners:
+            listener(progress)
+
+    def subscribe(self, listener: Callable[[UserProgress], None]):
+        """Вызывать listener после каждой записи (для производных индексов)"""
+        self._listeners.append(listener)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._data)
+
+    def keys(self):
+        return self._data.keys()
+
+    def values(self):
+        return self._data.values()
+
+    def items(self):
+        return self._data.items()
+
+    def _count_new(self, user_id: int):
+        namespace = user_id >> NAMESPACE_SHIFT
+        self._namespaces[namespace] = self._namespaces.get(namespace, 0) + 1
+        keys = self._sample_keys.setdefault(namespace, [])
+        if len(keys) < self.SAMPLE_KEYS:
+            keys.append(user_id)
+
+    def _count_namespaces(self):
+        """Пересчитать записи по пространствам ключей после загрузки"""
+        self._namespaces = {}
+        self._sample_keys = {}
+        for user_id in self._data:
+            self._count_new(user_id)
+
+    def namespace_counts(self) -> Dict[int, int]:
+        """Число записей в каждом пространстве ключей"""
+        return dict(self._namespaces)
+
+    def sample(self, namespace: int, limit: int) -> List[UserProgress]:
+        """До limit (не больше SAMPLE_KEYS) записей пространства ключей, без обхода хранилища"""
+        result = []
+        for user_id in self._sample_keys.get(namespace, ())[:limit]:
+            progress = self._data.get(user_id)
+            if progress is not None:
+                result.append(progress)
+        return result
+
+    def mark_dirty(self, user_id: int):
+        """Отметить запись как измененную"""
+
+    async def prefetch(self, user_id: int):
+        """Подготовить запись к синхронному чтению (для бэкендов, читающих с диска)"""
+
+    def record_event(self, event: ProgressEvent):
+        """Учесть событие прогресса (для бэкендов на журнале событий)"""
+
+    async def start(self):
+        """Загрузить данные и запустить фоновые задачи"""
+
+    async def flush(self):
+        """Сохранить накопленные изменения"""
+
+    async def close(self):
+        """Сохранить изменения и освободить ресурсы"""
+
+class MemoryProgressStore(ProgressStore):
+    """Хранилище в памяти (данные теряются при перезапуске)"""
+
+class SQLiteProgressStore(ProgressStore):
+    """Хранилище в SQLite (WAL) с отложенной пакетной записью
+
+    Запись из обработчика - это только обновление словаря и множества
+    измененных ключей. Фоновая задача раз в flush_interval секунд
+    сериализует измененные записи и пишет их одной транзакцией в отдельном
+    потоке, поэтому event loop не ждет диск. При падении процесса теряются
+    изменения не более чем за один интервал.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        super().__init__()
+        self.path = path
+        self.flush_interval = flush_interval
+        self._dirty: Set[int] = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Файл общий для воркеров multiworker: пишущий ждет, пока запишет другой
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS progress ("
+            "user_id INTEGER PRIMARY KEY, "
+            "data TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        for statement in PROGRESS_SCHEMA:
+            conn.execute(statement)
+        _fill_course_stats(conn)
+        return conn
+
+    def load(self):
+        """Открыть базу и загрузить все записи в память"""
+        self._conn = self._connect()
+        for user_id, record in self._conn.execute("SELECT user_id, data FROM progress"):
+            try:
+                self._data[user_id] = progress_from_record(user_id, record)
+            except (ValueError, KeyError) as e:
+                logger.error(f"Поврежденная запись прогресса {user_id}: {e}")
+        self._count_namespaces()
+        logger.info(f"Загружено записей прогресса: {len(self._data)} ({self.path})")
+
+    def mark_dirty(self, user_id: int):
+        self._dirty.add(user_id)
+
+    async def start(self):
+        if self._conn is None:
+            await asyncio.to_thread(self.load)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении прогресса: {e}")
+
+    def _write_batch(self, rows: List[Tuple[int, str, float]]):
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(
+                "INSERT INTO progress (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                rows,
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    async def flush(self):
+        if not self._dirty or self._conn is None:
+            return
+
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, set()
+            now = time.time()
+            # Сериализуем в event loop, чтобы не читать объекты,
+            # которые параллельно меняют обработчики
+            rows = [
+                (user_id, progress_to_record(self._data[user_id]), now)
+                for user_id in dirty
+                if user_id in self._data
+            ]
+            try:
+                await asyncio.to_thread(self._write_batch, rows)
+            except Exception:
+                # Вернем ключи, чтобы повторить запись в следующий раз
+                self._dirty |= dirty
+                raise
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        await self.flush()
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class EventLogProgressStore(ProgressStore):
+    """Хранилище на журнале событий со снимками
+
+    Источник истины - события EventBus: каждое кодируется в двоичную
+    запись и копится в буфере, который фоновая задача раз в flush_interval
+    дописывает в журнал в отдельном потоке. После snapshot_every событий
+    пишется компактный снимок всех записей, а покрытые им сегменты
+    журнала удаляются. Запуск - чтение снимка и воспроизведение хвоста.
+    Изменения прогресса должны сопровождаться событием: mark_dirty
+    сам по себе ничего не сохраняет.
+    """
+
+    # Сколько записей упаковывать для снимка между передачами управления loop
+    SNAPSHOT_CHUNK = 10000
+
+    def __init__(self, directory: str, flush_interval: float = 1.0, snapshot_every: int = 100000):
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self._log = EventLog(directory)
+        self._buffer = bytearray()
+        self._since_snapshot = 0
+        self._loaded = False
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+    def record_event(self, event: ProgressEvent):
+        self._buffer += encode_event(event)
+        self._log.next_seq += 1
+        self._since_snapshot += 1
+        if (
+            self._loaded
+            and self._since_snapshot >= self.snapshot_every
+            and (self._snapshot_task is None or self._snapshot_task.done())
+        ):
+            self._snapshot_task = asyncio.create_task(self.snapshot())
+
+    async def start(self):
+        if not self._loaded:
+            self._data = await asyncio.to_thread(self._log.load)
+            self._count_namespaces()
+            self._since_snapshot = self._log.replayed
+            self._loaded = True
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при записи журнала событий: {e}")
+
+    async def _flush_buffer(self):
+        if not self._buffer:
+            return
+        records, self._buffer = bytes(self._buffer), bytearray()
+        try:
+            await asyncio.to_thread(self._log.write, records)
+        except Exception:
+            # Вернем записи в начало буфера, чтобы повторить в следующий раз
+            self._buffer[:0] = records
+            raise
+
+    async def flush(self):
+        if not self._loaded:
+            return
+        async with self._flush_lock:
+            await self._flush_buffer()
+
+    async def snapshot(self):
+        """Записать снимок всех записей и удалить покрытый им журнал"""
+        async with self._flush_lock:
+            # Буфер забираем вместе с номером события синхронно: все, что
+            # придет позже, запишется уже в новый сегмент
+            records, self._buffer = bytes(self._buffer), bytearray()
+            seq = self._log.next_seq
+            await asyncio.to_thread(self._log.rotate, records, seq)
+            self._since_snapshot = 0
+            # Упаковываем частями, отдавая управление обработчикам. События,
+            # пришедшие в это время, попадут и в снимок, и в новый сегмент -
+            # повторное применение при воспроизведении безопасно
+            parts = []
+            count = 0
+            user_ids = list(self._data)
+            for start in range(0, len(user_ids), self.SNAPSHOT_CHUNK):
+                chunk, chunk_count = encode_snapshot_users(
+                    self._data[user_id] for user_id in user_ids[start:start + self.SNAPSHOT_CHUNK]
+                )
+                parts.append(chunk)
+                count += chunk_count
+                await asyncio.sleep(0)
+            await asyncio.to_thread(self._log.write_snapshot, seq, b"".join(parts), count)
+        logger.info(f"Снимок прогресса на событии {seq}: {count} записей")
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if self._snapshot_task is not None:
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+
+        if self._loaded:
+            # Снимок при остановке делает следующий запуск самым быстрым
+            if self._since_snapshot:
+                await self.snapshot()
+            else:
+                await self.flush()
+            self._log.close()
+            self._loaded = False
+
+# ========== КЭШ ==========
+
+class LRUCache:
+    """Словарь ограниченного размера: при переполнении вытесняется давно не читанная запись"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            self._items.move_to_end(key)
+        except KeyError:
+            return default
+        return self._items[key]
+
+    def put(self, key: Hashable, value: Any) -> Optional[Tuple[Hashable, Any]]:
+        """Записать значение; возвращает вытесненную пару (ключ, значение), если была"""
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.capacity:
+            self.evictions += 1
+            return self._items.popitem(last=False)
+        return None
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Значение без отметки об использовании"""
+        return self._items.get(key, default)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        return self._items.pop(key, default)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+# Отметка пользователя, которого нет в базе (отрицательный кэш)
+_MISSING = object()
+
+class CachedSQLiteProgressStore(SQLiteProgressStore):
+    """Хранилище в SQLite без загрузки в память, с LRU-кэшем записей
+
+    Записи читаются из базы по первичному ключу при первом обращении и
+    держатся в LRU-кэше на cache_size записей; активные пользователи,
+    которые дают почти весь трафик, обслуживаются из памяти. Отсутствие
+    записи тоже кэшируется (отрицательный кэш на negative_cache_size
+    ключей), так что повторные проверки новых пользователей не идут в
+    базу. Измененные записи до подтверждения записи на диск живут вне
+    кэша и не теряются при вытеснении, а вытесненная запись, которую
+    еще держит обработчик, находится по слабой ссылке: его изменения
+    и mark_dirty попадают в тот же объект. Режим записи:
+    write-back - пакетом раз в flush_interval, как SQLiteProgressStore;
+    write-through - сразу же на следующем шаге event loop (изменения
+    одного шага все равно пишутся одной транзакцией).
+
+    Промах кэша в get читает базу прямо в event loop. Чтобы этого не
+    было, перед обработкой вызывается prefetch: запись читается и
+    разбирается в отдельном потоке, одновременные запросы одного
+    пользователя ждут одного чтения. Чтения в loop видны в метрике
+    disk_reads, чтения через prefetch - в prefetch_reads.
+
+    Обход всех записей (values, keys) читает базу пачками через
+    отдельное соединение (его можно вести из потока) и кэш не засоряет:
+    для записей в памяти отдаются их объекты.
+    """
+
+    SCAN_BATCH = 10000
+
+    def __init__(self, path: str, flush_interval: float = 1.0, cache_size: int = 50000,
+                 negative_cache_size: int = 10000, write_through: bool = False):
+        super().__init__(path, flush_interval=flush_interval)
+        self.write_through = write_through
+        self._cache = LRUCache(cache_size)
+        self._missing = LRUCache(negative_cache_size)
+        # Измененные записи, еще не сохраненные, и записи, которые пишутся сейчас
+        self._unsaved: Dict[int, UserProgress] = {}
+        self._writing: Dict[int, UserProgress] = {}
+        # Вытесненные из кэша записи, пока на них есть ссылки
+        self._evicted: "weakref.WeakValueDictionary[int, UserProgress]" = weakref.WeakValueDictionary()
+        self._wake: Optional[asyncio.Event] = None
+        self._count = 0
+        # Чтения идут из event loop, запись - в потоке через _conn: у каждого свое соединение
+        self._reader: Optional[sqlite3.Connection] = None
+        # Чтения prefetch - в одном потоке со своим соединением
+        self._prefetch_executor: Optional[ThreadPoolExecutor] = None
+        self._prefetch_conn: Optional[sqlite3.Connection] = None
+        self._prefetches: Dict[int, asyncio.Task] = {}
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.disk_reads = 0
+        self.prefetch_reads = 0
+
+    def load(self):
+        """Открыть базу; записи не загружаются, считается только их число"""
+        self._conn = self._connect()
+        self._reader = self._connect()
+        self._namespaces = dict(self._reader.execute(
+            f"SELECT user_id >> {NAMESPACE_SHIFT}, COUNT(*) FROM progress GROUP BY 1"
+        ).fetchall())
+        self._count = sum(self._namespaces.values())
+        self._prefetch_conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="progress-prefetch")
+        logger.info(f"Записей прогресса в базе: {self._count} ({self.path}), кэш на {self._cache.capacity}")
+
+    def _lookup(self, user_id: int) -> Optional[UserProgress]:
+        progress = self._cache.get(user_id)
+        if progress is not None:
+            self.hits += 1
+            return progress
+        if user_id in self._missing:
+            self.negative_hits += 1
+            return None
+        self.misses += 1
+        progress = self._unsaved.get(user_id) or self._writing.get(user_id) or self._evicted.get(user_id)
+        if progress is None and self._reader is not None:
+            # Запись не подготовлена prefetch: читаем по первичному ключу прямо в loop
+            self.disk_reads += 1
+            row = self._reader.execute("SELECT data FROM progress WHERE user_id = ?", (user_id,)).fetchone()
+            if row is not None:
+                try:
+                    progress = progress_from_record(user_id, row[0])
+                except (ValueError, KeyError) as e:
+                    logger.error(f"Поврежденная запись прогресса {user_id}: {e}")
+        if progress is None:
+            self._missing.put(user_id, _MISSING)
+        else:
+            self._cache_put(user_id, progress)
+        return progress
+
+    def _cache_put(self, user_id: int, progress: UserProgress):
+        evicted = self._cache.put(user_id, progress)
+        if evicted is not None:
+            self._evicted[evicted[0]] = evicted[1]
+
+    def _read_record(self, user_id: int) -> Optional[UserProgress]:
+        row = self._prefetch_conn.execute("SELECT data FROM progress WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return progress_from_record(user_id, row[0])
+        except (ValueError, KeyError) as e:
+            logger.error(f"Поврежденная запись прогресса {user_id}: {e}")
+            return None
+
+    async def _prefetch(self, user_id: int):
+        try:
+            progress = await asyncio.get_running_loop().run_in_executor(
+                self._prefetch_executor, self._read_record, user_id
+            )
+        finally:
+            # Запись за время чтения могла измениться: тогда прочитанное устарело
+            current = self._prefetches.get(user_id) is asyncio.current_task()
+            if current:
+                del self._prefetches[user_id]
+        if not current or self._in_memory(user_id) is not None:
+            return
+        self.prefetch_reads += 1
+        if progress is None:
+            self._missing.put(user_id, _MISSING)
+        else:
+            self._cache_put(user_id, progress)
+
+    async def prefetch(self, user_id: int):
+        if (
+            self._prefetch_executor is None
+            or user_id in self._missing
+            or self._in_memory(user_id) is not None
+        ):
+            return
+        task = self._prefetches.get(user_id)
+        if task is None:
+            task = self._prefetches[user_id] = asyncio.create_task(self._prefetch(user_id))
+        # Отмена обработчика не прерывает чтение, которого ждут другие
+        await asyncio.shield(task)
+
+    def get(self, user_id: int, default: Optional[UserProgress] = None) -> Optional[UserProgress]:
+        progress = self._lookup(user_id)
+        return default if progress is None else progress
+
+    def __getitem__(self, user_id: int) -> UserProgress:
+        progress = self._lookup(user_id)
+        if progress is None:
+            raise KeyError(user_id)
+        return progress
+
+    def __setitem__(self, user_id: int, progress: UserProgress):
+        # Обычно запись только что прочитана и уже в памяти
+        known = self._in_memory(user_id) is not None or (
+            user_id not in self._missing and self._lookup(user_id) is not None
+        )
+        if not known:
+            self._count += 1
+            self._count_new(user_id)
+            self._missing.pop(user_id)
+        self._cache_put(user_id, progress)
+        self.mark_dirty(user_id)
+        for listener in self._listeners:
+            listener(progress)
+
+    def __contains__(self, user_id: int) -> bool:
+        return self._lookup(user_id) is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def mark_dirty(self, user_id: int):
+        # Идущее чтение prefetch вернет старую версию, ее не берем
+        self._prefetches.pop(user_id, None)
+        progress = self._in_memory(user_id)
+        if progress is None:
+            return
+        # Несохраненная запись остается в памяти и при вытеснении из кэша
+        self._unsaved[user_id] = progress
+        if self.write_through and self._wake is not None:
+            self._wake.set()
+
+    def sample(self, namespace: int, limit: int) -> List[UserProgress]:
+        """До limit записей пространства ключей из базы, через отдельное соединение
+
+        Читает диапазон первичного ключа только для чтения, не трогая кэш
+        и соединения event loop. Записи, еще не сброшенные на диск, не попадают.
+        """
+        low = namespace << NAMESPACE_SHIFT
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT user_id, data FROM progress WHERE user_id BETWEEN ? AND ? "
+                "ORDER BY user_id LIMIT ?",
+                (low, low | USER_ID_MASK, limit),
+            ).fetchall()
+        finally:
+            conn.close()
+        result = []
+        for user_id, record in rows:
+            progress = self._in_memory(user_id)
+            if progress is None:
+                try:
+                    progress = progress_from_record(user_id, record)
+                except (ValueError, KeyError) as e:
+                    logger.error(f"Поврежденная запись прогресса {user_id}: {e}")
+                    continue
+            result.append(progress)
+        return result
+
+    def _in_memory(self, user_id: int) -> Optional[UserProgress]:
+        return (
+            self._cache.peek(user_id) or self._unsaved.get(user_id)
+            or self._writing.get(user_id) or self._evicted.get(user_id)
+        )
+
+    def _scan(self) -> Iterator[Tuple[int, Optional[str]]]:
+        """(user_id, запись) всех пользователей: сначала из базы, затем еще не записанные новые"""
+        seen = set()
+        after = -1
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            while True:
+                rows = conn.execute(
+                    "SELECT user_id, data FROM progress WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (after, self.SCAN_BATCH),
+                ).fetchall()
+                if not rows:
+                    break
+                for user_id, record in rows:
+                    seen.add(user_id)
+                    yield user_id, record
+                after = rows[-1][0]
+        finally:
+            conn.close()
+        for user_id in list(self._unsaved) + list(self._writing):
+            if user_id not in seen:
+                seen.add(user_id)
+                yield user_id, None
+
+    def __iter__(self) -> Iterator[int]:
+        return (user_id for user_id, _ in self._scan())
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        for user_id, record in self._scan():
+            progress = self._in_memory(user_id)
+            if progress is None:
+                try:
+                    progress = progress_from_record(user_id, record)
+                except (ValueError, KeyError) as e:
+                    logger.error(f"Поврежденная запись прогресса {user_id}: {e}")
+                    continue
+            yield user_id, progress
+
+    def values(self):
+        return (progress for _, progress in self.items())
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        await super().start()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении прогресса: {e}")
+
+    async def flush(self):
+        if not self._unsaved or self._conn is None:
+            return
+
+        async with self._flush_lock:
+            batch, self._unsaved = self._unsaved, {}
+            self._writing = batch
+            now = time.time()
+            rows = [(user_id, progress_to_record(progress), now) for user_id, progress in batch.items()]
+            try:
+                await asyncio.to_thread(self._write_batch, rows)
+            except Exception:
+                # Вернем записи, чтобы повторить запись в следующий раз
+                for user_id, progress in batch.items():
+                    self._unsaved.setdefault(user_id, progress)
+                raise
+            finally:
+                self._writing = {}
+
+    async def close(self):
+        if self._prefetches:
+            await asyncio.gather(*self._prefetches.values(), return_exceptions=True)
+        await super().close()
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown()
+            self._prefetch_executor = None
+            self._prefetch_conn.close()
+            self._prefetch_conn = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def metrics(self) -> Dict[str, float]:
+        reads = self.hits + self.misses + self.negative_hits
+        return {
+            "cached": len(self._cache),
+            "negative_cached": len(self._missing),
+            "unsaved": len(self._unsaved) + len(self._writing),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "disk_reads": self.disk_reads,
+            "prefetch_reads": self.prefetch_reads,
+            "evictions": self._cache.evictions,
+            "hit_ratio": (self.hits + self.negative_hits) / reads if reads else 0.0,
+        }
+
+def create_progress_store(backend: str, path: str, flush_interval: float = 1.0,
+                          snapshot_every: int = 100000, cache_size: int = 50000,
+                          negative_cache_size: int = 10000, write_through: bool = False) -> ProgressStore:
+    """Создать хранилище прогресса по имени бэкенда
+
+    Для sqlite и sqlite-cached path - файл базы, для eventlog - каталог
+    журнала и снимков. Параметры кэша относятся только к sqlite-cached.
+    """
+    if backend == "memory":
+        return MemoryProgressStore()
+    if backend == "sqlite":
+        return SQLiteProgressStore(path, flush_interval=flush_interval)
+    if backend == "sqlite-cached":
+        return CachedSQLiteProgressStore(
+            path,
+            flush_interval=flush_interval,
+            cache_size=cache_size,
+            negative_cache_size=negative_cache_size,
+            write_through=write_through,
+        )
+    if backend == "eventlog":
+        return EventLogProgressStore(path, flush_interval=flush_interval, snapshot_every=snapshot_every)
+    raise ValueError(f"Неизвестный бэкенд хранилища прогресса: {backend}")
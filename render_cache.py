@@ -0,0 +1,432 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from models import Lesson
+
+# Экран - это пара (текст, клавиатура)
+Screen = Tuple[str, InlineKeyboardMarkup]
+
+# ========== ШАБЛОНЫ С ПОЛЬЗОВАТЕЛЬСКИМИ ПОЛЯМИ ==========
+
+PROGRESS_TEMPLATE = """
+📊 *Ваш прогресс*
+
+🎯 **Прогресс по курсу:**
+{bar} {percentage:.1f}%
+✅ Пройдено уроков: {completed}/{total}
+
+📝 **Домашние задания:**
+📤 Сдано: {submitted}/{total}
+✅ Проверено: {checked}/{total}
+
+🏆 **Текущий статус:** {status}
+📖 **Текущий урок:** {current_lesson}/{total}
+
+💡 *Продолжайте в том же духе! Каждый урок приближает вас к результату.*
+    """
+
+# {course}, {skill} и {author_words} подставляются из файла курса при сборке кэша
+COMPLETION_TEMPLATE = """
+🏆 *Поздравляем!*
+
+Вы успешно завершили курс{course}!
+
+🎯 **Ваши достижения:**
+• Освоили {total} ключевых методик
+• Выполнили {submitted} практических заданий{skill}
+{author_words}
+📚 **Что дальше?**
+• Повторите сложные моменты
+• Примените методики к реальным задачам
+• Делитесь результатами с комьюнити
+
+Сертификат о прохождении курса будет отправлен вам в течение 24 часов.
+        """
+
+WELCOME_TEMPLATE = """
+👋 Привет, {first_name}!
+
+{description}
+
+{author_intro}
+
+Готовы начать обучение?
+    """
+
+ANSWER_PREVIEW_LIMIT = 1500
+
+# Ограничение Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+
+# ========== АВТОР КУРСА ==========
+
+@dataclass(frozen=True)
+class CourseAuthor:
+    """Автор курса в экранах: имя (и в родительном падеже), напутствие и совет из файла курса
+
+    Без имени экраны обходятся без автора: подсказка и проверка - от куратора.
+    """
+    name: str = ""
+    name_genitive: str = ""
+    quote: str = ""
+    tip: str = ""
+
+    @property
+    def hint_title(self) -> str:
+        return f"Подсказка от {self.name_genitive}" if self.name_genitive else "Подсказка"
+
+    @property
+    def reviewers(self) -> str:
+        return f"{self.name} или куратор проверят его" if self.name else "Куратор проверит его"
+
+    @property
+    def tip_block(self) -> str:
+        if not (self.tip and self.name_genitive):
+            return ""
+        return f'\n💡 *Совет от {self.name_genitive}:*\n"{self.tip}"\n'
+
+    @property
+    def words_block(self) -> str:
+        if not (self.quote and self.name_genitive):
+            return ""
+        return f'\n💪 **Слова {self.name_genitive}:**\n> "{self.quote}"\n'
+
+# ========== ПОДГОТОВКА ТЕКСТА ==========
+
+def _format_literal(text: str) -> str:
+    """Текст для вставки в шаблон, который потом заполняется через format"""
+    return text.replace("{", "{{").replace("}", "}}")
+
+def escape_markdown(text: str) -> str:
+    """Экранировать служебные символы Markdown (legacy) во вставляемом тексте"""
+    for char in ("\\", "_", "*", "`", "["):
+        text = text.replace(char, "\\" + char)
+    return text
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT, separators: Tuple[str, ...] = ("\n\n", "\n")) -> Tuple[str, ...]:
+    """Разбить текст на части не длиннее limit
+
+    Режем по абзацам, затем по строкам, и только если строка сама длиннее
+    лимита - по символам, чтобы разметка реже рвалась посередине.
+    """
+    if len(text) <= limit:
+        return (text,)
+    if not separators:
+        return tuple(text[i:i + limit] for i in range(0, len(text), limit))
+    separator = separators[0]
+    parts: List[str] = []
+    current = ""
+    for piece in text.split(separator):
+        candidate = current + separator + piece if current else piece
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        if len(piece) <= limit:
+            current = piece
+        else:
+            parts.extend(split_message(piece, limit, separators[1:]))
+            current = ""
+    if current:
+        parts.append(current)
+    return tuple(parts)
+
+# ========== ПОСТРОЕНИЕ ЭКРАНОВ ==========
+
+def _build_main_menu_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="📚 Продолжить обучение", callback_data="lesson_1")],
+            [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="profile")],
+            [InlineKeyboardButton(text="🏆 Домашние задания", callback_data="assignment_1")],
+            [InlineKeyboardButton(text="👨‍🏫 Об авторе", callback_data="about_author")]
+        ]
+    )
+
+def _build_lesson_screen(lesson: Lesson, total: int) -> Screen:
+    lesson_id = lesson.id
+    lesson_message = f"""
+📖 *Урок {lesson_id}: {lesson.title}*
+
+{lesson.text_content}
+
+🎬 *Видео-материал:* {lesson.video_url if lesson.video_url else "Скоро будет добавлено"}
+    """
+
+    keyboard_buttons = []
+
+    if lesson.assignment_question:
+        keyboard_buttons.append([InlineKeyboardButton(
+            text="📝 Домашнее задание",
+            callback_data=f"submit_{lesson_id}"
+        )])
+
+    # Кнопки навигации
+    nav_buttons = []
+    if lesson_id > 1:
+        nav_buttons.append(InlineKeyboardButton(
+            text="◀️ Предыдущий",
+            callback_data=f"lesson_{lesson_id - 1}"
+        ))
+
+    if lesson_id < total:
+        nav_buttons.append(InlineKeyboardButton(
+            text="Следующий ▶️",
+            callback_data=f"lesson_{lesson_id + 1}"
+        ))
+
+    if nav_buttons:
+        keyboard_buttons.append(nav_buttons)
+
+    keyboard_buttons.extend([
+        [InlineKeyboardButton(text="✅ Отметить как пройденный", callback_data=f"complete_lesson_{lesson_id}")],
+        [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="profile")],
+        [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
+    ])
+
+    return lesson_message, InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+
+def _build_assignment_screen(lesson: Lesson, submitted: bool, checked: bool, author: CourseAuthor) -> Screen:
+    lesson_id = lesson.id
+
+    assignment_status = "❌ Не сдано"
+    if submitted:
+        assignment_status = "📤 Сдано (ожидает проверки)" if not checked else "✅ Проверено"
+
+    assignment_message = f"""
+📝 *Домашнее задание к уроку {lesson_id}*
+
+**Тема:** {escape_markdown(lesson.title)}
+
+**Задание:**
+{escape_markdown(lesson.assignment_question)}
+
+💡 *{author.hint_title}:*
+{escape_markdown(lesson.assignment_hint or "")}
+
+**Статус:** {assignment_status}
+    """
+
+    keyboard_buttons = []
+
+    if not submitted:
+        keyboard_buttons.append([InlineKeyboardButton(
+            text="📤 Сдать задание",
+            callback_data=f"submit_{lesson_id}"
+        )])
+    else:
+        keyboard_buttons.append([InlineKeyboardButton(
+            text="👀 Посмотреть мой ответ",
+            callback_data=f"check_{lesson_id}"
+        )])
+
+    keyboard_buttons.extend([
+        [InlineKeyboardButton(text="📚 Вернуться к уроку", callback_data=f"lesson_{lesson_id}")],
+        [InlineKeyboardButton(text="📊 Все задания", callback_data="assignment_1")],
+        [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
+    ])
+
+    return assignment_message, InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+
+def _build_submit_prompt(lesson: Lesson) -> str:
+    return (
+        f"✍️ *Отправьте ваш ответ на задание:*\n\n{escape_markdown(lesson.assignment_question or '')}\n\n"
+        f"💡 *Подсказка:* {escape_markdown(lesson.assignment_hint or '')}\n\n"
+        "Просто напишите сообщение с вашим ответом в чат."
+    )
+
+def _build_submission_confirmation(lesson_id: int, author: CourseAuthor) -> Screen:
+    confirmation_message = f"""
+✅ *Ваше задание к уроку {lesson_id} принято!*
+
+{author.reviewers} в ближайшее время.
+{author.tip_block}
+📊 Проверить статус всех заданий можно в разделе "Мой прогресс".
+    """
+
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="📚 Следующий урок", callback_data=f"lesson_{lesson_id + 1}")],
+            [InlineKeyboardButton(text="📝 Посмотреть задание", callback_data=f"check_{lesson_id}")],
+            [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="profile")]
+        ]
+    )
+
+    return confirmation_message, keyboard
+
+def _build_answer_screen(lesson_id: int, checked: bool) -> Tuple[str, str, InlineKeyboardMarkup]:
+    status = "✅ Проверено" if checked else "📤 Ожидает проверки"
+
+    prefix = f"""
+📝 *Ваш ответ к уроку {lesson_id}*
+
+**Статус:** {status}
+
+**Ваш ответ:**
+"""
+    suffix = """
+    """
+
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="📚 Вернуться к уроку", callback_data=f"lesson_{lesson_id}")],
+            [InlineKeyboardButton(text="📝 Все задания", callback_data="assignment_1")],
+            [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
+        ]
+    )
+
+    return prefix, suffix, keyboard
+
+def _build_progress_keyboard(current_lesson: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="📚 Продолжить обучение", callback_data=f"lesson_{current_lesson}")],
+            [InlineKeyboardButton(text="📝 Мои задания", callback_data=f"assignment_{current_lesson}")],
+            [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
+        ]
+    )
+
+def _build_welcome_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="🚀 Начать курс", callback_data="start_course")],
+            [InlineKeyboardButton(text="📊 Мой прогресс", callback_data="profile")],
+            [InlineKeyboardButton(text="ℹ️ О курсе", callback_data="about_course")]
+        ]
+    )
+
+def _build_about_course_screen(description: str) -> Screen:
+    return description, InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="🚀 Начать обучение", callback_data="start_course")],
+            [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
+        ]
+    )
+
+def _build_author_screen(author_info: str) -> Screen:
+    return author_info, InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="📚 Начать курс", callback_data="start_course")],
+            [InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
+        ]
+    )
+
+def _build_completion_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="📊 Итоговый прогресс", callback_data="profile")],
+            [InlineKeyboardButton(text="📝 Все задания", callback_data="assignment_1")],
+            [InlineKeyboardButton(text="👨‍🏫 Оставить отзыв", callback_data="feedback")]
+        ]
+    )
+
+# ========== КЭШ ==========
+
+class RenderCache:
+    """Заранее отрисованные экраны курса
+
+    Все тексты и клавиатуры, которые зависят только от уроков и флагов
+    состояния пользователя (сдано/проверено), строятся один раз при
+    создании кэша. В обработчиках остается только подставить
+    пользовательские поля в готовые шаблоны. Объекты клавиатур общие для
+    всех пользователей, поэтому изменять их нельзя. Текст урока длиннее
+    лимита Telegram заранее разбит на несколько сообщений.
+    """
+
+    def __init__(self, lessons: List[Lesson], description: str = "", author_intro: str = "",
+                 author_info: str = "", course_name: str = "", completion_skill: str = "",
+                 author: Optional[CourseAuthor] = None):
+        self.total = len(lessons)
+        self.author = author = author or CourseAuthor()
+        self.main_menu_keyboard = _build_main_menu_keyboard()
+        self.completion_keyboard = _build_completion_keyboard()
+        self.welcome_keyboard = _build_welcome_keyboard()
+        self.about_course = _build_about_course_screen(description)
+        self.about_author = _build_author_screen(author_info)
+        self._progress_template = PROGRESS_TEMPLATE.replace("{total}", str(self.total))
+        self._completion_template = (
+            COMPLETION_TEMPLATE.replace("{total}", str(self.total))
+            .replace("{course}", _format_literal(f' "{course_name}"' if course_name else ""))
+            .replace("{skill}", _format_literal(f"\n• {completion_skill}" if completion_skill else ""))
+            .replace("{author_words}", _format_literal(author.words_block))
+        )
+        self._welcome_prefix, self._welcome_suffix = (
+            WELCOME_TEMPLATE.replace("{description}", description)
+            .replace("{author_intro}", author_intro)
+            .split("{first_name}")
+        )
+
+        self._screens: Dict[tuple, object] = {}
+        for lesson in lessons:
+            lesson_id = lesson.id
+            lesson_message, keyboard = _build_lesson_screen(lesson, self.total)
+            self._screens[("lesson", lesson_id)] = (split_message(lesson_message), keyboard)
+            self._screens[("progress_keyboard", lesson_id)] = _build_progress_keyboard(lesson_id)
+            self._screens[("confirmation", lesson_id)] = _build_submission_confirmation(lesson_id, author)
+            self._screens[("submit_prompt", lesson_id)] = _build_submit_prompt(lesson)
+            for checked in (False, True):
+                self._screens[("answer", lesson_id, checked)] = _build_answer_screen(lesson_id, checked)
+            if lesson.assignment_question:
+                for submitted, checked in ((False, False), (True, False), (True, True)):
+                    self._screens[("assignment", lesson_id, submitted, checked)] = (
+                        _build_assignment_screen(lesson, submitted, checked, author)
+                    )
+
+    def lesson(self, lesson_id: int) -> Optional[Tuple[Tuple[str, ...], InlineKeyboardMarkup]]:
+        """Части текста урока и клавиатура (она показывается под последней частью); None - нет урока"""
+        return self._screens.get(("lesson", lesson_id))
+
+    def welcome(self, first_name: str) -> Screen:
+        return self._welcome_prefix + first_name + self._welcome_suffix, self.welcome_keyboard
+
+    def assignment(self, lesson_id: int, submitted: bool, checked: bool) -> Optional[Screen]:
+        # Флаг "проверено" имеет смысл только для сданного задания
+        return self._screens.get(("assignment", lesson_id, submitted, submitted and checked))
+
+    def submit_prompt(self, lesson_id: int) -> Optional[str]:
+        # Старая кнопка или урок, убранный из курса при обновлении, - None
+        return self._screens.get(("submit_prompt", lesson_id))
+
+    def submission_confirmation(self, lesson_id: int) -> Screen:
+        screen = self._screens.get(("confirmation", lesson_id))
+        if screen is None:
+            screen = _build_submission_confirmation(lesson_id, self.author)
+        return screen
+
+    def answer(self, lesson_id: int, checked: bool, answer: str) -> Screen:
+        screen = self._screens.get(("answer", lesson_id, checked))
+        if screen is None:
+            screen = _build_answer_screen(lesson_id, checked)
+        prefix, suffix, keyboard = screen
+        ellipsis = '...' if len(answer) > ANSWER_PREVIEW_LIMIT else ''
+        return prefix + answer[:ANSWER_PREVIEW_LIMIT] + ellipsis + suffix, keyboard
+
+    def progress(
+        self,
+        bar: str,
+        percentage: float,
+        completed: int,
+        submitted: int,
+        checked: int,
+        status: str,
+        current_lesson: int,
+    ) -> Screen:
+        text = self._progress_template.format(
+            bar=bar,
+            percentage=percentage,
+            completed=completed,
+            submitted=submitted,
+            checked=checked,
+            status=status,
+            current_lesson=current_lesson,
+        )
+        keyboard = self._screens.get(("progress_keyboard", current_lesson))
+        if keyboard is None:
+            keyboard = _build_progress_keyboard(current_lesson)
+        return text, keyboard
+
+    def completion(self, submitted: int) -> Screen:
+        return self._completion_template.format(submitted=submitted), self.completion_keyboard
@@ -0,0 +1,241 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from models import USER_ID_MASK
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class ReviewItem:
+    """Сданное задание, ожидающее проверки"""
+    user_id: int
+    lesson_id: int
+    submitted_at: float
+    claimed_by: Optional[int] = None
+    lease_until: float = 0.0
+
+class ReviewQueue:
+    """Очередь заданий на проверку в SQLite
+
+    Задания упорядочены по времени сдачи (индекс по submitted_at), так что
+    выбор следующих N не зависит от числа пользователей. Куратор забирает
+    задание с арендой (claim): пока аренда не истекла, другим кураторам
+    оно не выдается, а после истечения возвращается в очередь. Выбор и
+    аренда выполняются одним UPDATE ... RETURNING, поэтому несколько
+    кураторов (и процессов с общим файлом) не получат одно задание дважды.
+    Повторная сдача переставляет задание в конец очереди и снимает аренду.
+
+    Проверенное задание уходит из очереди в таблицу результатов той же
+    транзакцией. Админка работает в отдельном процессе и прогресс не
+    пишет: результаты забирает бот (watch_results) и сам отмечает задания
+    проверенными.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._results_task: Optional[asyncio.Task] = None
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS review_queue ("
+            "user_id INTEGER NOT NULL, "
+            "lesson_id INTEGER NOT NULL, "
+            "submitted_at REAL NOT NULL, "
+            "claimed_by INTEGER, "
+            "lease_until REAL NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (user_id, lesson_id))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS review_queue_submitted ON review_queue (submitted_at)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS review_results ("
+            "user_id INTEGER NOT NULL, "
+            "lesson_id INTEGER NOT NULL, "
+            "reviewer_id INTEGER NOT NULL, "
+            "checked_at REAL NOT NULL, "
+            "PRIMARY KEY (user_id, lesson_id))"
+        )
+        self._conn = conn
+
+    async def start(self, backfill: Optional[Callable[[], Awaitable[Iterable[Tuple[int, int]]]]] = None):
+        """Открыть очередь; один раз перенести в нее уже сданные непроверенные задания
+
+        Перенос выполняется только в пустую очередь и отмечается в базе
+        (user_version), поэтому полный обход прогресса не повторяется при
+        каждом запуске, даже когда все задания уже проверены.
+        """
+        await asyncio.to_thread(self._open)
+        if backfill is None or await asyncio.to_thread(self._backfilled):
+            return
+        items = list(await backfill()) if await self.pending_count() == 0 else []
+        await asyncio.to_thread(self._enqueue_many, items, 0.0, True)
+        if items:
+            logger.info(f"В очередь проверки перенесено заданий: {len(items)}")
+
+    def _backfilled(self) -> bool:
+        return self._fetchall("PRAGMA user_version")[0][0] >= 1
+
+    def _execute(self, sql: str, params: tuple = ()) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> List[tuple]:
+        # Строки читаем под той же блокировкой, что и запрос
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _enqueue_many(self, items: List[Tuple[int, int]], submitted_at: float, backfill: bool = False):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO review_queue (user_id, lesson_id, submitted_at) "
+                    "VALUES (?, ?, ?)",
+                    [(user_id, lesson_id, submitted_at) for user_id, lesson_id in items],
+                )
+                if backfill:
+                    self._conn.execute("PRAGMA user_version = 1")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _enqueue(self, user_id: int, lesson_id: int, submitted_at: float):
+        self._execute(
+            "INSERT INTO review_queue (user_id, lesson_id, submitted_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id, lesson_id) DO UPDATE SET "
+            "submitted_at = excluded.submitted_at, claimed_by = NULL, lease_until = 0",
+            (user_id, lesson_id, submitted_at),
+        )
+
+    async def enqueue(self, user_id: int, lesson_id: int, submitted_at: Optional[float] = None):
+        """Поставить сданное задание в очередь"""
+        await asyncio.to_thread(
+            self._enqueue, user_id, lesson_id, submitted_at if submitted_at is not None else time.time()
+        )
+
+    def _claim(self, reviewer_id: int, lease_seconds: float) -> Optional[ReviewItem]:
+        now = time.time()
+        rows = self._fetchall(
+            "UPDATE review_queue SET claimed_by = ?, lease_until = ? "
+            "WHERE rowid = ("
+            "SELECT rowid FROM review_queue WHERE lease_until <= ? "
+            "ORDER BY submitted_at LIMIT 1) "
+            "RETURNING user_id, lesson_id, submitted_at, claimed_by, lease_until",
+            (reviewer_id, now + lease_seconds, now),
+        )
+        return ReviewItem(*rows[0]) if rows else None
+
+    async def claim(self, reviewer_id: int, lease_seconds: float = 600) -> Optional[ReviewItem]:
+        """Забрать самое давнее свободное задание на lease_seconds"""
+        return await asyncio.to_thread(self._claim, reviewer_id, lease_seconds)
+
+    def _complete(self, user_id: int, lesson_id: int, reviewer_id: int) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                deleted = self._conn.execute(
+                    "DELETE FROM review_queue WHERE user_id = ? AND lesson_id = ? AND claimed_by = ?",
+                    (user_id, lesson_id, reviewer_id),
+                ).rowcount
+                if deleted:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO review_results (user_id, lesson_id, reviewer_id, checked_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (user_id, lesson_id, reviewer_id, time.time()),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return deleted > 0
+
+    async def complete(self, user_id: int, lesson_id: int, reviewer_id: int) -> bool:
+        """Убрать проверенное задание и записать результат; False, если оно уже у другого куратора"""
+        return await asyncio.to_thread(self._complete, user_id, lesson_id, reviewer_id)
+
+    def _take_results(self, limit: int, worker_index: int, worker_count: int) -> List[Tuple[int, int]]:
+        # Воркер забирает только своих пользователей: маршрутизация - по id в Telegram
+        return [tuple(row) for row in self._fetchall(
+            "DELETE FROM review_results WHERE rowid IN ("
+            "SELECT rowid FROM review_results WHERE (user_id & ?) % ? = ? ORDER BY checked_at LIMIT ?) "
+            "RETURNING user_id, lesson_id",
+            (USER_ID_MASK, worker_count, worker_index, limit),
+        )]
+
+    async def _results_loop(self, apply: Callable[[int, int], Awaitable[None]], interval: float,
+                            worker_index: int, worker_count: int):
+        while True:
+            try:
+                for user_id, lesson_id in await asyncio.to_thread(
+                    self._take_results, 500, worker_index, worker_count
+                ):
+                    await apply(user_id, lesson_id)
+            except Exception as e:
+                logger.error(f"Ошибка применения результатов проверки: {e}")
+            await asyncio.sleep(interval)
+
+    async def watch_results(self, apply: Callable[[int, int], Awaitable[None]], interval: float = 2.0,
+                            worker_index: int = 0, worker_count: int = 1):
+        """Раз в interval секунд забирать результаты проверки и ждать apply(user_id, lesson_id) для каждого"""
+        if self._results_task is None:
+            self._results_task = asyncio.create_task(
+                self._results_loop(apply, interval, worker_index, worker_count)
+            )
+
+    def _release(self, user_id: int, lesson_id: int, reviewer_id: int):
+        self._execute(
+            "UPDATE review_queue SET claimed_by = NULL, lease_until = 0 "
+            "WHERE user_id = ? AND lesson_id = ? AND claimed_by = ?",
+            (user_id, lesson_id, reviewer_id),
+        )
+
+    async def release(self, user_id: int, lesson_id: int, reviewer_id: int):
+        """Вернуть задание в очередь до истечения аренды"""
+        await asyncio.to_thread(self._release, user_id, lesson_id, reviewer_id)
+
+    def _peek(self, limit: int) -> List[ReviewItem]:
+        rows = self._fetchall(
+            "SELECT user_id, lesson_id, submitted_at, claimed_by, lease_until FROM review_queue "
+            "WHERE lease_until <= ? ORDER BY submitted_at LIMIT ?",
+            (time.time(), limit),
+        )
+        return [ReviewItem(*row) for row in rows]
+
+    async def peek(self, limit: int = 10) -> List[ReviewItem]:
+        """Следующие limit свободных заданий без аренды"""
+        return await asyncio.to_thread(self._peek, limit)
+
+    async def pending_count(self) -> int:
+        """Сколько заданий в очереди, включая взятые в работу"""
+        rows = await asyncio.to_thread(self._fetchall, "SELECT COUNT(*) FROM review_queue")
+        return rows[0][0]
+
+    async def close(self):
+        if self._results_task is not None:
+            self._results_task.cancel()
+            try:
+                await self._results_task
+            except asyncio.CancelledError:
+                pass
+            self._results_task = None
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,296 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from broadcast import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Timer:
+    """Отложенное действие для пользователя: одно на пару (user_id, kind)"""
+    user_id: int
+    kind: str
+    due_at: float
+    lesson_id: int = 0
+    attempt: int = 0
+
+# Обработчик сработавшего таймера; возвращает следующий таймер той же цепочки или None
+TimerHandler = Callable[[Timer], Awaitable[Optional[Timer]]]
+
+class TimerStore:
+    """Таймеры в SQLite, упорядоченные по времени срабатывания
+
+    Индекс по due_at работает как куча на диске: постановка и выбор
+    ближайших таймеров стоят O(log n) и не зависят от числа ожидающих,
+    поэтому миллионы таймеров не занимают память процесса. Выбор идет с
+    арендой: срок сработавшего таймера сдвигается на время обработки, и
+    если процесс упадет до завершения, таймер сработает повторно.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS timers ("
+            "user_id INTEGER NOT NULL, "
+            "kind TEXT NOT NULL, "
+            "due_at REAL NOT NULL, "
+            "lesson_id INTEGER NOT NULL DEFAULT 0, "
+            "attempt INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (user_id, kind))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS timers_due ON timers (due_at)")
+        self._conn = conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _transaction(self, write: Callable[[sqlite3.Connection], None]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                write(self._conn)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def apply(self, changes: Iterable[Tuple[Tuple[int, str], Optional[Timer]]]):
+        """Записать пачку изменений: таймер - поставить или заменить, None - отменить"""
+        upserts, deletes = [], []
+        for (user_id, kind), timer in changes:
+            if timer is None:
+                deletes.append((user_id, kind))
+            else:
+                upserts.append((timer.user_id, timer.kind, timer.due_at, timer.lesson_id, timer.attempt))
+
+        def write(conn: sqlite3.Connection):
+            conn.executemany("DELETE FROM timers WHERE user_id = ? AND kind = ?", deletes)
+            conn.executemany(
+                "INSERT INTO timers (user_id, kind, due_at, lesson_id, attempt) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id, kind) DO UPDATE SET due_at = excluded.due_at, "
+                "lesson_id = excluded.lesson_id, attempt = excluded.attempt",
+                upserts,
+            )
+
+        self._transaction(write)
+
+    def claim(self, now: float, limit: int, lease: float) -> List[Timer]:
+        """Забрать до limit наступивших таймеров, сдвинув их срок на lease"""
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE timers SET due_at = ? WHERE rowid IN ("
+                "SELECT rowid FROM timers WHERE due_at <= ? ORDER BY due_at LIMIT ?) "
+                "RETURNING user_id, kind, due_at, lesson_id, attempt",
+                (now + lease, now, limit),
+            ).fetchall()
+        return [Timer(*row) for row in rows]
+
+    def complete(self, done: List[Tuple[Timer, Optional[Timer]]]):
+        """Снять обработанные таймеры и поставить следующие из их цепочек
+
+        Таймер снимается, только если его срок все еще равен аренде: если
+        пользователь за это время перенес его, новая версия остается.
+        """
+        def write(conn: sqlite3.Connection):
+            for timer, following in done:
+                deleted = conn.execute(
+                    "DELETE FROM timers WHERE user_id = ? AND kind = ? AND due_at = ?",
+                    (timer.user_id, timer.kind, timer.due_at),
+                ).rowcount
+                if deleted and following is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO timers (user_id, kind, due_at, lesson_id, attempt) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (following.user_id, following.kind, following.due_at,
+                         following.lesson_id, following.attempt),
+                    )
+
+        self._transaction(write)
+
+    @property
+    def opened(self) -> bool:
+        return self._conn is not None
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM timers LIMIT 1").fetchone() is None
+
+    def backfilled(self) -> bool:
+        """Таймеры для существующих пользователей уже ставились"""
+        with self._lock:
+            return self._conn.execute("PRAGMA user_version").fetchone()[0] >= 1
+
+    def mark_backfilled(self, timers: List[Timer]):
+        """Поставить таймеры существующих пользователей и отметить это в базе"""
+        def write(conn: sqlite3.Connection):
+            conn.executemany(
+                "INSERT OR REPLACE INTO timers (user_id, kind, due_at, lesson_id, attempt) VALUES (?, ?, ?, ?, ?)",
+                [(t.user_id, t.kind, t.due_at, t.lesson_id, t.attempt) for t in timers],
+            )
+            conn.execute("PRAGMA user_version = 1")
+
+        self._transaction(write)
+
+    def overdue(self, now: float) -> float:
+        """На сколько секунд опаздывает самый ранний таймер (0 - очередь успевает)"""
+        with self._lock:
+            due_at = self._conn.execute("SELECT MIN(due_at) FROM timers").fetchone()[0]
+        return max(0.0, now - due_at) if due_at is not None else 0.0
+
+class Scheduler:
+    """Планировщик таймеров пользователей (напоминания, рассылка уроков)
+
+    schedule/cancel вызываются из обработчиков и подписчиков событий и
+    только запоминают изменение в словаре: частые переносы одного таймера
+    схлопываются, а на диск пачка уходит из фонового цикла в отдельном
+    потоке. Цикл раз в poll_interval записывает изменения, забирает
+    наступившие таймеры пачками по batch_size и вызывает обработчик по
+    kind. Скорость срабатываний ограничивает общий token bucket. Таймеры
+    хранятся в SQLite, поэтому переживают перезапуск: просроченные за
+    время простоя сработают при следующем запуске.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        rate: float = 10.0,
+        batch_size: int = 500,
+        lease: float = 300.0,
+        poll_interval: float = 1.0,
+    ):
+        self.store = TimerStore(path)
+        self.bucket = TokenBucket(rate)
+        self.batch_size = batch_size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, TimerHandler] = {}
+        self._pending: Dict[Tuple[int, str], Optional[Timer]] = {}
+        self._write_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.fired = 0
+        self.skipped = 0
+        self.errors = 0
+        self.overdue = 0.0
+
+    def handler(self, kind: str, handler: TimerHandler):
+        """Назначить обработчик таймеров вида kind"""
+        self._handlers[kind] = handler
+
+    def schedule(self, user_id: int, kind: str, due_at: float, lesson_id: int = 0, attempt: int = 0):
+        """Поставить (или перенести) таймер пользователя"""
+        self._pending[(user_id, kind)] = Timer(user_id, kind, due_at, lesson_id, attempt)
+
+    def cancel(self, user_id: int, kind: str):
+        self._pending[(user_id, kind)] = None
+
+    async def flush(self):
+        """Записать накопленные изменения таймеров"""
+        if not self._pending or not self.store.opened:
+            return
+        async with self._write_lock:
+            pending, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self.store.apply, list(pending.items()))
+            except Exception:
+                # Более свежие изменения, пришедшие во время записи, не затираем
+                for key, timer in pending.items():
+                    self._pending.setdefault(key, timer)
+                raise
+
+    async def start(self, backfill: Optional[Callable[[], Awaitable[Iterable[Timer]]]] = None):
+        """Открыть таймеры; один раз поставить таймеры для уже существующих пользователей
+
+        Обход пользователей выполняется только для пустой базы и отмечается
+        в ней, при следующих запусках он не повторяется. backfill - корутина:
+        полный обход не должен занимать event loop целиком.
+        """
+        await asyncio.to_thread(self.store.open)
+        if backfill is not None and not await asyncio.to_thread(self.store.backfilled):
+            timers = list(await backfill()) if await asyncio.to_thread(self.store.is_empty) else []
+            await asyncio.to_thread(self.store.mark_backfilled, timers)
+            if timers:
+                logger.info(f"Поставлено таймеров для существующих пользователей: {len(timers)}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.flush()
+                self.overdue = await asyncio.to_thread(self.store.overdue, time.time())
+                batch = await asyncio.to_thread(self.store.claim, time.time(), self.batch_size, self.lease)
+                if batch:
+                    await self._dispatch(batch)
+                    if len(batch) == self.batch_size:
+                        # Отставание: следующую пачку забираем без паузы
+                        continue
+            except Exception as e:
+                logger.error(f"Ошибка планировщика: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _dispatch(self, batch: List[Timer]):
+        done: List[Tuple[Timer, Optional[Timer]]] = []
+        try:
+            for timer in batch:
+                if (timer.user_id, timer.kind) in self._pending:
+                    # Таймер уже перенесен или отменен, новая версия еще не записана
+                    self.skipped += 1
+                    continue
+                handler = self._handlers.get(timer.kind)
+                if handler is None:
+                    logger.warning(f"Нет обработчика таймеров {timer.kind}, таймер {timer.user_id} снят")
+                    done.append((timer, None))
+                    continue
+                await self.bucket.acquire()
+                try:
+                    done.append((timer, await handler(timer)))
+                    self.fired += 1
+                except Exception as e:
+                    # Таймер остается в аренде и сработает повторно после ее истечения
+                    self.errors += 1
+                    logger.error(f"Ошибка таймера {timer.kind} пользователя {timer.user_id}: {e}")
+        finally:
+            if done:
+                await asyncio.to_thread(self.store.complete, done)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.store.opened:
+            await self.flush()
+            await asyncio.to_thread(self.store.close)
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            "pending_writes": len(self._pending),
+            "fired": self.fired,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "overdue_seconds": self.overdue,
+        }
@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+from contextvars import ContextVar
+from enum import Enum
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject
+from aiogram.webhook.aiohttp_server import BaseRequestHandler
+from aiohttp import web
+
+from models import MAX_NAMESPACE, NAMESPACE_SHIFT, make_user_key
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Tenant:
+    """Бот одного курса в общем процессе"""
+    id: str
+    namespace: int
+    bot: Bot
+    course_id: Optional[str] = None
+
+    def user_key(self, user_id: int) -> int:
+        return make_user_key(self.namespace, user_id)
+
+# Арендатор, чей апдейт сейчас обрабатывается (задает TenantMiddleware)
+current_tenant: ContextVar[Optional[Tenant]] = ContextVar("current_tenant", default=None)
+
+def load_tenants_file(path: str) -> List[dict]:
+    """Описание арендаторов: [{"id", "namespace", "token" или "token_env", "course"}]"""
+    with open(path, "rb") as f:
+        entries = json.load(f)
+    for entry in entries:
+        if "token" not in entry and "token_env" in entry:
+            entry["token"] = os.getenv(entry["token_env"])
+        if not entry.get("token"):
+            raise ValueError(f"Не задан токен арендатора {entry.get('id')}")
+    return entries
+
+class TenantRegistry:
+    """Арендаторы процесса с поиском по id, боту и пространству ключей"""
+
+    def __init__(self):
+        self._by_id: Dict[str, Tenant] = {}
+        self._by_bot: Dict[int, Tenant] = {}
+        self._by_namespace: Dict[int, Tenant] = {}
+
+    def add(self, tenant: Tenant):
+        # Номер арендатора входит в ключи хранилищ, поэтому задается явно и не меняется
+        if not 0 <= tenant.namespace <= MAX_NAMESPACE:
+            raise ValueError(f"Номер арендатора {tenant.id} вне диапазона 0..{MAX_NAMESPACE}")
+        if tenant.id in self._by_id or tenant.namespace in self._by_namespace:
+            raise ValueError(f"Арендатор {tenant.id} (номер {tenant.namespace}) уже зарегистрирован")
+        if tenant.bot.id in self._by_bot:
+            raise ValueError(f"Токен арендатора {tenant.id} уже используется")
+        self._by_id[tenant.id] = tenant
+        self._by_bot[tenant.bot.id] = tenant
+        self._by_namespace[tenant.namespace] = tenant
+
+    def get(self, tenant_id: str) -> Optional[Tenant]:
+        return self._by_id.get(tenant_id)
+
+    def for_bot(self, bot: Bot) -> Optional[Tenant]:
+        return self._by_bot.get(bot.id)
+
+    def for_key(self, key: int) -> Optional[Tenant]:
+        return self._by_namespace.get(key >> NAMESPACE_SHIFT)
+
+    def __iter__(self) -> Iterator[Tenant]:
+        return iter(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+class _CpuTimed:
+    """Обертка корутины, суммирующая процессорное время ее шагов
+
+    Время считается только пока выполняется сама корутина (между
+    ожиданиями), поэтому параллельные апдейты других арендаторов в него
+    не попадают.
+    """
+    __slots__ = ("coro", "seconds")
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.seconds = 0.0
+
+    def __await__(self):
+        coro = self.coro
+        value, error = None, None
+        while True:
+            started = time.thread_time()
+            try:
+                yielded = coro.send(value) if error is None else coro.throw(error)
+            except StopIteration as stop:
+                self.seconds += time.thread_time() - started
+                return stop.value
+            except BaseException:
+                self.seconds += time.thread_time() - started
+                raise
+            self.seconds += time.thread_time() - started
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+class TenantMiddleware(BaseMiddleware):
+    """Внешний middleware: арендатор апдейта и его нагрузка
+
+    Определяет арендатора по боту, принявшему апдейт, выставляет
+    current_tenant на время обработки и считает апдейты, время и
+    процессорное время обработчиков по арендаторам. Регистрируется после
+    UserOrderingMiddleware, чтобы ожидание очереди пользователя не
+    считалось временем арендатора.
+    """
+
+    def __init__(self, registry: TenantRegistry, metrics: MetricsRegistry):
+        self.registry = registry
+        self.updates = metrics.counter("bot_tenant_updates_total", "Апдейты арендатора", ("tenant",))
+        self.errors = metrics.counter("bot_tenant_errors_total", "Апдейты арендатора с исключением", ("tenant",))
+        self.busy = metrics.counter(
+            "bot_tenant_busy_seconds_total", "Время обработки апдейтов арендатора", ("tenant",)
+        )
+        self.cpu = metrics.counter(
+            "bot_tenant_cpu_seconds_total", "Процессорное время обработки апдейтов арендатора", ("tenant",)
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tenant = self.registry.for_bot(data["bot"])
+        if tenant is None:
+            logger.warning(f"Апдейт от незарегистрированного бота {data['bot'].id}")
+            return None
+        data["tenant"] = tenant
+        token = current_tenant.set(tenant)
+        timed = _CpuTimed(handler(event, data))
+        started = time.perf_counter()
+        try:
+            return await timed
+        except Exception:
+            self.errors.inc(tenant.id)
+            raise
+        finally:
+            current_tenant.reset(token)
+            self.updates.inc(tenant.id)
+            self.busy.inc(tenant.id, amount=time.perf_counter() - started)
+            self.cpu.inc(tenant.id, amount=timed.seconds)
+
+class TenantUsage:
+    """Периодическая оценка памяти арендаторов по записям прогресса
+
+    Записи считаются хранилищем при добавлении (namespace_counts), размер -
+    по выборке записей каждого арендатора (глубокий sys.getsizeof),
+    умноженной на их число. Хранилища в памяти отдают выборку из первых
+    запомненных ключей арендатора, sqlite-cached - из диапазона ключей в
+    базе; подсчет размера идет в потоке.
+    """
+
+    SAMPLE = 64
+
+    def __init__(self, registry: TenantRegistry, metrics: MetricsRegistry):
+        self.registry = registry
+        self._task: Optional[asyncio.Task] = None
+        self.users = metrics.gauge("bot_tenant_users", "Записи прогресса арендатора", ("tenant",))
+        self.memory = metrics.gauge(
+            "bot_tenant_progress_bytes", "Оценка памяти записей прогресса арендатора", ("tenant",)
+        )
+
+    def _average_sizes(self, store, namespaces: List[int]) -> Dict[int, float]:
+        averages = {}
+        for namespace in namespaces:
+            sizes = [deep_sizeof(progress) for progress in store.sample(namespace, self.SAMPLE)]
+            averages[namespace] = sum(sizes) / len(sizes) if sizes else 0
+        return averages
+
+    async def measure(self, store):
+        counts = store.namespace_counts()
+        tenants = list(self.registry)
+        averages = await asyncio.to_thread(
+            self._average_sizes, store, [tenant.namespace for tenant in tenants]
+        )
+        for tenant in tenants:
+            count = counts.get(tenant.namespace, 0)
+            self.users.set(tenant.id, value=count)
+            self.memory.set(tenant.id, value=int(averages[tenant.namespace] * count))
+
+    async def _loop(self, store, interval: float):
+        while True:
+            try:
+                await self.measure(store)
+            except Exception as e:
+                logger.error(f"Ошибка оценки памяти арендаторов: {e}")
+            await asyncio.sleep(interval)
+
+    async def start(self, store, interval: float):
+        """Пересчитывать оценку раз в interval секунд (store - хранилище прогресса)"""
+        if interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(store, interval))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+def deep_sizeof(obj: Any, _seen: Optional[set] = None) -> int:
+    """Размер объекта вместе с вложенными контейнерами, строками и атрибутами"""
+    seen = _seen if _seen is not None else set()
+    # Члены Enum общие для всех записей и в память арендатора не входят
+    if id(obj) in seen or isinstance(obj, Enum):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    # Считается в потоке, пока обработчики меняют записи: контейнеры копируем
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in list(obj.items()))
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in list(obj))
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if slot != "__weakref__" and hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+class TenantRequestHandler(BaseRequestHandler):
+    """Webhook арендаторов на /webhook/{tenant}: бот выбирается по пути"""
+
+    def __init__(self, registry: TenantRegistry, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.registry = registry
+
+    async def resolve_bot(self, request: web.Request) -> Bot:
+        tenant = self.registry.get(request.match_info["tenant"])
+        if tenant is None:
+            raise web.HTTPNotFound()
+        return tenant.bot
+
+    def verify_secret(self, telegram_secret_token: str, bot: Bot) -> bool:
+        return True
+
+    async def close(self) -> None:
+        # Сессия общая для всех ботов, ее закрывает основной обработчик
+        pass
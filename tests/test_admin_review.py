@@ -0,0 +1,81 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import admin_bot
+from admin_bot import AdminBot, ReviewTenant
+from content import CourseCatalog
+from models import UserProgress, make_user_key
+from review_queue import ReviewQueue
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+class _Query:
+    def __init__(self):
+        self.texts = []
+
+    async def edit_message_text(self, text, reply_markup=None):
+        self.texts.append(text)
+
+class _Progress:
+    def __init__(self, progresses):
+        self.progresses = progresses
+
+    async def get(self, key):
+        return self.progresses.get(key)
+
+def _catalog(directory):
+    for course_id, title in (("main", "Основной урок"), ("second", "Урок второго курса")):
+        with open(directory / f"{course_id}.json", "w", encoding="utf-8") as f:
+            json.dump({"lessons": [{"id": 1, "title": title}]}, f, ensure_ascii=False)
+    catalog = CourseCatalog(str(directory), default_course="main")
+    catalog.load()
+    return catalog
+
+def test_tenant_submission_uses_tenant_course_and_bot(tmp_path, monkeypatch):
+    key = make_user_key(2, 555)
+    progress = UserProgress(key)
+    progress.submitted_assignments[1] = "ответ ученика"
+    tenant_bot, main_bot = _Bot(), _Bot()
+    monkeypatch.setattr(admin_bot, "course_catalog", _catalog(tmp_path))
+    monkeypatch.setattr(admin_bot, "user_progress_db", _Progress({key: progress}))
+    monkeypatch.setattr(admin_bot, "review_tenants", {
+        0: ReviewTenant("default"),
+        2: ReviewTenant("second", "second", tenant_bot),
+    })
+    admin = object.__new__(AdminBot)
+    query = _Query()
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=100), callback_query=query)
+    context = SimpleNamespace(bot=main_bot)
+
+    async def scenario():
+        queue = ReviewQueue(str(tmp_path / "reviews.sqlite3"))
+        monkeypatch.setattr(admin_bot, "review_queue", queue)
+        await queue.start()
+        try:
+            await queue.enqueue(key, 1)
+            await admin.show_next_review(update, context)
+            await admin.handle_review(update, context, "ok", key, 1)
+        finally:
+            await queue.close()
+
+    asyncio.run(scenario())
+    card = query.texts[0]
+    assert "👤 ID: 555\n" in card and "🤖 Бот: second\n" in card
+    assert "Урок 1: Урок второго курса" in card and "ответ ученика" in card
+    # Уведомление уходит от бота арендатора на id в Telegram, а не на ключ хранилища
+    assert tenant_bot.sent == [(555, "✅ Ваше задание к уроку 1 проверено!")]
+    assert main_bot.sent == []
+
+def test_unknown_tenant_is_not_notified(monkeypatch):
+    main_bot = _Bot()
+    monkeypatch.setattr(admin_bot, "review_tenants", {0: ReviewTenant("default")})
+    admin = object.__new__(AdminBot)
+    asyncio.run(admin.notify_checked(SimpleNamespace(bot=main_bot), make_user_key(5, 42), 1))
+    asyncio.run(admin.notify_checked(SimpleNamespace(bot=main_bot), 42, 2))
+    assert main_bot.sent == [(42, "✅ Ваше задание к уроку 2 проверено!")]
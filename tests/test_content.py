@@ -0,0 +1,34 @@
+import os
+import json
+import asyncio
+
+import pytest
+
+from content import CourseCatalog
+
+def _write_course(directory, course_id, title):
+    with open(directory / f"{course_id}.json", "w", encoding="utf-8") as f:
+        json.dump({"lessons": [{"id": 1, "title": title}]}, f, ensure_ascii=False)
+
+def test_reload_keeps_courses_used_by_tenants(tmp_path):
+    for course_id in ("main", "second", "spare"):
+        _write_course(tmp_path, course_id, course_id)
+    catalog = CourseCatalog(str(tmp_path), default_course="main")
+    catalog.load()
+    catalog.require("second")
+    with pytest.raises(RuntimeError):
+        catalog.require("missing")
+
+    # Курс арендатора пропал: обновление отклоняется целиком
+    os.remove(tmp_path / "second.json")
+    _write_course(tmp_path, "main", "новое название")
+    assert not asyncio.run(catalog.reload())
+    assert catalog.course("second").lessons[0].title == "second"
+    assert catalog.course().lessons[0].title == "main"
+
+    # Неиспользуемый курс можно убрать
+    _write_course(tmp_path, "second", "second")
+    os.remove(tmp_path / "spare.json")
+    assert asyncio.run(catalog.reload())
+    assert set(catalog.courses()) == {"main", "second"}
+    assert catalog.course().lessons[0].title == "новое название"
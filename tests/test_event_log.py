@@ -0,0 +1,108 @@
+import os
+
+from event_log import EventLog, encode_event, encode_snapshot_users, read_events
+from events import EventType, ProgressEvent
+from models import AnswerRef, AssignmentStatus, UserStatus
+
+def _events():
+    return [
+        ProgressEvent(EventType.STATUS_CHANGED, 1, previous=UserStatus.NOT_STARTED, current=UserStatus.IN_PROGRESS),
+        ProgressEvent(EventType.LESSON_VIEWED, 1, 2),
+        ProgressEvent(EventType.LESSON_COMPLETED, 1, 1),
+        ProgressEvent(
+            EventType.ASSIGNMENT_SUBMITTED, 2, 3,
+            previous=AssignmentStatus.NOT_SUBMITTED, current=AssignmentStatus.SUBMITTED,
+            answer=AnswerRef(7, "ответ"),
+        ),
+    ]
+
+def _write(directory, events):
+    log = EventLog(str(directory))
+    log.load()
+    log.write(b"".join(encode_event(event) for event in events))
+    log.next_seq += len(events)
+    log.close()
+
+def test_replay_restores_progress(tmp_path):
+    _write(tmp_path, _events())
+    log = EventLog(str(tmp_path))
+    data = log.load()
+    log.close()
+    assert log.next_seq == 4 and log.replayed == 4
+    assert data[1].status == UserStatus.IN_PROGRESS
+    assert data[1].current_lesson == 2
+    assert 1 in data[1].completed_lessons
+    assert data[2].submitted_assignments[3] == "ответ"
+
+def test_replay_after_snapshot_reads_only_tail(tmp_path):
+    events = _events()
+    _write(tmp_path, events[:2])
+    log = EventLog(str(tmp_path))
+    data = log.load()
+    users, count = encode_snapshot_users(data.values())
+    log.write_snapshot(log.next_seq, users, count)
+    log.rotate(b"", log.next_seq)
+    log.write(b"".join(encode_event(event) for event in events[2:]))
+    log.close()
+
+    log = EventLog(str(tmp_path))
+    data = log.load()
+    log.close()
+    assert log.replayed == 2 and log.next_seq == 4
+    assert data[1].status == UserStatus.IN_PROGRESS and data[1].current_lesson == 2
+    assert 1 in data[1].completed_lessons
+
+def test_torn_tail_is_truncated_and_log_continues(tmp_path):
+    events = _events()
+    _write(tmp_path, events[:2])
+    (path,) = [os.path.join(tmp_path, name) for name in os.listdir(tmp_path)]
+    with open(path, "ab") as f:
+        f.write(encode_event(events[2])[:-3])
+    size = os.path.getsize(path)
+
+    log = EventLog(str(tmp_path))
+    data = log.load()
+    assert log.next_seq == 2
+    assert os.path.getsize(path) < size
+    assert not data[1].completed_lessons
+    log.write(encode_event(events[3]))
+    log.next_seq += 1
+    log.close()
+
+    assert [seq for seq, _ in read_events(str(tmp_path))] == [0, 1, 2]
+
+def test_large_payload_round_trip(tmp_path):
+    preview = "я" * 40000
+    event = ProgressEvent(
+        EventType.ASSIGNMENT_SUBMITTED, 1, 1,
+        previous=AssignmentStatus.NOT_SUBMITTED, current=AssignmentStatus.SUBMITTED,
+        answer=AnswerRef(9, preview),
+    )
+    _write(tmp_path, [event, ProgressEvent(EventType.LESSON_VIEWED, 1, 2)])
+    data = EventLog(str(tmp_path)).load()
+    assert data[1].submitted_assignments[1] == preview
+    assert data[1].current_lesson == 2
+
+def test_inline_answer_survives_replay_and_move(tmp_path):
+    # Ответ из записи до хранилища ответов: handle 0, в журнале полный текст
+    submitted = ProgressEvent(
+        EventType.ASSIGNMENT_SUBMITTED, 1, 2,
+        previous=AssignmentStatus.NOT_SUBMITTED, current=AssignmentStatus.SUBMITTED,
+        answer=AnswerRef(0, "текст ответа"),
+    )
+    checked = ProgressEvent(
+        EventType.ASSIGNMENT_CHECKED, 1, 2,
+        previous=AssignmentStatus.SUBMITTED, current=AssignmentStatus.CHECKED,
+    )
+    _write(tmp_path, [submitted, checked])
+    log = EventLog(str(tmp_path))
+    data = log.load()
+    log.close()
+    assert data[1].submitted_assignments[2] == "текст ответа"
+    assert data[1].answer_ref(2) is None
+
+    # Перенос в хранилище меняет только ссылку: проверка задания сохраняется
+    _write(tmp_path, [ProgressEvent(EventType.ANSWER_MOVED, 1, 2, answer=AnswerRef(5, "текст"))])
+    data = EventLog(str(tmp_path)).load()
+    assert data[1].answer_ref(2) == AnswerRef(5, "текст")
+    assert data[1].assignment_status(2) == AssignmentStatus.CHECKED
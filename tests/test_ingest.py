@@ -0,0 +1,92 @@
+import asyncio
+
+from aiogram import Bot
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from ingest import WebhookIngest
+
+class _Dispatcher:
+    """Вместо dispatcher aiogram: запоминает переданные апдейты"""
+
+    def __init__(self):
+        self.updates = []
+
+    async def feed_raw_update(self, bot, update):
+        self.updates.append((bot.id, update["update_id"]))
+
+def test_duplicates_are_acknowledged_but_not_processed():
+    bots = {"default": Bot("1:default"), "second": Bot("2:second")}
+
+    async def scenario():
+        dispatcher = _Dispatcher()
+        ingest = WebhookIngest(
+            dispatcher, workers=2,
+            resolve_bot=lambda request: bots.get(request.match_info.get("tenant", "default")),
+        )
+        app = web.Application()
+        ingest.register(app)
+        app.router.add_post("/webhook/{tenant}", ingest.handle)
+        async with TestClient(TestServer(app)) as client:
+            statuses = [
+                (await client.post(path, json={"update_id": update_id})).status
+                for path, update_id in (
+                    ("/webhook", 1), ("/webhook", 2), ("/webhook", 1),
+                    # Тот же update_id другого бота - другой апдейт
+                    ("/webhook/second", 1), ("/webhook/second", 1),
+                    ("/webhook/unknown", 3),
+                )
+            ]
+            statuses.append((await client.post("/webhook", data=b"{}")).status)
+            await ingest.join()
+        return statuses, sorted(dispatcher.updates), ingest.metrics()
+
+    statuses, updates, metrics = asyncio.run(scenario())
+    assert statuses == [200, 200, 200, 200, 200, 404, 400]
+    assert updates == [(1, 1), (1, 2), (2, 1)]
+    assert (metrics["accepted"], metrics["duplicates"], metrics["invalid"], metrics["processed"]) == (3, 2, 1, 3)
+
+def test_rejected_update_is_processed_on_retry():
+    async def scenario():
+        dispatcher = _Dispatcher()
+        ingest = WebhookIngest(dispatcher, bot=Bot("1:default"), workers=1)
+        app = web.Application()
+        app.router.add_post("/webhook", ingest.handle)
+        async with TestClient(TestServer(app)) as client:
+            # До запуска обработчиков апдейты не принимаются и не запоминаются
+            rejected = (await client.post("/webhook", json={"update_id": 5})).status
+            await ingest.start()
+            accepted = (await client.post("/webhook", json={"update_id": 5})).status
+            await ingest.stop()
+        return rejected, accepted, dispatcher.updates, ingest.metrics()
+
+    rejected, accepted, updates, metrics = asyncio.run(scenario())
+    assert (rejected, accepted) == (503, 200)
+    assert updates == [(1, 5)]
+    assert metrics["duplicates"] == 0 and metrics["rejected"] == 1
+
+class _SlowDispatcher(_Dispatcher):
+    """Ранние апдейты обрабатываются дольше поздних: без очереди по пользователям порядок сломается"""
+
+    async def feed_raw_update(self, bot, update):
+        await asyncio.sleep((10 - update["update_id"] % 10) * 0.002)
+        self.updates.append((update["message"]["from"]["id"], update["update_id"]))
+
+def test_updates_of_one_user_are_processed_in_order():
+    async def scenario():
+        dispatcher = _SlowDispatcher()
+        ingest = WebhookIngest(dispatcher, bot=Bot("1:default"), workers=8)
+        app = web.Application()
+        ingest.register(app)
+        async with TestClient(TestServer(app)) as client:
+            for update_id in range(30):
+                user = {"id": 100 + update_id // 10}
+                await client.post("/webhook", json={"update_id": update_id, "message": {"from": user}})
+            await ingest.join()
+        return dispatcher.updates
+
+    updates = asyncio.run(scenario())
+    assert len(updates) == 30
+    for user_id in (100, 101, 102):
+        user_updates = [update_id for user, update_id in updates if user == user_id]
+        assert user_updates == sorted(user_updates)
@@ -0,0 +1,29 @@
+import pytest
+
+import multiworker
+from multiworker import _Worker, worker_progress_backend
+
+def test_restart_delay_grows_and_gives_up(monkeypatch):
+    monkeypatch.setattr(multiworker, "WORKER_RESTART_DELAY", 1.0)
+    monkeypatch.setattr(multiworker, "WORKER_RESTART_MAX_DELAY", 5.0)
+    monkeypatch.setattr(multiworker, "WORKER_MAX_RESTARTS", 4)
+    monkeypatch.setattr(multiworker, "WORKER_STABLE_SECONDS", 300.0)
+    worker = _Worker(0, 18000, 1)
+
+    # Падения сразу после запуска: пауза удваивается до предела, затем отказ
+    delays = []
+    for _ in range(5):
+        worker.started_at = 1000.0
+        delays.append(worker.crashed(1001.0))
+    assert delays == [1.0, 2.0, 4.0, 5.0, None]
+
+    # После долгой работы падение снова считается первым
+    worker.started_at = 1000.0
+    assert worker.crashed(1400.0) == 1.0 and worker.crashes == 1
+
+def test_workers_never_load_the_whole_database():
+    assert worker_progress_backend("sqlite") == "sqlite-cached"
+    assert worker_progress_backend("sqlite-cached") == "sqlite-cached"
+    assert worker_progress_backend("eventlog") == "eventlog"
+    with pytest.raises(ValueError):
+        worker_progress_backend("memory")
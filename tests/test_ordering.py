@@ -0,0 +1,32 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from ordering import UserOrderingMiddleware, backpressure_middleware
+
+def _statuses(overloaded: bool):
+    async def scenario():
+        ordering = UserOrderingMiddleware(max_pending=1)
+        ordering.pending = 1 if overloaded else 0
+
+        async def ok(request):
+            return web.Response(text="ok")
+
+        app = web.Application(middlewares=[backpressure_middleware(ordering)])
+        app.router.add_post("/webhook", ok)
+        app.router.add_post("/webhook/{tenant}", ok)
+        app.router.add_get("/health", ok)
+        async with TestClient(TestServer(app)) as client:
+            return {
+                path: (await client.request(method, path)).status
+                for method, path in (("POST", "/webhook"), ("POST", "/webhook/second"), ("GET", "/health"))
+            }
+
+    return asyncio.run(scenario())
+
+def test_overload_rejects_default_and_tenant_webhooks():
+    assert _statuses(overloaded=True) == {"/webhook": 503, "/webhook/second": 503, "/health": 200}
+
+def test_no_overload_passes_everything():
+    assert _statuses(overloaded=False) == {"/webhook": 200, "/webhook/second": 200, "/health": 200}
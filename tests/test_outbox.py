@@ -0,0 +1,66 @@
+import asyncio
+
+from outbox import OutboundQueue, PRIORITY_CALLBACK
+
+def test_chat_requests_keep_submission_order():
+    async def scenario():
+        sent = []
+        queue = OutboundQueue()
+
+        async def request(name):
+            sent.append(name)
+            return name
+
+        futures = [queue.submit(1, request(name)) for name in ("a", "b", "c")]
+        assert await asyncio.gather(*futures) == ["a", "b", "c"]
+        await queue.close()
+        return sent
+
+    assert asyncio.run(scenario()) == ["a", "b", "c"]
+
+def test_callback_answers_go_first():
+    async def scenario():
+        sent = []
+        queue = OutboundQueue()
+
+        async def request(name):
+            sent.append(name)
+
+        # Все три ждут в куче: разбор очереди чата начнется на следующем шаге loop
+        queue.submit(1, request("message-1"))
+        queue.submit(1, request("message-2"))
+        queue.submit(1, request("callback"), priority=PRIORITY_CALLBACK)
+        await queue.close()
+        return sent
+
+    assert asyncio.run(scenario()) == ["callback", "message-1", "message-2"]
+
+def test_coalesced_edit_is_sent_after_later_messages():
+    async def scenario():
+        sent = []
+        queue = OutboundQueue()
+        gate = asyncio.Event()
+
+        async def blocker():
+            await gate.wait()
+            sent.append("blocker")
+
+        async def request(name):
+            sent.append(name)
+            return name
+
+        queue.submit(1, blocker())
+        first_edit = queue.submit(1, request("edit-v1"), key=(1, 10))
+        queue.submit(1, request("message"))
+        second_edit = queue.submit(1, request("edit-v2"), key=(1, 10))
+        assert queue.metrics()["depth"] == 3
+        gate.set()
+        await queue.close()
+        # Ожидающие старой версии получают результат новой
+        assert first_edit is second_edit
+        assert second_edit.result() == "edit-v2"
+        assert queue.metrics()["depth"] == 0
+        assert queue.coalesced == 1
+        return sent
+
+    assert asyncio.run(scenario()) == ["blocker", "message", "edit-v2"]
@@ -0,0 +1,181 @@
+import asyncio
+import threading
+
+from events import EventType, ProgressEvent
+from models import UserProgress, UserStatus, make_user_key
+from progress_reader import EventLogReader, MemoryProgressReader, ProgressReader, open_progress_reader
+from progress_store import EventLogProgressStore, SQLiteProgressStore
+
+def _progress(user_id, current, status, completed=(), submitted=(), checked=()):
+    progress = UserProgress(user_id, current_lesson=current, status=status)
+    for lesson_id in completed:
+        progress.completed_lessons.append(lesson_id)
+    for lesson_id in submitted:
+        progress.submitted_assignments[lesson_id] = "ответ"
+    for lesson_id in checked:
+        progress.checked_assignments[lesson_id] = True
+    return progress
+
+def _write(path, progresses):
+    async def run():
+        store = SQLiteProgressStore(path)
+        await store.start()
+        for progress in progresses:
+            store[progress.user_id] = progress
+        await store.close()
+
+    asyncio.run(run())
+
+def _query(path, fn):
+    async def run():
+        reader = ProgressReader(path)
+        await reader.start()
+        try:
+            return await reader.query(fn)
+        finally:
+            await reader.close()
+
+    return asyncio.run(run())
+
+def test_stats_follow_updates(tmp_path):
+    path = str(tmp_path / "progress.sqlite3")
+    _write(path, [
+        _progress(1, 2, UserStatus.IN_PROGRESS, completed=[1], submitted=[1], checked=[1]),
+        _progress(2, 1, UserStatus.IN_PROGRESS),
+        _progress(3, 1, UserStatus.COMPLETED, completed=[1, 2], submitted=[1, 2]),
+        # Другой арендатор в итоги основного бота не попадает
+        _progress(make_user_key(1, 1), 3, UserStatus.IN_PROGRESS, completed=[1, 2]),
+    ])
+    # Перезапись меняет счетчики, а не добавляет к ним
+    _write(path, [_progress(2, 2, UserStatus.IN_PROGRESS, completed=[1])])
+
+    stats = _query(path, lambda view: view.stats())
+    assert stats == {
+        'total_users': 3,
+        'active_users': 2,
+        'completed_users': 1,
+        'lesson_stats': {1: 3, 2: 1},
+        'submitted_assignments': 3,
+        'checked_assignments': 1,
+    }
+    funnel = _query(path, lambda view: view.funnel(3))
+    assert [(row['reached'], row['completed'], row['submitted'], row['checked']) for row in funnel] == [
+        (3, 3, 2, 1),
+        # Пользователь 3 на уроке 1, но урок 2 уже прошел
+        (3, 1, 1, 0),
+        (0, 0, 0, 0),
+    ]
+    assert _query(path, lambda view: view.stats(namespace=1))['lesson_stats'] == {1: 1, 2: 1}
+
+def test_page_filters_and_cursors(tmp_path):
+    path = str(tmp_path / "progress.sqlite3")
+    _write(path, [
+        _progress(user_id, 1 + user_id % 3, UserStatus.COMPLETED if user_id % 2 else UserStatus.IN_PROGRESS)
+        for user_id in range(1, 31)
+    ])
+    matching = [user_id for user_id in range(1, 31) if user_id % 2 and 1 + user_id % 3 == 2]
+
+    first = _query(path, lambda view: view.page(status=UserStatus.COMPLETED, lesson=2, limit=2))
+    assert first == (matching[:2], False, True)
+    second = _query(path, lambda view: view.page(status=UserStatus.COMPLETED, lesson=2, after=matching[1], limit=2))
+    assert second == (matching[2:4], True, True)
+    back = _query(path, lambda view: view.page(status=UserStatus.COMPLETED, lesson=2, before=matching[2], limit=2))
+    assert back == (matching[:2], False, True)
+
+def test_iter_user_ids_batches_from_different_threads(tmp_path):
+    path = str(tmp_path / "progress.sqlite3")
+    _write(path, [UserProgress(user_id) for user_id in range(1, 26)])
+    batches = ProgressReader(path).iter_user_ids(batch_size=10)
+    seen = []
+
+    def take():
+        seen.append(next(batches, None))
+
+    # Как рассылка: каждая пачка забирается в новом потоке
+    for _ in range(4):
+        thread = threading.Thread(target=take)
+        thread.start()
+        thread.join()
+    assert seen[:3] == [list(range(1, 11)), list(range(11, 21)), list(range(21, 26))]
+    assert seen[3] is None
+
+def test_iter_progress_resumes_after_cursor(tmp_path):
+    path = str(tmp_path / "progress.sqlite3")
+    _write(path, [UserProgress(user_id) for user_id in range(1, 26)])
+    batches = ProgressReader(path).iter_progress(after=20, batch_size=3)
+    assert [progress.user_id for batch in batches for progress in batch] == [21, 22, 23, 24, 25]
+
+def _views(reader):
+    return (
+        reader.query(lambda view: view.stats()),
+        reader.query(lambda view: view.stats(namespace=1)),
+        reader.query(lambda view: view.funnel(3)),
+        reader.query(lambda view: view.page(status=UserStatus.IN_PROGRESS, limit=2)),
+        reader.query(lambda view: view.page(lesson=1, before=3, limit=5)),
+    )
+
+def test_eventlog_reader_matches_database_and_follows_workers(tmp_path):
+    progresses = [
+        _progress(1, 2, UserStatus.IN_PROGRESS, completed=[1], submitted=[1], checked=[1]),
+        _progress(2, 1, UserStatus.IN_PROGRESS),
+        _progress(3, 1, UserStatus.COMPLETED, completed=[1, 2], submitted=[1, 2]),
+        _progress(4, 3, UserStatus.IN_PROGRESS, completed=[1, 2]),
+        _progress(make_user_key(1, 1), 3, UserStatus.IN_PROGRESS, completed=[1, 2]),
+    ]
+    path = str(tmp_path / "progress.sqlite3")
+    _write(path, progresses)
+    root = tmp_path / "eventlog"
+
+    async def scenario():
+        database = ProgressReader(path)
+        stores = [EventLogProgressStore(str(root / f"worker-{index}")) for index in (0, 1)]
+        for index, store in enumerate(stores):
+            await store.start()
+            for progress in progresses[index::2]:
+                store[progress.user_id] = progress
+            await store.snapshot()
+        reader = EventLogReader(str(root), refresh_interval=3600)
+        await database.start()
+        await reader.start()
+        try:
+            assert await asyncio.gather(*_views(reader)) == await asyncio.gather(*_views(database))
+            # Без numpy (колоночной копии) ответы те же, считаются обходом записей
+            columns, reader._columns = reader._columns, None
+            assert await asyncio.gather(*_views(reader)) == await asyncio.gather(*_views(database))
+            reader._columns = columns
+
+            # Новые события хвоста журнала
+            stores[1].record_event(ProgressEvent(EventType.LESSON_COMPLETED, 2, 1))
+            await stores[1].flush()
+            assert await asyncio.to_thread(reader.refresh) == 1
+            assert 1 in (await reader.get(2)).completed_lessons
+            assert (await reader.query(lambda view: view.stats()))['lesson_stats'][1] == 4
+
+            # Два снимка подряд: непрочитанные сегменты удалены, читатель берет снимок
+            for lesson_id in (2, 3):
+                stores[0].record_event(ProgressEvent(EventType.LESSON_VIEWED, 1, lesson_id))
+                stores[0]._data[1].current_lesson = lesson_id
+                await stores[0].snapshot()
+            stores[0].record_event(ProgressEvent(EventType.LESSON_COMPLETED, 1, 3))
+            await stores[0].flush()
+            await asyncio.to_thread(reader.refresh)
+            progress = await reader.get(1)
+            assert progress.current_lesson == 3 and 3 in progress.completed_lessons
+        finally:
+            await reader.close()
+            await database.close()
+            for store in stores:
+                await store.close()
+
+    asyncio.run(scenario())
+
+def test_memory_backend_gives_empty_admin_view(tmp_path):
+    reader = open_progress_reader("memory", str(tmp_path / "missing.sqlite3"), str(tmp_path))
+    assert type(reader) is MemoryProgressReader
+
+    async def scenario():
+        await reader.start()
+        return await reader.query(lambda view: (view.stats()['total_users'], view.page()))
+
+    assert asyncio.run(scenario()) == (0, ([], False, False))
+    assert list(reader.iter_user_ids()) == []
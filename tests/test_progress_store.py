@@ -0,0 +1,83 @@
+import asyncio
+
+from models import UserProgress
+from progress_store import CachedSQLiteProgressStore, SQLiteProgressStore
+
+def _filled_store(path, users):
+    store = SQLiteProgressStore(str(path))
+
+    async def fill():
+        await store.start()
+        for user_id in range(1, users + 1):
+            store[user_id] = UserProgress(user_id)
+        await store.close()
+
+    asyncio.run(fill())
+    return store
+
+def _run_cached(path, body, **kwargs):
+    async def run():
+        store = CachedSQLiteProgressStore(str(path), **kwargs)
+        await store.start()
+        try:
+            return await body(store)
+        finally:
+            await store.close()
+
+    return asyncio.run(run())
+
+def test_dirty_records_survive_eviction(tmp_path):
+    path = tmp_path / "progress.sqlite3"
+
+    async def write(store):
+        for user_id in range(1, 6):
+            store[user_id] = UserProgress(user_id, current_lesson=user_id + 1)
+        # В кэше две записи, остальные ждут записи на диск вне его
+        assert len(store._cache) == 2
+
+    _run_cached(path, write, cache_size=2)
+
+    async def read(store):
+        return [store[user_id].current_lesson for user_id in range(1, 6)]
+
+    assert _run_cached(path, read) == [2, 3, 4, 5, 6]
+
+def test_mutation_of_evicted_record_is_saved(tmp_path):
+    path = tmp_path / "progress.sqlite3"
+    _filled_store(path, 3)
+
+    async def mutate(store):
+        progress = store[1]
+        store.get(2)
+        store.get(3)
+        assert 1 not in store._cache
+        # Обработчик держит вытесненную запись и меняет ее
+        progress.current_lesson = 5
+        store.mark_dirty(1)
+        assert store[1] is progress
+
+    _run_cached(path, mutate, cache_size=1)
+
+    async def read(store):
+        return store[1].current_lesson
+
+    assert _run_cached(path, read) == 5
+
+def test_prefetch_reads_outside_event_loop(tmp_path):
+    path = tmp_path / "progress.sqlite3"
+    _filled_store(path, 3)
+
+    async def body(store):
+        await asyncio.gather(store.prefetch(2), store.prefetch(2), store.prefetch(99))
+        assert store.prefetch_reads == 2
+        assert store.get(2).user_id == 2 and store.get(99) is None
+        assert store.disk_reads == 0
+
+        # Запись, измененная во время чтения, не заменяется прочитанной версией
+        task = asyncio.create_task(store.prefetch(3))
+        await asyncio.sleep(0)
+        fresh = store[3] = UserProgress(3, current_lesson=7)
+        await task
+        assert store[3] is fresh
+
+    _run_cached(path, body)
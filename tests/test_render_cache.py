@@ -0,0 +1,43 @@
+from models import Lesson
+from render_cache import CourseAuthor, RenderCache
+
+LESSONS = [
+    Lesson(1, "Первый", "Описание", text_content="Текст", assignment_question="Вопрос?", assignment_hint="Подсказка"),
+    Lesson(2, "Второй", "Описание", text_content="Текст"),
+]
+
+def test_known_lesson_screens():
+    screens = RenderCache(LESSONS)
+    parts, keyboard = screens.lesson(1)
+    assert "Первый" in parts[0]
+    assert keyboard is not None
+    assert "Вопрос" in screens.submit_prompt(1)
+    assert screens.assignment(1, submitted=True, checked=True) is not None
+
+def test_unknown_lesson_returns_none():
+    # Старые кнопки и уроки, убранные из курса при обновлении файлов
+    screens = RenderCache(LESSONS)
+    for lesson_id in (0, -1, 3, 100):
+        assert screens.lesson(lesson_id) is None
+        assert screens.submit_prompt(lesson_id) is None
+        assert screens.assignment(lesson_id, submitted=False, checked=False) is None
+
+def test_assignment_without_question_returns_none():
+    screens = RenderCache(LESSONS)
+    assert screens.assignment(2, submitted=False, checked=False) is None
+
+def test_course_and_author_come_from_course_file():
+    author = CourseAuthor("Мария", "Марии", quote="Практикуйтесь {каждый} день", tip="Пишите коротко")
+    screens = RenderCache(LESSONS, course_name="Второй курс", completion_skill="Навык", author=author)
+    completion = screens.completion(submitted=1)[0]
+    assert 'завершили курс "Второй курс"!' in completion and "• Навык" in completion
+    assert '**Слова Марии:**\n> "Практикуйтесь {каждый} день"' in completion
+    assert "*Подсказка от Марии:*" in screens.assignment(1, submitted=False, checked=False)[0]
+    confirmation = screens.submission_confirmation(1)[0]
+    assert "Мария или куратор проверят" in confirmation and "Пишите коротко" in confirmation
+
+    # Без автора в файле курса экраны обходятся без имени
+    screens = RenderCache(LESSONS)
+    assert "Слова" not in screens.completion(submitted=1)[0]
+    assert "*Подсказка:*" in screens.assignment(1, submitted=False, checked=False)[0]
+    assert "Куратор проверит" in screens.submission_confirmation(1)[0]
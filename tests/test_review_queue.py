@@ -0,0 +1,92 @@
+import asyncio
+
+from review_queue import ReviewQueue
+
+def _run(path, body, backfill=None):
+    async def run():
+        queue = ReviewQueue(str(path))
+        await queue.start(backfill)
+        try:
+            return await body(queue)
+        finally:
+            await queue.close()
+
+    return asyncio.run(run())
+
+def test_claim_lease_and_complete(tmp_path):
+    path = tmp_path / "reviews.sqlite3"
+
+    async def body(queue):
+        await queue.enqueue(1, 1, submitted_at=20.0)
+        await queue.enqueue(2, 1, submitted_at=10.0)
+        await queue.enqueue(3, 2, submitted_at=30.0)
+
+        first = await queue.claim(100)
+        assert (first.user_id, first.lesson_id, first.claimed_by) == (2, 1, 100)
+        # Взятое задание другому куратору не выдается
+        second = await queue.claim(200)
+        assert (second.user_id, second.lesson_id) == (1, 1)
+        assert [(item.user_id, item.lesson_id) for item in await queue.peek()] == [(3, 2)]
+
+        # Завершить чужое задание нельзя
+        assert not await queue.complete(2, 1, 200)
+        assert await queue.complete(2, 1, 100)
+        assert not await queue.complete(2, 1, 100)
+
+        # Возврат в очередь и истекшая аренда снова делают задание доступным
+        await queue.release(1, 1, 200)
+        await queue.claim(300, lease_seconds=-1)
+        assert [(item.user_id, item.lesson_id) for item in await queue.peek()] == [(1, 1), (3, 2)]
+        assert await queue.pending_count() == 2
+        return queue._take_results(10, 0, 1)
+
+    assert _run(path, body) == [(2, 1)]
+
+def test_results_go_to_owning_worker(tmp_path):
+    path = tmp_path / "reviews.sqlite3"
+
+    async def body(queue):
+        for user_id in (1, 2, 3):
+            await queue.enqueue(user_id, 1)
+            await queue.claim(100)
+            assert await queue.complete(user_id, 1, 100)
+
+        applied = []
+
+        async def apply(user_id, lesson_id):
+            applied.append((user_id, lesson_id))
+
+        await queue.watch_results(apply, interval=0.01, worker_index=1, worker_count=2)
+        for _ in range(100):
+            if applied:
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        return applied, queue._take_results(10, 0, 2)
+
+    applied, rest = _run(path, body)
+    assert sorted(applied) == [(1, 1), (3, 1)]
+    assert rest == [(2, 1)]
+
+def test_backfill_runs_once(tmp_path):
+    path = tmp_path / "reviews.sqlite3"
+    calls = []
+
+    async def backfill():
+        calls.append(1)
+        return [(1, 1), (2, 3)]
+
+    async def pending(queue):
+        return await queue.pending_count()
+
+    assert _run(path, pending, backfill) == 2
+
+    async def drain(queue):
+        while (item := await queue.claim(100)) is not None:
+            await queue.complete(item.user_id, item.lesson_id, 100)
+        return await queue.pending_count()
+
+    assert _run(path, drain, backfill) == 0
+    # Пустая очередь после проверки всех заданий не запускает перенос снова
+    assert _run(path, pending, backfill) == 0
+    assert len(calls) == 1
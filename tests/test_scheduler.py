@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from scheduler import Scheduler, Timer, TimerStore
+
+def _scheduler(path):
+    return Scheduler(str(path), rate=1000, poll_interval=0.01)
+
+async def _wait(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+def _timers(path):
+    store = TimerStore(str(path))
+    store.open()
+    try:
+        return store._conn.execute("SELECT user_id, kind, lesson_id, attempt FROM timers ORDER BY user_id").fetchall()
+    finally:
+        store.close()
+
+def test_timers_survive_restart_and_fire_once(tmp_path):
+    path = tmp_path / "timers.sqlite3"
+
+    async def plan():
+        scheduler = _scheduler(path)
+        await scheduler.start()
+        now = time.time()
+        scheduler.schedule(1, "reminder", now + 3600)
+        scheduler.schedule(2, "reminder", now + 3600)
+        # Перенос до записи схлопывается в одно изменение
+        scheduler.schedule(2, "reminder", now - 1, lesson_id=3)
+        scheduler.schedule(3, "reminder", now - 1)
+        scheduler.cancel(3, "reminder")
+        await scheduler.close()
+
+    asyncio.run(plan())
+    assert _timers(path) == [(1, "reminder", 0, 0), (2, "reminder", 3, 0)]
+
+    fired = []
+
+    async def run():
+        scheduler = _scheduler(path)
+
+        async def reminder(timer):
+            fired.append((timer.user_id, timer.lesson_id))
+            # Следующий таймер цепочки пишется вместо сработавшего
+            return Timer(timer.user_id, timer.kind, time.time() + 3600, timer.lesson_id, timer.attempt + 1)
+
+        scheduler.handler("reminder", reminder)
+        await scheduler.start()
+        await _wait(lambda: fired)
+        await asyncio.sleep(0.05)
+        await scheduler.close()
+
+    asyncio.run(run())
+    asyncio.run(run())
+    assert fired == [(2, 3)]
+    assert _timers(path) == [(1, "reminder", 0, 0), (2, "reminder", 3, 1)]
+
+def test_leased_timer_fires_again_after_crash(tmp_path):
+    path = tmp_path / "timers.sqlite3"
+    store = TimerStore(str(path))
+    store.open()
+    store.apply([((1, "drip"), Timer(1, "drip", time.time() - 1, 2))])
+    # Процесс забрал таймер и упал, не завершив обработку
+    (leased,) = store.claim(time.time(), 10, lease=0.05)
+    assert store.claim(time.time(), 10, lease=0.05) == []
+    store.close()
+
+    fired = []
+
+    async def run():
+        scheduler = _scheduler(path)
+
+        async def drip(timer):
+            fired.append((timer.user_id, timer.lesson_id))
+            return None
+
+        scheduler.handler("drip", drip)
+        await scheduler.start()
+        await _wait(lambda: fired)
+        await scheduler.close()
+
+    asyncio.run(run())
+    assert fired == [(leased.user_id, leased.lesson_id)]
+    assert _timers(path) == []
+
+def test_backfill_runs_once(tmp_path):
+    path = tmp_path / "timers.sqlite3"
+    calls = []
+
+    async def backfill():
+        calls.append(1)
+        return [Timer(user_id, "reminder", time.time() + 3600) for user_id in (1, 2)]
+
+    async def run():
+        scheduler = _scheduler(path)
+        await scheduler.start(backfill=backfill)
+        await scheduler.close()
+
+    asyncio.run(run())
+    assert [row[0] for row in _timers(path)] == [1, 2]
+
+    store = TimerStore(str(path))
+    store.open()
+    store.apply([((1, "reminder"), None), ((2, "reminder"), None)])
+    assert store.backfilled() and store.is_empty()
+    store.close()
+
+    # Пустая база после перезапуска не запускает обход пользователей снова
+    asyncio.run(run())
+    assert calls == [1] and _timers(path) == []
@@ -0,0 +1,69 @@
+import asyncio
+
+from aiogram import Bot
+
+from metrics import MetricsRegistry
+from models import UserProgress, make_user_key
+from progress_store import CachedSQLiteProgressStore, MemoryProgressStore
+from tenants import Tenant, TenantRegistry, TenantUsage
+
+class _NoIterDict(dict):
+    def __iter__(self):
+        raise AssertionError("обход всех ключей хранилища")
+
+def _registry():
+    registry = TenantRegistry()
+    registry.add(Tenant("default", 0, Bot("1:default")))
+    registry.add(Tenant("second", 3, Bot("2:second")))
+    return registry
+
+def _fill(store):
+    for user_id in range(1, 11):
+        store[make_user_key(0, user_id)] = UserProgress(make_user_key(0, user_id))
+    for user_id in range(1, 4):
+        store[make_user_key(3, user_id)] = UserProgress(make_user_key(3, user_id))
+    # Повторная запись не меняет счетчик
+    store[make_user_key(3, 1)] = UserProgress(make_user_key(3, 1))
+
+def test_counts_and_memory_without_scanning_keys():
+    store = MemoryProgressStore()
+    _fill(store)
+    store.keys = None  # оценка не должна обходить ключи хранилища
+    store._data = _NoIterDict(store._data)
+    assert store.namespace_counts() == {0: 10, 3: 3}
+
+    usage = TenantUsage(_registry(), MetricsRegistry())
+    asyncio.run(usage.measure(store))
+    assert usage.users.values[("default",)] == 10
+    assert usage.users.values[("second",)] == 3
+    assert usage.memory.values[("second",)] > 0
+    assert [progress.user_id for progress in store.sample(0, 4)] == [make_user_key(0, i) for i in range(1, 5)]
+
+def test_cached_store_counts_and_samples_from_database(tmp_path):
+    path = str(tmp_path / "progress.sqlite3")
+
+    async def fill():
+        store = CachedSQLiteProgressStore(path)
+        await store.start()
+        _fill(store)
+        await store.close()
+
+    asyncio.run(fill())
+
+    async def check():
+        store = CachedSQLiteProgressStore(path, cache_size=2)
+        await store.start()
+        try:
+            assert store.namespace_counts() == {0: 10, 3: 3}
+            store[make_user_key(3, 4)] = UserProgress(make_user_key(3, 4))
+            assert store.namespace_counts()[3] == 4
+
+            disk_reads = store.disk_reads
+            sample = await asyncio.to_thread(store.sample, 3, 64)
+            assert [progress.user_id for progress in sample] == [make_user_key(3, i) for i in range(1, 4)]
+            # Выборка идет мимо кэша
+            assert len(store._cache) == 1 and store.disk_reads == disk_reads
+        finally:
+            await store.close()
+
+    asyncio.run(check())